@@ -25,6 +25,8 @@ if TESTING:
         }
     }
     EMAIL_BACKEND = 'django.core.mail.backends.locmem.EmailBackend'
+    # The responses would outlive the rolled back test data
+    DNSAAS_RESPONSE_CACHE = None
 else:
     DATABASES = {
         'default': {
@@ -3,9 +3,9 @@ import autocomplete_light.shortcuts as al
 from django.conf.urls import patterns, include, url
 from django.contrib import admin
 from django.conf import settings
-from rest_framework.routers import DefaultRouter
 from rest_framework.authtoken.views import obtain_auth_token
 
+from powerdns.api_routers import BulkRouter
 from powerdns.utils import VERSION
 from powerdns.views import (
     accept_domain_request,
@@ -31,7 +31,7 @@ admin.site.site_header = title_v
 admin.autodiscover()
 
 
-router = DefaultRouter()
+router = BulkRouter()
 router.register(r'domains', DomainViewSet)
 router.register(r'records', RecordViewSet)
 router.register(r'crypto-keys', CryptoKeyViewSet)
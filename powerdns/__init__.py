@@ -1 +1,3 @@
 default_app_config = 'powerdns.apps.Powerdns'
+
+from powerdns.batching import batch  # noqa
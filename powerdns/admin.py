@@ -1,7 +1,7 @@
 import autocomplete_light
 import rules
 from django.contrib.auth import get_user_model
-from django.contrib import admin
+from django.contrib import admin, messages
 from django.contrib.admin.widgets import AdminRadioSelect
 from django.contrib.contenttypes.models import ContentType
 from django.db import models
@@ -22,6 +22,7 @@ from powerdns.models.powerdns import (
     SuperMaster,
 )
 from powerdns.models.authorisations import Authorisation
+from powerdns.models.notifications import Notification
 from rules.contrib.admin import ObjectPermissionsModelAdmin
 from threadlocals.threadlocals import get_current_user
 
@@ -29,13 +30,20 @@ from threadlocals.threadlocals import get_current_user
 from powerdns.models.templates import (
     DomainTemplate,
     RecordTemplate,
+    TemplatePropagation,
 )
 from powerdns.models.requests import (
     DeleteRequest,
     DomainRequest,
     RecordRequest,
 )
-from powerdns.utils import Owned, DomainForRecordValidator, is_owner
+from powerdns.bulk import delete_records, update_records
+from powerdns.utils import (
+    Owned,
+    DomainForRecordValidator,
+    editable_by,
+    is_owner,
+)
 
 
 class NullBooleanRadioSelect(NullBooleanSelect, AdminRadioSelect):
@@ -127,6 +135,48 @@ class OwnedAdmin(ForeignKeyAutocompleteAdmin, ObjectPermissionsModelAdmin):
         return models.Q(owner=user)
 
 
+def run_bulk_action(modeladmin, request, queryset, operation):
+    """Run a set-based ``operation`` on the selected records if the user
+    can edit all of them"""
+    forbidden = queryset.exclude(editable_by(request.user, Record)).count()
+    if forbidden:
+        modeladmin.message_user(
+            request,
+            _('You can not edit %(count)d of the selected records.') % {
+                'count': forbidden,
+            },
+            messages.ERROR,
+        )
+        return
+    count = operation(queryset)
+    modeladmin.message_user(
+        request, _('%(count)d records changed.') % {'count': count},
+    )
+
+
+def enable_records(modeladmin, request, queryset):
+    run_bulk_action(
+        modeladmin, request, queryset,
+        lambda queryset: update_records(queryset, disabled=False),
+    )
+enable_records.short_description = _('Enable selected records')
+
+
+def disable_records(modeladmin, request, queryset):
+    run_bulk_action(
+        modeladmin, request, queryset,
+        lambda queryset: update_records(queryset, disabled=True),
+    )
+disable_records.short_description = _('Disable selected records')
+
+
+def delete_selected_records(modeladmin, request, queryset):
+    run_bulk_action(modeladmin, request, queryset, delete_records)
+delete_selected_records.short_description = _(
+    'Delete selected records (with their PTRs)'
+)
+
+
 class RecordAdmin(OwnedAdmin, CopyingAdmin):
     form = RecordAdminForm
     list_display = (
@@ -143,6 +193,7 @@ class RecordAdmin(OwnedAdmin, CopyingAdmin):
     )
     list_display_links = None
     list_filter = ('type', 'ttl', 'auth', 'domain', 'created', 'modified')
+    actions = [enable_records, disable_records, delete_selected_records]
     list_per_page = 250
     save_on_top = True
     search_fields = ('name', 'content',)
@@ -274,6 +325,12 @@ class RecordTemplateAdmin(ForeignKeyAutocompleteAdmin):
     list_display = RECORD_LIST_FIELDS
 
 
+class TemplatePropagationAdmin(admin.ModelAdmin):
+    list_display = ('record_template', 'progress', 'created', 'finished')
+    list_filter = ('finished',)
+    readonly_fields = ('record_template', 'position', 'total', 'done')
+
+
 class DomainRequestForm(autocomplete_light.ModelForm):
     class Meta:
         widgets = {
@@ -378,6 +435,16 @@ class RecordRequestAdmin(CopyingAdmin):
             form.base_fields['domain'].initial = self.from_object.domain
         return form
 
+
+class NotificationAdmin(admin.ModelAdmin):
+    list_display = (
+        'recipient', 'kind', 'object', 'created', 'attempts', 'sent',
+        'last_error',
+    )
+    list_filter = ('sent', 'attempts', 'kind')
+    search_fields = ('recipient', 'object')
+    readonly_fields = ('created',)
+
 admin.site.register(Domain, DomainAdmin)
 admin.site.register(Record, RecordAdmin)
 admin.site.register(SuperMaster, SuperMasterAdmin)
@@ -385,7 +452,9 @@ admin.site.register(DomainMetadata, DomainMetadataAdmin)
 admin.site.register(CryptoKey, CryptoKeyAdmin)
 admin.site.register(DomainTemplate, DomainTemplateAdmin)
 admin.site.register(RecordTemplate, RecordTemplateAdmin)
+admin.site.register(TemplatePropagation, TemplatePropagationAdmin)
 admin.site.register(Authorisation, AuthorisationAdmin)
 admin.site.register(DomainRequest, DomainRequestAdmin)
 admin.site.register(RecordRequest, RecordRequestAdmin)
 admin.site.register(DeleteRequest, DeleteRequestAdmin)
+admin.site.register(Notification, NotificationAdmin)
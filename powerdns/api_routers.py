@@ -0,0 +1,16 @@
+"""Routers of DNSaaS API URLs"""
+
+from rest_framework.routers import DefaultRouter
+
+
+class BulkRouter(DefaultRouter):
+    """Routes ``PATCH`` and ``DELETE`` of lists to the ``bulk_update`` and
+    ``bulk_destroy`` actions of the viewsets having them"""
+
+    routes = [
+        route._replace(mapping=dict(
+            route.mapping, patch='bulk_update', delete='bulk_destroy',
+        ))
+        if route.name == '{basename}-list' else route
+        for route in DefaultRouter.routes
+    ]
@@ -9,8 +9,12 @@ class Powerdns(AppConfig):
     def ready(self):
         import autocomplete_light.shortcuts as al
         from powerdns.models.powerdns import Domain, Record
+        from powerdns.response_cache import response_caches
         from django.contrib.auth.models import User
 
+        for response_cache in response_caches:
+            response_cache.connect()
+
         class AutocompleteAuthItems(al.AutocompleteGenericBase):
             choices = (
                 Domain.objects.all(),
@@ -0,0 +1,119 @@
+"""Deferred side effects of record writes.
+
+Saving or deleting a record triggers some work besides the write itself:
+generating the ordername, maintaining the PTR records and updating the SOA
+serial. Scripts writing thousands of records can do the writes in a batch::
+
+    import powerdns
+
+    with powerdns.batch():
+        for host in hosts:
+            Record.objects.create(...)
+
+Inside the batch the work is queued and on exit it is done with set-based
+operations (see ``powerdns.bulk``): a single reverse domain lookup and bulk
+inserts of PTRs, an ``UPDATE`` per batch of changed ordernames and one serial
+bump per zone. Until then the ordernames, PTRs and serials are not up to
+date.
+
+The batch doesn't start a transaction by itself. If the block raises an
+exception inside a transaction, the queued work is dropped together with the
+writes; outside of a transaction the work is done anyway for the writes that
+have been saved. Records whose writes have been rolled back inside the block
+(e.g. by an ``atomic`` block that raised) are skipped, also if the block
+exits normally.
+"""
+
+import threading
+from contextlib import contextmanager
+
+from django.db import connections, router, transaction
+
+
+_local = threading.local()
+
+
+class Batch(object):
+    """Side effects queued by record writes"""
+
+    def __init__(self):
+        self.ordernames = {}
+        self.ptrs = {}
+        self.domain_ids = set()
+
+    def defer_ordername(self, record):
+        self.ordernames[id(record)] = record
+
+    def defer_ptr(self, record):
+        self.ptrs[record.pk] = record
+
+    def defer_serial(self, domain_ids):
+        self.domain_ids.update(
+            domain_id for domain_id in domain_ids if domain_id
+        )
+
+    def discard(self, record):
+        """Forget about a deleted record"""
+        self.ptrs.pop(record.pk, None)
+        self.ordernames.pop(id(record), None)
+
+    def forget_rolled_back(self):
+        """Forget about the records that don't exist, as their writes have
+        been rolled back"""
+        from powerdns.models.powerdns import Record
+        from powerdns.utils import chunks
+        pks = list({record.pk for record in self.ptrs.values()} | {
+            record.pk for record in self.ordernames.values()
+        })
+        existing = set()
+        for pks_chunk in chunks(pks):
+            existing.update(
+                Record.objects.filter(
+                    pk__in=pks_chunk,
+                ).values_list('pk', flat=True)
+            )
+        self.ptrs = {
+            pk: record for pk, record in self.ptrs.items()
+            if pk in existing
+        }
+        self.ordernames = {
+            key: record for key, record in self.ordernames.items()
+            if record.pk in existing
+        }
+
+    def flush(self):
+        from powerdns.bulk import create_ptrs, update_ordernames
+        from powerdns.serials import bump_serials
+        with transaction.atomic():
+            self.forget_rolled_back()
+            ptrs = create_ptrs(list(self.ptrs.values()))
+            update_ordernames(list(self.ordernames.values()))
+            bump_serials(
+                self.domain_ids | {ptr.domain_id for ptr in ptrs}
+            )
+
+
+def current():
+    """The batch active in this thread or None"""
+    return getattr(_local, 'batch', None)
+
+
+@contextmanager
+def batch():
+    """Queue the side effects of record writes and do them on exit. Nested
+    batches are merged with the outermost one."""
+    if current() is not None:
+        yield current()
+        return
+    _local.batch = current_batch = Batch()
+    try:
+        yield current_batch
+    except Exception:
+        _local.batch = None
+        from powerdns.models.powerdns import Record
+        connection = connections[router.db_for_write(Record)]
+        if not connection.in_atomic_block:
+            current_batch.flush()
+        raise
+    _local.batch = None
+    current_batch.flush()
@@ -0,0 +1,304 @@
+"""Set-based operations on records.
+
+The functions here have the same effect as validating and saving records one
+by one, but issue a few queries per batch instead of a few per record.
+"""
+
+import time
+from collections import defaultdict
+
+from django.contrib.contenttypes.models import ContentType
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
+from django.db import transaction
+from django.db.models import Case, CharField, Value, When
+from django.utils import timezone
+
+from powerdns import dnssec, nsec3
+from powerdns.dnssec import dnssec_modes
+from powerdns.domain_index import reverse_domains
+from powerdns.models.powerdns import (
+    Domain,
+    Record,
+    get_default_reverse_domain,
+)
+from powerdns.models.authorisations import Authorisation
+from powerdns.models.requests import DeleteRequest, RecordRequest
+from powerdns.serials import bump_serials
+from powerdns.utils import (
+    BATCH_SIZE,
+    AutoPtrOptions,
+    chunks,
+    find_conflicts,
+    to_reverse,
+)
+
+
+# Nothing is derived from these fields (like ordernames, PTRs or IP
+# numbers), so they can be changed with an UPDATE of many records
+UPDATE_FIELDS = ('ttl', 'prio', 'auth', 'disabled', 'remarks')
+
+# These are resolved and validated by the caller (e.g. a serializer), so
+# ``clean_fields`` doesn't need to query for them again.
+RELATED_FIELDS = ['domain', 'owner', 'template', 'depends_on']
+
+
+def record_key(record):
+    """The key of the unique constraint on records"""
+    return (record.name, record.type, record.content)
+
+
+def validate_records(records):
+    """Validate records the way ``full_clean`` would, querying the database
+    for conflicts once for the whole batch. Returns a list of error
+    dictionaries (empty for valid records) matching the list of records."""
+    errors = [{} for _ in records]
+    for record, record_errors in zip(records, errors):
+        try:
+            record.clean_fields(exclude=RELATED_FIELDS)
+        except ValidationError as e:
+            record_errors.update(e.message_dict)
+            continue
+        try:
+            record.clean_content_field()
+        except ValidationError as e:
+            record_errors['content'] = e.messages
+            continue
+        record.force_case()
+
+    positions = [
+        i for i, record_errors in enumerate(errors) if not record_errors
+    ]
+    conflicts = find_conflicts(
+        [records[i] for i in positions],
+        check_unique=True,
+        positions=positions,
+    )
+    for i, messages in zip(positions, conflicts):
+        if messages:
+            errors[i][NON_FIELD_ERRORS] = messages
+    return errors
+
+
+def insert_records(records):
+    """Insert new records with bulk INSERTs and fill their primary keys"""
+    for record in records:
+        record.set_computed_fields()
+    Record.objects.bulk_create(records, batch_size=BATCH_SIZE)
+    # Most backends don't return the ids of bulk-inserted rows
+    missing = {
+        record_key(record): record for record in records if record.pk is None
+    }
+    names = {name for (name, _, _) in missing}
+    for names_chunk in chunks(sorted(names)):
+        for pk, name, type_, content in Record.objects.filter(
+            name__in=names_chunk,
+        ).values_list('pk', 'name', 'type', 'content'):
+            record = missing.get((name, type_, content))
+            if record is not None:
+                record.pk = pk
+    return records
+
+
+def create_ptrs(records, created=False):
+    """Create PTR records for saved records according to their auto_ptr
+    settings. A set-based equivalent of the ``create_ptr`` signal. Unless
+    ``created`` is set, the existing PTRs of the records are deleted first.
+    Returns the list of created PTR records."""
+    if not created:
+        for records_chunk in chunks(records):
+            Record.objects.filter(depends_on__in=[
+                record.pk for record in records_chunk
+            ]).delete()
+    candidates = [
+        record for record in records
+        if record.type == 'A' and record.auto_ptr != AutoPtrOptions.NEVER
+    ]
+    reverse_names = [to_reverse(record.content) for record in candidates]
+    # Confirmed with a single query, as they are written
+    domain_ids = reverse_domains.confirm({
+        domain_name: reverse_domains.get(domain_name)
+        for domain_name in {domain_name for (domain_name, _) in reverse_names}
+    })
+    ptrs = []
+    for record, (domain_name, number) in zip(candidates, reverse_names):
+        domain_id = domain_ids[domain_name]
+        if domain_id is None:
+            if record.auto_ptr != AutoPtrOptions.ALWAYS:
+                continue
+            domain_id = domain_ids[domain_name] = (
+                reverse_domains.get_or_create(
+                    domain_name,
+                    template=(
+                        record.domain.reverse_template or
+                        get_default_reverse_domain()
+                    ),
+                    type=record.domain.type,
+                )
+            )
+        ptrs.append(Record(
+            type='PTR',
+            domain_id=domain_id,
+            name='.'.join([number, domain_name]),
+            content=record.name,
+            depends_on=record,
+            owner_id=record.owner_id,
+        ))
+    return insert_records(ptrs)
+
+
+def _nsec3_ordernames(names, nsec3param):
+    if nsec3param is None:
+        return [None] * len(names)
+    try:
+        return nsec3.hash_names(names, nsec3param)
+    except ValueError:
+        # Some names are invalid
+        ordernames = []
+        for name in names:
+            try:
+                ordernames.append(nsec3.hash_name(name, nsec3param))
+            except ValueError:
+                ordernames.append(None)
+        return ordernames
+
+
+def update_ordernames(records):
+    """Generate the ordernames of saved records and update the changed ones
+    with a query per batch. A set-based equivalent of generating them in
+    ``save``."""
+    by_domain = defaultdict(dict)
+    for record in records:
+        if record.pk is not None:
+            by_domain[record.domain_id][record.pk] = record
+    modes = {domain_id: dnssec_modes.get(domain_id) for domain_id in by_domain}
+    nsec_domains = [
+        domain_id for (domain_id, mode) in modes.items()
+        if mode.mode == dnssec.NSEC
+    ]
+    zone_names = {}
+    for ids_chunk in chunks(nsec_domains):
+        zone_names.update(
+            Domain.objects.filter(pk__in=ids_chunk).values_list('pk', 'name')
+        )
+    changed = {}
+    for domain_id, domain_records in by_domain.items():
+        domain_records = list(domain_records.values())
+        mode = modes[domain_id]
+        if mode.mode == dnssec.UNSIGNED:
+            ordernames = [None] * len(domain_records)
+        elif mode.mode == dnssec.NSEC3_NARROW:
+            ordernames = [''] * len(domain_records)
+        elif mode.mode == dnssec.NSEC3:
+            ordernames = _nsec3_ordernames(
+                [record.name for record in domain_records], mode.nsec3param,
+            )
+        elif domain_id in zone_names:
+            ordernames = [
+                dnssec.nsec_ordername(record.name, zone_names[domain_id])
+                for record in domain_records
+            ]
+        else:
+            # The domain has been deleted in the meantime
+            continue
+        for record, ordername in zip(domain_records, ordernames):
+            if record.ordername != ordername:
+                record.ordername = ordername
+                changed[record.pk] = ordername
+    for pks_chunk in chunks(sorted(changed)):
+        Record.objects.filter(pk__in=pks_chunk).update(ordername=Case(
+            *[When(pk=pk, then=Value(changed[pk])) for pk in pks_chunk],
+            output_field=CharField()
+        ))
+
+
+def save_records(records, fields):
+    """Save ``fields`` of existing records with an ``UPDATE`` per batch.
+    Values that differ between the records are set with a ``CASE``."""
+    for records_chunk in chunks(records):
+        values = {}
+        for field_name in fields:
+            field = Record._meta.get_field(field_name)
+            column_values = [
+                getattr(record, field.attname) for record in records_chunk
+            ]
+            if all(value == column_values[0] for value in column_values):
+                values[field.attname] = column_values[0]
+            else:
+                values[field.attname] = Case(
+                    *[
+                        When(pk=record.pk, then=Value(
+                            value, output_field=field,
+                        ))
+                        for record, value in zip(records_chunk, column_values)
+                    ],
+                    output_field=field
+                )
+        Record.objects.filter(
+            pk__in=[record.pk for record in records_chunk]
+        ).update(**values)
+
+
+def create_records(records):
+    """Insert new, validated records together with their PTRs. The SOA of
+    every affected domain is updated once."""
+    with transaction.atomic():
+        insert_records(records)
+        ptrs = create_ptrs(records, created=True)
+        bump_serials({record.domain_id for record in records + ptrs})
+    return records
+
+
+def _domain_ids(queryset):
+    return set(
+        queryset.order_by().values_list('domain_id', flat=True).distinct()
+    )
+
+
+def update_records(queryset, **values):
+    """Set ``values`` (of ``UPDATE_FIELDS``) on all the records of
+    a queryset with a single ``UPDATE``. The SOA of every affected domain is
+    updated once. Returns the number of records updated."""
+    unknown = set(values) - set(UPDATE_FIELDS)
+    if unknown:
+        raise ValueError('Fields not updatable: {}'.format(
+            ', '.join(sorted(unknown))
+        ))
+    with transaction.atomic():
+        domain_ids = _domain_ids(queryset)
+        count = queryset.order_by().update(
+            change_date=int(time.time()),
+            modified=timezone.now(),
+            **values
+        )
+        bump_serials(domain_ids)
+    return count
+
+
+def delete_records(queryset):
+    """Delete all the records of a queryset together with their PTRs, change
+    and delete requests and authorisations, with a ``DELETE`` per batch and
+    without loading the records. The SOA of every affected domain is updated
+    once. Returns the number of records deleted (PTRs not included)."""
+    with transaction.atomic():
+        pks = list(queryset.order_by().values_list('pk', flat=True))
+        content_type = ContentType.objects.get_for_model(Record)
+        domain_ids = set()
+        for pks_chunk in chunks(pks):
+            ptrs = Record.objects.filter(depends_on__in=pks_chunk)
+            records = Record.objects.filter(pk__in=pks_chunk)
+            domain_ids |= _domain_ids(ptrs) | _domain_ids(records)
+            target_ids = list(ptrs.values_list('pk', flat=True)) + pks_chunk
+            RecordRequest.objects.filter(record__in=target_ids).delete()
+            # Generic relations, which aren't foreign keys in the database
+            for model in (Authorisation, DeleteRequest):
+                model.objects.filter(
+                    content_type=content_type, target_id__in=target_ids,
+                ).delete()
+            # Without the post_delete signals of the records, which bump
+            # the serials one by one (done once below) and take the records
+            # out of the current batch (the request doesn't use one). The
+            # PTRs go first, as they refer to the records.
+            for chunk in (ptrs, records):
+                chunk._raw_delete(chunk.db)
+        bump_serials(domain_ids)
+    return len(pks)
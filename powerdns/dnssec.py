@@ -0,0 +1,169 @@
+"""DNSSEC mode detection for domains.
+
+``Record.save`` needs to know in which DNSSEC mode the domain is in order to
+fill the ``ordername`` field. Finding it out takes several queries on
+``cryptokeys`` and ``domainmetadata``, while the answer almost never changes,
+so the modes are cached per domain. The cache has two layers: a small
+in-process one and, if a cache shared by the processes is configured, a
+shared one in the django cache framework. Both are invalidated by signals on
+``CryptoKey``, ``DomainMetadata`` and ``Domain``, and again when the change
+is committed, as other processes could have cached the old mode in the
+meantime. Until then the mode of a changed domain is read from the database
+by the transaction changing it and isn't cached. Modes read inside
+transactions aren't put into the shared cache, as they could be rolled back.
+Changes done outside of django (e.g. by ``pdnssec secure-zone``) are only
+noticed when the entries expire.
+"""
+
+import threading
+import time
+from collections import namedtuple
+
+from django.conf import settings
+from django.db import connections, router, transaction
+
+from powerdns.nsec3 import parse_nsec3param
+from powerdns.utils import shared_cache
+
+
+UNSIGNED = 'unsigned'
+NSEC = 'nsec'
+NSEC3 = 'nsec3'
+NSEC3_NARROW = 'nsec3-narrow'
+
+
+DNSSECMode = namedtuple('DNSSECMode', ['mode', 'nsec3param'])
+
+
+def nsec_ordername(name, zone_name):
+    """The ordername of a record in NSEC mode: the part of the record name
+    relative to the zone, in reverse order, with dots replaced by spaces"""
+    domain_words = zone_name.split('.')
+    host_words = name.split('.')
+    relative_word_count = len(host_words) - len(domain_words)
+    relative_words = host_words[0:relative_word_count]
+    return ' '.join(relative_words[::-1])
+
+
+def load_dnssec_mode(domain_id):
+    """Find out the DNSSEC mode of a domain querying the database"""
+    from powerdns.models.powerdns import CryptoKey, DomainMetadata
+    if not CryptoKey.objects.filter(domain_id=domain_id).exists():
+        return DNSSECMode(UNSIGNED, None)
+    metadata = dict(
+        DomainMetadata.objects.filter(
+            domain_id=domain_id,
+            kind__in=('NSEC3PARAM', 'NSEC3NARROW'),
+        ).values_list('kind', 'content')
+    )
+    if 'NSEC3PARAM' not in metadata:
+        return DNSSECMode(NSEC, None)
+    if 'NSEC3NARROW' in metadata:
+        return DNSSECMode(NSEC3_NARROW, None)
+    return DNSSECMode(NSEC3, parse_nsec3param(metadata['NSEC3PARAM']))
+
+
+class DNSSECModeCache(object):
+    """Per-domain cache of DNSSEC modes.
+
+    Entries of the in-process layer are trusted for
+    ``DNSAAS_DNSSEC_LOCAL_TTL`` seconds. After that they are re-read from the
+    django cache configured by ``DNSAAS_DNSSEC_CACHE`` (``None`` or a
+    per-process cache disables the shared layer), so changes made in other
+    processes are picked up without querying the database. Without the
+    shared layer they are re-read from the database."""
+
+    key_prefix = 'powerdns:dnssec-mode:'
+
+    def __init__(self):
+        self._local = {}
+        self._changed = threading.local()
+
+    @property
+    def shared(self):
+        return shared_cache('DNSAAS_DNSSEC_CACHE')
+
+    @property
+    def local_ttl(self):
+        return getattr(settings, 'DNSAAS_DNSSEC_LOCAL_TTL', 10)
+
+    def _connection(self):
+        from powerdns.models.powerdns import CryptoKey
+        return connections[router.db_for_write(CryptoKey)]
+
+    def _pending(self):
+        """Callbacks invalidating the modes of domains changed in the current
+        transaction of the thread on commit, by domain id"""
+        if not hasattr(self._changed, 'callbacks'):
+            self._changed.callbacks = {}
+        return self._changed.callbacks
+
+    def _uncommitted(self, domain_id):
+        """Whether the domain has been changed in the current transaction.
+        The callback is gone once it is committed or rolled back."""
+        callback = self._pending().get(domain_id)
+        if callback is None:
+            return False
+        if any(
+            func is callback
+            for _, func in self._connection().run_on_commit
+        ):
+            return True
+        del self._pending()[domain_id]
+        return False
+
+    def get(self, domain_id):
+        """Return the DNSSECMode for a domain with given id"""
+        if self._uncommitted(domain_id):
+            return load_dnssec_mode(domain_id)
+        now = time.time()
+        try:
+            mode, expires = self._local[domain_id]
+        except KeyError:
+            pass
+        else:
+            if expires > now:
+                return mode
+        shared = self.shared
+        mode = None
+        if shared is not None:
+            mode = shared.get(self.key_prefix + str(domain_id))
+        if mode is None:
+            mode = load_dnssec_mode(domain_id)
+            if (
+                shared is not None and
+                not self._connection().in_atomic_block
+            ):
+                shared.set(
+                    self.key_prefix + str(domain_id),
+                    mode,
+                    getattr(settings, 'DNSAAS_DNSSEC_CACHE_TIMEOUT', 60),
+                )
+        self._local[domain_id] = (DNSSECMode(*mode), now + self.local_ttl)
+        return self._local[domain_id][0]
+
+    def invalidate(self, domain_id):
+        """Forget the DNSSEC mode of a domain with given id, now and when the
+        current transaction is committed"""
+        if domain_id is None:
+            return
+        self.forget(domain_id)
+        connection = self._connection()
+        if not connection.in_atomic_block:
+            return
+
+        def committed():
+            self._pending().pop(domain_id, None)
+            self.forget(domain_id)
+        self._pending()[domain_id] = committed
+        transaction.on_commit(committed, using=connection.alias)
+
+    def forget(self, domain_id):
+        """Forget the DNSSEC mode of a domain with given id now"""
+        self._local.pop(domain_id, None)
+        shared = self.shared
+        if shared is not None:
+            shared.delete(self.key_prefix + str(domain_id))
+
+
+dnssec_modes = DNSSECModeCache()
@@ -0,0 +1,225 @@
+"""In-process indexes of domain names.
+
+Creating PTR records needs the id of the reverse domain of every A record and
+records created without a domain get the closest domain of their name.
+Domains rarely change, so instead of querying for them, each process keeps an
+index of their names. The index is loaded on first use and kept up to date
+by signals on ``Domain``. Every ``DNSAAS_DOMAIN_INDEX_LOCAL_TTL`` seconds a
+process checks if other processes have changed the domains: through a version
+key in the django cache configured by ``DNSAAS_DOMAIN_INDEX_CACHE`` if it is
+shared by the processes (e.g. memcached), otherwise with a query counting the
+domains. Changes made by other processes can go unnoticed until then, so ids
+are confirmed (``confirm``) before they are written.
+
+Domains created in a transaction that hasn't been committed yet are marked as
+tentative: inside transactions they are confirmed with a query, outside of
+them they are known to have been rolled back.
+"""
+
+import threading
+import time
+
+from django.conf import settings
+from django.db import (
+    IntegrityError,
+    connections,
+    router,
+    transaction,
+)
+
+from django.db.models import Count, Max
+
+from powerdns.utils import parent_names, shared_cache
+
+
+class DomainIndex(object):
+    """Index of ids of domains with names ending with ``suffix``"""
+
+    version_key_prefix = 'powerdns:domain-index-version:'
+
+    def __init__(self, suffix=''):
+        self.suffix = suffix
+        self.version_key = self.version_key_prefix + suffix
+        self._lock = threading.Lock()
+        self._names = None
+        self._pks = None
+        self._tentative = set()
+        self._version = None
+        self._checked = 0
+
+    @property
+    def shared(self):
+        return shared_cache('DNSAAS_DOMAIN_INDEX_CACHE')
+
+    @property
+    def local_ttl(self):
+        return getattr(settings, 'DNSAAS_DOMAIN_INDEX_LOCAL_TTL', 10)
+
+    def matches(self, name):
+        return bool(name) and name.endswith(self.suffix)
+
+    def domains(self):
+        from powerdns.models.powerdns import Domain
+        if not self.suffix:
+            return Domain.objects.all()
+        return Domain.objects.filter(name__endswith=self.suffix)
+
+    def load(self):
+        """Read the names from the database"""
+        return dict(self.domains().values_list('name', 'pk'))
+
+    def load_version(self):
+        """The version of the domains without a shared cache: their number
+        and the last time one has been saved (renamed)"""
+        state = self.domains().aggregate(
+            count=Count('pk'), modified=Max('modified'),
+        )
+        return (state['count'], state['modified'])
+
+    def _current(self):
+        """The index, reloaded if it has been changed by other process"""
+        now = time.time()
+        if self._names is not None and now < self._checked + self.local_ttl:
+            return self._names
+        with self._lock:
+            shared = self.shared
+            if shared is not None:
+                version = shared.get(self.version_key)
+            else:
+                version = self.load_version()
+            if self._names is None or version != self._version:
+                names = self.load()
+                self._pks = {pk: name for (name, pk) in names.items()}
+                self._names = names
+                self._version = version
+            self._checked = now
+            return self._names
+
+    def _in_transaction(self):
+        from powerdns.models.powerdns import Domain
+        return connections[router.db_for_write(Domain)].in_atomic_block
+
+    def get(self, name):
+        """Id of a domain with given name or None. Doesn't query the database
+        unless the index needs to be (re)loaded."""
+        from powerdns.models.powerdns import Domain
+        pk = self._current().get(name)
+        if pk is None or (name, pk) not in self._tentative:
+            return pk
+        if self._in_transaction() and Domain.objects.filter(
+            pk=pk, name=name,
+        ).exists():
+            return pk
+        # Created in a transaction that has been rolled back
+        self.remove(name, pk)
+        return None
+
+    def closest(self, name):
+        """Id of the domain with the longest name that is equal to ``name``
+        or is its suffix, or None. Looks up every label of the name in the
+        index, so it takes microseconds."""
+        for candidate in [name] + parent_names(name):
+            if not self.matches(candidate):
+                break
+            pk = self.get(candidate)
+            if pk is not None:
+                return pk
+        return None
+
+    def confirm(self, pks):
+        """Check ids found in the index (a dict by name) with a single
+        query, as other processes could have deleted or renamed the domains
+        since the index has been checked. Stale entries are replaced with
+        the domains having the names now, if any. Returns the dict
+        fixed."""
+        from powerdns.models.powerdns import Domain
+        names = [name for (name, pk) in pks.items() if pk is not None]
+        if not names:
+            return pks
+        found = dict(
+            Domain.objects.filter(name__in=names).values_list('name', 'pk')
+        )
+        for name in names:
+            pk = found.get(name)
+            if pk == pks[name]:
+                continue
+            self._discard(pks[name])
+            self._tentative.discard((name, pks[name]))
+            if pk is not None and self._names is not None:
+                self._discard(pk)
+                self._names[name] = pk
+                self._pks[pk] = name
+            pks[name] = pk
+        return pks
+
+    def get_or_create(self, name, **defaults):
+        """Id of a domain with given name. The domain is created if it
+        doesn't exist, also if it is created concurrently."""
+        from powerdns.models.powerdns import Domain
+        pk = self.get(name)
+        if pk is not None:
+            return pk
+        try:
+            with transaction.atomic():
+                return Domain.objects.create(name=name, **defaults).pk
+        except IntegrityError:
+            return Domain.objects.get(name=name).pk
+
+    def _discard(self, pk):
+        if self._names is not None and pk in self._pks:
+            del self._names[self._pks.pop(pk)]
+
+    def add(self, name, pk, old_name=None):
+        """Note that a domain has been saved"""
+        if not (self.matches(name) or self.matches(old_name)):
+            return
+        if self._names is not None:
+            # The domain could have been renamed or its pk reused
+            self._discard(pk)
+            if self.matches(name):
+                self._names[name] = pk
+                self._pks[pk] = name
+        if self.matches(name) and self._in_transaction():
+            # Also if the index isn't loaded yet, as loading it in this
+            # transaction would read the domain
+            self._tentative.add((name, pk))
+        transaction.on_commit(lambda: self.changed(name, pk))
+
+    def remove(self, name, pk):
+        """Note that a domain has been deleted"""
+        if not self.matches(name):
+            return
+        self._discard(pk)
+        self._tentative.discard((name, pk))
+        transaction.on_commit(lambda: self.changed(name, pk))
+
+    def changed(self, name, pk):
+        """Make other processes reload their indexes after a committed
+        change. This index has been changed in place already, so it is
+        reloaded only if other processes have changed the domains too."""
+        self._tentative.discard((name, pk))
+        shared = self.shared
+        if shared is None:
+            # The next check of the domains finds the change, so this index
+            # is reloaded too
+            return
+        # A counter, so that a single change since this index was loaded
+        # can be told apart
+        shared.add(self.version_key, 0, None)
+        try:
+            version = shared.incr(self.version_key)
+        except ValueError:
+            # Evicted in the meantime
+            version = None
+        if version is not None and version == (self._version or 0) + 1:
+            self._version = version
+        else:
+            self.clear()
+
+    def clear(self):
+        """Forget the index, so it is reloaded on next use"""
+        self._names = None
+
+
+reverse_domains = DomainIndex(suffix='in-addr.arpa')
+all_domains = DomainIndex()
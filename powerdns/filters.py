@@ -0,0 +1,103 @@
+"""Filters for the DNSaaS API"""
+
+import django_filters
+from django import forms
+from django.db.models import Q
+from django.utils.translation import ugettext_lazy as _
+from IPy import IP
+from rest_framework.filters import BaseFilterBackend
+
+from powerdns.models import Record
+from powerdns.utils import editable_by
+
+
+def is_true(value):
+    """Interpret a query parameter as a boolean"""
+    return value is not None and value.lower() in ('1', 'true', 'yes', 'on')
+
+
+class IPField(forms.CharField):
+    """An IP address or network (in CIDR notation)"""
+
+    def clean(self, value):
+        value = super().clean(value)
+        if not value:
+            return None
+        try:
+            return IP(value)
+        except ValueError:
+            raise forms.ValidationError(
+                _('Enter a valid IP address or network.'), code='invalid',
+            )
+
+
+class IPFilter(django_filters.Filter):
+    """Filter A and AAAA records by their addresses. The lookup is done on
+    the indexed ``number`` (or ``number6``) column, so it is a range scan.
+    ``lookup_type`` is ``range`` (for networks), ``gte`` or ``lte``."""
+
+    field_class = IPField
+
+    def filter(self, qs, value):
+        if value is None:
+            return qs
+        if value.version() == 4:
+            type_, field, to_number = 'A', 'number', int
+        else:
+            type_, field, to_number = 'AAAA', 'number6', '{:032x}'.format
+        if self.lookup_type == 'range':
+            number = (
+                to_number(value.net().int()),
+                to_number(value.broadcast().int()),
+            )
+        elif self.lookup_type == 'gte':
+            number = to_number(value.net().int())
+        else:
+            number = to_number(value.broadcast().int())
+        return qs.filter(**{
+            'type': type_,
+            '{}__{}'.format(field, self.lookup_type): number,
+        })
+
+
+class RecordFilter(django_filters.FilterSet):
+
+    cidr = IPFilter(lookup_type='range')
+    ip_from = IPFilter(lookup_type='gte')
+    ip_to = IPFilter(lookup_type='lte')
+
+    class Meta:
+        model = Record
+        fields = ['name', 'type', 'content', 'domain']
+
+
+class CanEditFilterBackend(BaseFilterBackend):
+    """With ``?can_edit=true`` only the objects the user can edit are
+    listed. This is checked in the query, so counts and pagination are
+    correct and no object is checked separately."""
+
+    def get_predicate(self, request, queryset):
+        if is_true(request.query_params.get('can_edit')):
+            return editable_by(request.user, queryset.model)
+        return None
+
+    def filter_queryset(self, request, queryset, view):
+        predicate = self.get_predicate(request, queryset)
+        if predicate is None:
+            return queryset
+        return queryset.filter(predicate)
+
+
+class DomainCanEditFilterBackend(CanEditFilterBackend):
+    """Also supports ``?can_add_records=true`` for the domains the user can
+    add records to: the editable and the unrestricted ones."""
+
+    def get_predicate(self, request, queryset):
+        predicate = super().get_predicate(request, queryset)
+        if is_true(request.query_params.get('can_add_records')):
+            usable = (
+                editable_by(request.user, queryset.model) |
+                Q(unrestricted=True)
+            )
+            predicate = usable if predicate is None else predicate & usable
+        return predicate
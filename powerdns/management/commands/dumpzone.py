@@ -0,0 +1,22 @@
+"""Export a domain as an RFC 1035 zone file"""
+
+from django.core.management.base import BaseCommand, CommandError
+
+from powerdns.models.powerdns import Domain
+from powerdns.zonefile import render_zone
+
+
+class Command(BaseCommand):
+
+    help = 'Output the records of a domain as a zone file.'
+
+    def add_arguments(self, parser):
+        parser.add_argument('domain', help='The name of the domain')
+
+    def handle(self, *args, **options):
+        try:
+            domain = Domain.objects.get(name=options['domain'])
+        except Domain.DoesNotExist:
+            raise CommandError('No such domain: {}'.format(options['domain']))
+        for line in render_zone(domain):
+            self.stdout.write(line, ending='')
@@ -0,0 +1,81 @@
+"""Import records from an RFC 1035 zone file"""
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from powerdns.models.powerdns import Domain
+from powerdns.utils import AutoPtrOptions
+from powerdns.zonefile import import_zone
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Import records from a zone file into a domain, creating it if '
+        'necessary.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('zonefile', help='Path to the zone file')
+        parser.add_argument(
+            '--origin',
+            help='The name of the domain (initial $ORIGIN)',
+        )
+        parser.add_argument(
+            '--owner', help='Username of the owner of created objects',
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            default=False,
+            help="Only show the differences, don't save anything",
+        )
+        parser.add_argument(
+            '--auto-ptr',
+            action='store_true',
+            default=False,
+            help='Create PTR records for imported A records',
+        )
+
+    def handle(self, *args, **options):
+        if not options['origin']:
+            raise CommandError('--origin is required')
+        owner = None
+        if options['owner']:
+            owner = get_user_model().objects.get_by_natural_key(
+                options['owner']
+            )
+        origin = options['origin'].rstrip('.').lower()
+        try:
+            domain = Domain.objects.get(name=origin)
+        except Domain.DoesNotExist:
+            domain = Domain(name=origin)
+            self.stdout.write('+ domain {}'.format(origin))
+
+        def report(change, record):
+            self.stdout.write('{} {}'.format(change, record))
+
+        with open(options['zonefile'], encoding='utf-8') as f:
+            result = import_zone(
+                f,
+                domain,
+                owner=owner,
+                dry_run=options['dry_run'],
+                auto_ptr=(
+                    AutoPtrOptions.ALWAYS if options['auto_ptr']
+                    else AutoPtrOptions.NEVER
+                ),
+                report=report if options['dry_run'] else None,
+            )
+        if result.errors:
+            for lineno, message in result.errors:
+                self.stderr.write('Line {}: {}'.format(lineno, message))
+            raise CommandError('Zone not imported')
+        self.stdout.write(
+            '{} added, {} changed, {} unchanged, {} only in database'.format(
+                result.added,
+                result.changed,
+                result.unchanged,
+                result.only_in_database,
+            )
+        )
@@ -0,0 +1,50 @@
+"""Send the e-mail notifications queued in the outbox"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from powerdns.notifications import deliver_notifications
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Send the queued e-mail notifications in batches, retrying the '
+        'failed ones later. Runs until interrupted, unless --once is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Notifications sent over a single connection',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=10,
+            help='Seconds to wait when there is nothing to send',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            default=False,
+            help='Exit when there is nothing to send (e.g. to run from cron)',
+        )
+
+    def handle(self, *args, **options):
+        batch_size = options['batch_size']
+        while True:
+            sent, failed = deliver_notifications(batch_size)
+            if sent or failed:
+                self.stdout.write(
+                    '{} notifications sent, {} failed'.format(sent, failed)
+                )
+            if sent + failed == batch_size:
+                # There may be more
+                continue
+            if options['once']:
+                return
+            time.sleep(options['interval'])
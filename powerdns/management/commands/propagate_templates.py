@@ -0,0 +1,58 @@
+"""Apply saved record templates to the domains using them"""
+
+import time
+
+from django.core.management.base import BaseCommand
+
+from powerdns.propagation import pending_propagations, run_propagation
+from powerdns.utils import BATCH_SIZE
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Propagate the changes of record templates to the records of all '
+        'the domains using them, continuing interrupted propagations. Runs '
+        'until interrupted, unless --once is given.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--chunk-size',
+            type=int,
+            default=BATCH_SIZE,
+            help='Domains updated in a single transaction',
+        )
+        parser.add_argument(
+            '--interval',
+            type=float,
+            default=10,
+            help='Seconds to wait when there is nothing to do',
+        )
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            default=False,
+            help='Exit when there is nothing to do (e.g. to run from cron)',
+        )
+
+    def report(self, propagation):
+        self.stdout.write('{}: {} domains{}'.format(
+            propagation.record_template,
+            propagation.progress(),
+            ', finished' if propagation.finished else '',
+        ))
+
+    def handle(self, *args, **options):
+        while True:
+            propagation = pending_propagations().first()
+            if propagation is not None:
+                run_propagation(
+                    propagation,
+                    chunk_size=options['chunk_size'],
+                    report=self.report,
+                )
+                continue
+            if options['once']:
+                return
+            time.sleep(options['interval'])
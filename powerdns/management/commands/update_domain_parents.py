@@ -0,0 +1,42 @@
+"""Fill the parent links of domains"""
+
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Case, IntegerField, Value, When
+
+from powerdns.models.powerdns import Domain
+from powerdns.utils import chunks, parent_names
+
+
+class Command(BaseCommand):
+
+    help = (
+        'Set the parent of every domain to the closest domain it is '
+        'a subdomain of. Needed once for domains created before parents '
+        'were maintained, or by other software than django.'
+    )
+
+    def handle(self, *args, **options):
+        domains = list(Domain.objects.values_list('pk', 'name', 'parent_id'))
+        pks = {name: pk for (pk, name, _) in domains}
+        changed = {}
+        for pk, name, parent_id in domains:
+            parent = next(
+                (
+                    pks[candidate] for candidate in parent_names(name)
+                    if candidate in pks
+                ),
+                None,
+            )
+            if parent != parent_id:
+                changed[pk] = parent
+        with transaction.atomic():
+            for pks_chunk in chunks(sorted(changed)):
+                Domain.objects.filter(pk__in=pks_chunk).update(parent=Case(
+                    *[
+                        When(pk=pk, then=Value(changed[pk]))
+                        for pk in pks_chunk
+                    ],
+                    output_field=IntegerField()
+                ))
+        self.stdout.write('{} domains updated'.format(len(changed)))
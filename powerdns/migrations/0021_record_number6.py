@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+from powerdns.utils import ipv6_number
+
+
+def fill_number6(apps, schema_editor):
+    Record = apps.get_model('powerdns', 'Record')
+    records = Record.objects.using(schema_editor.connection.alias).filter(
+        type='AAAA',
+    )
+    for pk, content in records.values_list('pk', 'content').iterator():
+        records.filter(pk=pk).update(number6=ipv6_number(content))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('powerdns', '0020_remove_recordrequest_target_ordername'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='record',
+            name='number6',
+            field=models.CharField(blank=True, db_index=True, default=None, editable=False, max_length=32, null=True, verbose_name='IPv6 number'),
+        ),
+        migrations.RunPython(fill_number6, migrations.RunPython.noop),
+    ]
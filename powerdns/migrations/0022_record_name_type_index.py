@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('powerdns', '0021_record_number6'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='record',
+            index_together=set([('name', 'type')]),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('powerdns', '0022_record_name_type_index'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='domain',
+            name='parent',
+            field=models.ForeignKey(blank=True, editable=False, help_text='The closest domain this domain is a subdomain of. Set automatically.', null=True, on_delete=django.db.models.deletion.SET_NULL, related_name='children', to='powerdns.Domain', verbose_name='Parent domain'),
+        ),
+    ]
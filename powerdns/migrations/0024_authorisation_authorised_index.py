@@ -0,0 +1,18 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('powerdns', '0023_domain_parent'),
+    ]
+
+    operations = [
+        migrations.AlterIndexTogether(
+            name='authorisation',
+            index_together=set([('authorised', 'content_type', 'target_id')]),
+        ),
+    ]
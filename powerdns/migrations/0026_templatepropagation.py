@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('powerdns', '0025_notification'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='TemplatePropagation',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('position', models.PositiveIntegerField(default=0, verbose_name='position')),
+                ('total', models.PositiveIntegerField(default=0, verbose_name='domains')),
+                ('done', models.PositiveIntegerField(default=0, verbose_name='domains done')),
+                ('created', models.DateTimeField(auto_now_add=True, verbose_name='created')),
+                ('finished', models.DateTimeField(blank=True, null=True, verbose_name='finished')),
+                ('record_template', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='propagations', to='powerdns.RecordTemplate', verbose_name='Record template')),
+            ],
+            options={
+                'verbose_name': 'template propagation',
+                'verbose_name_plural': 'template propagations',
+            },
+        ),
+    ]
@@ -2,3 +2,4 @@ from powerdns.models.powerdns import *  # noqa
 from powerdns.models.templates import *  # noqa
 from powerdns.models.authorisations import *  # noqa
 from powerdns.models.requests import *  # noqa
+from powerdns.models.notifications import *  # noqa
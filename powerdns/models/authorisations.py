@@ -3,8 +3,10 @@ from django.conf import settings
 from django.db import models
 from django.contrib.contenttypes.fields import ContentType
 from django.contrib.contenttypes.fields import GenericForeignKey
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
 
-from powerdns.utils import is_owner
+from powerdns.utils import forget_authorisations, is_owner
 
 
 class Authorisation(models.Model):
@@ -26,6 +28,10 @@ class Authorisation(models.Model):
     target_id = models.PositiveIntegerField()
     target = GenericForeignKey('content_type', 'target_id')
 
+    class Meta:
+        # Covers the lookups of the objects a user is authorised to
+        index_together = [('authorised', 'content_type', 'target_id')]
+
     def __str__(self):
         return '{} authorised {} to {}'.format(
             self.owner,
@@ -41,3 +47,11 @@ rules.add_perm(
 rules.add_perm(
     'powerdns.delete_authorisation', (rules.is_superuser | is_owner)
 )
+
+
+@receiver(post_save, sender=Authorisation, dispatch_uid='authorisation_saved')
+@receiver(
+    post_delete, sender=Authorisation, dispatch_uid='authorisation_deleted'
+)
+def authorisations_changed(sender, instance, **kwargs):
+    forget_authorisations()
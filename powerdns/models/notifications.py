@@ -0,0 +1,50 @@
+from django.conf import settings
+from django.db import models
+from django.utils import timezone
+from django.utils.translation import ugettext_lazy as _
+
+
+class Notification(models.Model):
+    """A notification of the owner of an object created by somebody else,
+    to be sent by the ``process_notifications`` worker. It is saved in the
+    transaction of the change it is about, so it is sent only if the change
+    is committed, and the request doesn't wait for the mail server.
+
+    Notifications of an owner about the objects created by the same user in
+    a time window are due at the end of the window and sent together as
+    a digest."""
+
+    owner = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name=_('owner'),
+        null=True,
+        related_name='+',
+    )
+    creator = models.ForeignKey(
+        settings.AUTH_USER_MODEL,
+        verbose_name=_('creator'),
+        null=True,
+        blank=True,
+        on_delete=models.SET_NULL,
+        related_name='+',
+    )
+    recipient = models.EmailField(_('recipient'), max_length=254)
+    # The model name, for the template in settings.OWNER_NOTIFICATIONS
+    kind = models.CharField(_('kind'), max_length=50, default='')
+    object = models.TextField(_('object'), default='')
+    created = models.DateTimeField(_('created'), auto_now_add=True)
+    attempts = models.PositiveIntegerField(_('attempts'), default=0)
+    next_attempt = models.DateTimeField(
+        _('next attempt'), default=timezone.now,
+    )
+    sent = models.DateTimeField(_('sent'), null=True, blank=True)
+    last_error = models.TextField(_('last error'), blank=True)
+
+    class Meta:
+        # Covers the lookup of the notifications due
+        index_together = [('sent', 'next_attempt')]
+        verbose_name = _('notification')
+        verbose_name_plural = _('notifications')
+
+    def __str__(self):
+        return '{} {} for {}'.format(self.kind, self.object, self.recipient)
@@ -1,6 +1,3 @@
-import base64
-import hashlib
-import sys
 import time
 
 import rules
@@ -9,6 +6,7 @@ from django.conf import settings
 from django.contrib.contenttypes.models import ContentType
 from django.core.exceptions import ValidationError
 from django.db import models, transaction
+from django.db.models import Q
 from django.db.models.signals import post_delete, post_save
 from django.dispatch import receiver
 from django.utils.translation import ugettext_lazy as _
@@ -17,14 +15,19 @@ from django.core.urlresolvers import reverse
 from IPy import IP
 from threadlocals.threadlocals import get_current_user
 
+from powerdns import batching, dnssec, nsec3, serials
+from powerdns.dnssec import dnssec_modes
+from powerdns.domain_index import all_domains, reverse_domains
 from powerdns.utils import (
     AutoPtrOptions,
     is_authorised,
     is_owner,
+    parent_names,
     no_object,
     Owned,
     RecordLike,
     TimeTrackable,
+    ipv6_number,
     to_reverse,
     validate_domain_name,
 )
@@ -70,22 +73,20 @@ try:
 except AttributeError:
     pass
 
-# http://tools.ietf.org/html/rfc4648#section-7
-if sys.version_info[0] == 2:
-    import string
-    maketrans_func = string.maketrans
-else:
-    maketrans_func = str.maketrans
-b32_trans = maketrans_func(
-    'ABCDEFGHIJKLMNOPQRSTUVWXYZ234567',
-    '0123456789ABCDEFGHIJKLMNOPQRSTUV'
-)
-
 # Validator for the domain names only in RFC-1035
 # PowerDNS considers the whole zone to be invalid if any of the records end
 # with a period so this custom validator is used to catch them
 
 
+def closest_domain(names):
+    """The existing domain with the longest of given names or None"""
+    return max(
+        Domain.objects.filter(name__in=names),
+        key=lambda domain: len(domain.name),
+        default=None,
+    )
+
+
 # This is a class for historical reasons in order not to break migrations
 @deconstructible
 class SubDomainValidator():
@@ -95,24 +96,20 @@ class SubDomainValidator():
         user = get_current_user()
         if rules.is_superuser(user):
             return domain_name
-        domain_bits = domain_name.split('.')
-        for i in range(-len(domain_bits), 0):
-            super_domain = '.'.join(domain_bits[i:])
-            try:
-                super_domain = Domain.objects.get(name=super_domain)
-            except Domain.DoesNotExist:
-                continue
-            if can_edit(user, super_domain):
-                # ALLOW - this user owns a superdomain
-                return domain_name
-            else:
-                # DENY - this user doesn't own a superdomain
-                raise ValidationError(
-                    "You don't have a permission to create a subdomain in {}".
-                    format(super_domain)
-                )
-        # Fallthrough - ALLOW - we don't manage any superdomain
-        return domain_name
+        super_domain = closest_domain(
+            [domain_name] + parent_names(domain_name)
+        )
+        if super_domain is None:
+            # ALLOW - we don't manage any superdomain
+            return domain_name
+        if can_edit(user, super_domain):
+            # ALLOW - this user owns a superdomain
+            return domain_name
+        # DENY - this user doesn't own a superdomain
+        raise ValidationError(
+            "You don't have a permission to create a subdomain in {}".
+            format(super_domain)
+        )
 
     def __eq__(self, other):
         return type(self) == type(other)
@@ -234,6 +231,19 @@ class Domain(TimeTrackable, Owned, WithRequests):
             "to it without owner's permission?"
         )
     )
+    parent = models.ForeignKey(
+        'self',
+        verbose_name=_('Parent domain'),
+        blank=True,
+        null=True,
+        editable=False,
+        related_name='children',
+        on_delete=models.SET_NULL,
+        help_text=_(
+            'The closest domain this domain is a subdomain of. Set '
+            'automatically.'
+        )
+    )
 
     class Meta:
         db_table = u'domains'
@@ -250,7 +260,29 @@ class Domain(TimeTrackable, Owned, WithRequests):
         # This save can trigger creating some templated records.
         # So we do it atomically
         with transaction.atomic():
+            moved = (
+                self.pk is None or
+                self._initial_values.get('name') != self.name
+            )
+            if moved:
+                if self.pk is not None:
+                    # The subdomains of the old name are passed to its parent
+                    Domain.objects.filter(parent=self).update(
+                        parent=self.parent_id,
+                    )
+                self.parent = closest_domain(parent_names(self.name))
             super(Domain, self).save(*args, **kwargs)
+            if moved:
+                self.adopt_subdomains()
+                self._initial_values['name'] = self.name
+
+    def adopt_subdomains(self):
+        """Become the parent of the subdomains that have no closer parent"""
+        Domain.objects.filter(
+            name__endswith='.' + self.name,
+        ).filter(
+            Q(parent=None) | Q(parent__name__in=parent_names(self.name))
+        ).update(parent=self)
 
     def get_soa(self):
         """Returns the SOA record for this domain"""
@@ -324,6 +356,12 @@ class Record(TimeTrackable, Owned, RecordLike, WithRequests):
         _("IP number"), null=True, blank=True, default=None, editable=False,
         db_index=True
     )
+    # 128-bit numbers don't fit in integer columns of all the databases, so
+    # they are stored as fixed-width hex strings, which sort the same way.
+    number6 = models.CharField(
+        _("IPv6 number"), max_length=32, null=True, blank=True, default=None,
+        editable=False, db_index=True,
+    )
     ttl = models.PositiveIntegerField(
         _("TTL"), blank=True, null=True, default=3600,
         help_text=_("TTL in seconds"),
@@ -387,6 +425,8 @@ class Record(TimeTrackable, Owned, RecordLike, WithRequests):
         db_table = u'records'
         ordering = ('name', 'type')
         unique_together = ('name', 'type', 'content')
+        # The same as nametype_index of the PowerDNS schema
+        index_together = [('name', 'type')]
         verbose_name = _("record")
         verbose_name_plural = _("records")
 
@@ -402,18 +442,15 @@ class Record(TimeTrackable, Owned, RecordLike, WithRequests):
         Check which DNSSEC Mode the domain is in and fill the `ordername`
         field depending on the mode.
         '''
-        cryptokey = CryptoKey.objects.filter(domain=self.domain)
-        if not cryptokey.count():
+        dnssec_mode = dnssec_modes.get(self.domain_id)
+        if dnssec_mode.mode == dnssec.UNSIGNED:
             return None
-        metadata = DomainMetadata.objects.filter(domain=self.domain)
-        nsec3param = metadata.filter(kind='NSEC3PARAM')
-        nsec3narrow = metadata.filter(kind='NSEC3NARROW')
-        if nsec3param.count():
-            if nsec3narrow.count():
-                # When running in NSEC3 'Narrow' mode, the ordername field is
-                # ignored and best left empty.
-                return ''
-            return self._generate_ordername_nsec3(nsec3param[0])
+        if dnssec_mode.mode == dnssec.NSEC3_NARROW:
+            # When running in NSEC3 'Narrow' mode, the ordername field is
+            # ignored and best left empty.
+            return ''
+        if dnssec_mode.mode == dnssec.NSEC3:
+            return self._generate_ordername_nsec3(dnssec_mode.nsec3param)
         return self._generate_ordername_nsec()
 
     def _generate_ordername_nsec(self):
@@ -421,12 +458,7 @@ class Record(TimeTrackable, Owned, RecordLike, WithRequests):
         In 'NSEC' mode, it should contain the relative part of a domain name,
         in reverse order, with dots replaced by spaces
         '''
-        domain_words = self.domain.name.split('.')
-        host_words = self.name.split('.')
-        relative_word_count = len(host_words) - len(domain_words)
-        relative_words = host_words[0:relative_word_count]
-        ordername = ' '.join(relative_words[::-1])
-        return ordername
+        return dnssec.nsec_ordername(self.name, self.domain.name)
 
     def _generate_ordername_nsec3(self, nsec3param):
         '''
@@ -435,34 +467,12 @@ class Record(TimeTrackable, Owned, RecordLike, WithRequests):
         full record name.  "pdnssec hash-zone-record zone record" can be used
         to calculate this hash.
         '''
+        if nsec3param is None:
+            return None  # malformed or unsupported NSEC3PARAM
         try:
-            algo, flags, iterations, salt = nsec3param.content.split()
-            if algo != '1':
-                raise ValueError("Incompatible hash algorithm.")
-            if flags != '1':
-                raise ValueError("Incompatible flags.")
-            salt = salt.decode('hex')
-            # convert the record name to the DNSSEC canonical form, e.g.
-            # a format suitable for digesting in hashes
-            record_name = '%s.' % self.name.lower().rstrip('.')
-            parts = ["%s%s" % (chr(len(x)), x) for x in record_name.split('.')]
-            record_name = ''.join(parts)
-        except (ValueError, TypeError, AttributeError):
-            return None  # incompatible input
-        record_name = self._sha1(record_name, salt)
-        i = 0
-        while i < int(iterations):
-            record_name = self._sha1(record_name, salt)
-            i += 1
-        result = base64.b32encode(record_name)
-        result = result.translate(b32_trans)
-        return result.lower()
-
-    def _sha1(self, value, salt):
-        s = hashlib.sha1()
-        s.update(value)
-        s.update(salt)
-        return s.digest()
+            return nsec3.hash_name(self.name, nsec3param)
+        except ValueError:
+            return None  # invalid name
 
     def force_case(self):
         """Force the name and content case to upper and lower respectively"""
@@ -471,35 +481,24 @@ class Record(TimeTrackable, Owned, RecordLike, WithRequests):
         if self.type:
             self.type = self.type.upper()
 
-    def validate_for_conflicts(self):
-        """Ensure this record doesn't conflict with other records."""
-        def check_unique(comment, **kwargs):
-            conflicting = Record.objects.filter(**kwargs)
-            if self.pk is not None:
-                conflicting = conflicting.exclude(pk=self.pk)
-            if conflicting:
-                raise ValidationError(comment.format(
-                    ', '.join(str(record.id) for record in conflicting)
-                ))
-        if self.type == 'CNAME':
-            check_unique(
-                'Cannot create CNAME record. Following conflicting '
-                'records exist: {}',
-                name=self.name,
-            )
+    def get_record_pk(self):
+        return self.pk
+
+    def set_computed_fields(self):
+        """Fill the fields that are derived from other fields"""
+        self.change_date = int(time.time())
+        batch = batching.current()
+        if batch is None:
+            self.ordername = self._generate_ordername()
         else:
-            check_unique(
-                'Cannot create a record. Following conflicting CNAME'
-                'record exists: {}',
-                type='CNAME',
-                name=self.name,
-            )
+            batch.defer_ordername(self)
+        self.number = IP(self.content).int() if self.type == 'A' else None
+        self.number6 = (
+            ipv6_number(self.content) if self.type == 'AAAA' else None
+        )
 
     def save(self, *args, **kwargs):
-        self.change_date = int(time.time())
-        self.ordername = self._generate_ordername()
-        if self.type == 'A':
-            self.number = IP(self.content).int()
+        self.set_computed_fields()
         super(Record, self).save(*args, **kwargs)
 
     def delete_ptr(self):
@@ -509,30 +508,28 @@ class Record(TimeTrackable, Owned, RecordLike, WithRequests):
         """Creates a PTR record for A record creating a domain if necessary."""
         if self.type != 'A':
             raise ValueError(_('Creating PTR only for A records'))
+        if self.auto_ptr == AutoPtrOptions.NEVER:
+            return
         domain_name, number = to_reverse(self.content)
-        if self.auto_ptr == AutoPtrOptions.ALWAYS:
-            domain, created = Domain.objects.get_or_create(
-                name=domain_name,
-                defaults={
-                    'template': (
-                        self.domain.reverse_template or
-                        get_default_reverse_domain()
-                    ),
-                    'type': self.domain.type,
-                }
-            )
-        elif self.auto_ptr == AutoPtrOptions.ONLY_IF_DOMAIN:
-            try:
-                domain = Domain.objects.get(name=domain_name)
-            except Domain.DoesNotExist:
+        domain_id = reverse_domains.confirm({
+            domain_name: reverse_domains.get(domain_name),
+        })[domain_name]
+        if domain_id is None:
+            if self.auto_ptr != AutoPtrOptions.ALWAYS:
                 return
-        else:
-            return
+            domain_id = reverse_domains.get_or_create(
+                domain_name,
+                template=(
+                    self.domain.reverse_template or
+                    get_default_reverse_domain()
+                ),
+                type=self.domain.type,
+            )
 
         self.delete_ptr()
         Record.objects.create(
             type='PTR',
-            domain=domain,
+            domain_id=domain_id,
             name='.'.join([number, domain_name]),
             content=self.name,
             depends_on=self,
@@ -560,17 +557,39 @@ rules.add_perm('powerdns.change_record', can_edit)
 rules.add_perm('powerdns.delete_record', can_delete)
 
 
-# When we delete a record, the zone changes, but there no change_date is
-# updated. We update the SOA record, so the serial changes
+# Every change in a zone has to change its serial. Deleting a record doesn't
+# leave any change_date behind and moving a record to other domain changes
+# both of them, so the SOA records are updated (once per transaction).
+@receiver(post_save, sender=Record, dispatch_uid='record_update_serial')
 @receiver(post_delete, sender=Record, dispatch_uid='record_update_serial')
-def update_serial(sender, instance, **kwargs):
-    soa = instance.domain.get_soa()
-    if soa:
-        soa.save()
+def update_serial(sender, instance, using, **kwargs):
+    domain_ids = {
+        instance.domain_id,
+        instance._initial_values.get('domain_id'),
+    }
+    if instance.type == 'SOA' and 'created' in kwargs:
+        # A saved SOA has just got a new change_date
+        domain_ids.discard(instance.domain_id)
+    batch = batching.current()
+    if batch is None:
+        serials.bump_serials(domain_ids, using=using)
+    else:
+        batch.defer_serial(domain_ids)
+
+
+@receiver(post_delete, sender=Record, dispatch_uid='record_batch_discard')
+def discard_from_batch(sender, instance, **kwargs):
+    batch = batching.current()
+    if batch is not None:
+        batch.discard(instance)
 
 
 @receiver(post_save, sender=Record, dispatch_uid='record_create_ptr')
 def create_ptr(sender, instance, **kwargs):
+    batch = batching.current()
+    if batch is not None:
+        batch.defer_ptr(instance)
+        return
     if instance.auto_ptr == AutoPtrOptions.NEVER or instance.type != 'A':
         instance.delete_ptr()
         return
@@ -629,4 +648,62 @@ class CryptoKey(TimeTrackable):
         verbose_name_plural = _("crypto keys")
 
     def __str__(self):
-        return self.domain
+        return str(self.domain)
+
+
+@receiver(
+    post_save, sender=Domain, dispatch_uid='domain_dnssec_mode_created'
+)
+def forget_new_domain_dnssec_mode(sender, instance, created, **kwargs):
+    # Primary keys can be reused, so a new domain mustn't inherit a mode.
+    # It has no keys yet, so its mode can be cached before the commit.
+    if created:
+        dnssec_modes.forget(instance.pk)
+
+
+@receiver(
+    post_delete, sender=Domain, dispatch_uid='domain_dnssec_mode_deleted'
+)
+def forget_deleted_domain_dnssec_mode(sender, instance, **kwargs):
+    dnssec_modes.invalidate(instance.pk)
+
+
+@receiver(post_delete, sender=Domain, dispatch_uid='domain_orphan_children')
+def pass_children_to_parent(sender, instance, **kwargs):
+    # The children have been orphaned by SET_NULL at this point
+    Domain.objects.filter(
+        parent=None, name__endswith='.' + instance.name,
+    ).update(parent=closest_domain(parent_names(instance.name)))
+
+
+@receiver(post_save, sender=Domain, dispatch_uid='domain_index_saved')
+def index_saved_domain(sender, instance, created, **kwargs):
+    if not created and instance._initial_values.get('name') == instance.name:
+        return
+    for index in (reverse_domains, all_domains):
+        index.add(
+            instance.name, instance.pk, instance._initial_values.get('name'),
+        )
+
+
+@receiver(post_delete, sender=Domain, dispatch_uid='domain_index_deleted')
+def index_deleted_domain(sender, instance, **kwargs):
+    for index in (reverse_domains, all_domains):
+        index.remove(instance.name, instance.pk)
+
+
+@receiver(post_save, sender=CryptoKey, dispatch_uid='cryptokey_dnssec_saved')
+@receiver(
+    post_delete, sender=CryptoKey, dispatch_uid='cryptokey_dnssec_deleted'
+)
+@receiver(
+    post_save, sender=DomainMetadata, dispatch_uid='metadata_dnssec_saved'
+)
+@receiver(
+    post_delete, sender=DomainMetadata, dispatch_uid='metadata_dnssec_deleted'
+)
+def forget_dnssec_mode(sender, instance, **kwargs):
+    """Invalidate the cached DNSSEC mode of domains affected by a change of
+    keys or metadata"""
+    dnssec_modes.invalidate(instance.domain_id)
+    dnssec_modes.invalidate(instance._initial_values.get('domain_id'))
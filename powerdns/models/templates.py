@@ -150,27 +150,71 @@ class RecordTemplate(models.Model):
             setattr(record, kwarg, value)
 
 
-@receiver(
-    post_save, sender=Domain, dispatch_uid='domain_update_templated_records'
-)
-def update_templated_records(sender, instance, **kwargs):
-    """Deletes and creates records appropriately to the template"""
-    if instance.template is None:
+class TemplatePropagation(models.Model):
+    """Propagation of a saved record template to the domains using its
+    domain template. The domains are processed in the order of ids, in
+    chunks, and ``position`` (the last domain id done) is saved with every
+    chunk, so an interrupted propagation continues where it has stopped."""
+
+    record_template = models.ForeignKey(
+        RecordTemplate,
+        verbose_name=_('Record template'),
+        related_name='propagations',
+    )
+    position = models.PositiveIntegerField(_('position'), default=0)
+    total = models.PositiveIntegerField(_('domains'), default=0)
+    done = models.PositiveIntegerField(_('domains done'), default=0)
+    created = models.DateTimeField(_('created'), auto_now_add=True)
+    finished = models.DateTimeField(_('finished'), null=True, blank=True)
+
+    class Meta:
+        verbose_name = _('template propagation')
+        verbose_name_plural = _('template propagations')
+
+    def __str__(self):
+        return '{}: {}'.format(self.record_template, self.progress())
+
+    def progress(self):
+        return '{}/{}'.format(self.done, self.total)
+    progress.short_description = _('progress')
+
+
+def apply_template(domain):
+    """Deletes and creates records appropriately to the template of the
+    domain. Done when the template of the domain changes, call it to
+    reconcile the records otherwise."""
+    if domain.template is None:
         return
-    instance.record_set.exclude(
+    domain.record_set.exclude(
         template__isnull=True
     ).exclude(
-        template__domain_template=instance.template
+        template__domain_template=domain.template
     ).delete()
     existing_template_ids = set(
-        instance.record_set.exclude(
+        domain.record_set.exclude(
             template__isnull=True
         ).values_list('template__id', flat=True)
     )
-    for template in instance.template.recordtemplate_set.exclude(
+    for template in domain.template.recordtemplate_set.exclude(
         pk__in=existing_template_ids,
     ):
-        template.create_record(instance)
+        template.create_record(domain)
+
+
+@receiver(
+    post_save, sender=Domain, dispatch_uid='domain_update_templated_records'
+)
+def update_templated_records(sender, instance, created, **kwargs):
+    """Applies the template of new domains and domains whose template has
+    changed. Other saves (e.g. of ``notified_serial`` by PowerDNS) don't
+    query the records."""
+    if (
+        not created and
+        instance._initial_values.get('template_id') == instance.template_id
+    ):
+        return
+    apply_template(instance)
+    instance._initial_values['template_id'] = instance.template_id
 
 
 @receiver(
@@ -179,10 +223,6 @@ def update_templated_records(sender, instance, **kwargs):
     dispatch_uid='record_template_modify_templated_records',
 )
 def modify_templated_records(sender, instance, created, **kwargs):
-    if created:
-        for domain in instance.domain_template.domain_set.all():
-            instance.create_record(domain)
-    else:
-        for record in instance.record_set.all():
-            instance.update_record(record)
-            record.save()
+    # Done by the propagate_templates command, unless there are few domains
+    from powerdns.propagation import start_propagation
+    start_propagation(instance)
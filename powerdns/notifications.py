@@ -0,0 +1,217 @@
+"""Delivery of the e-mail notifications queued in the outbox.
+
+Notifications are saved as ``Notification`` objects and sent in batches by
+the ``process_notifications`` command. The notifications of an owner about
+objects created by the same user within ``DNSAAS_NOTIFICATION_DIGEST_WINDOW``
+seconds are sent as a single e-mail (a digest of all the objects) when the
+window ends. A notification that can't be sent is retried after
+``DNSAAS_NOTIFICATION_RETRY_DELAY`` seconds, twice as long after every next
+failure, up to ``DNSAAS_NOTIFICATION_MAX_ATTEMPTS`` times.
+"""
+
+import datetime
+import smtplib
+from collections import OrderedDict
+from functools import reduce
+from operator import or_
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.mail import EmailMessage, get_connection
+from django.db import transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from powerdns.models.notifications import Notification
+from powerdns.utils import BATCH_SIZE, chunks, format_recursive
+
+
+# Used if not in settings. Has the placeholders of OWNER_NOTIFICATIONS,
+# ``count`` and ``objects`` (one per line) instead of ``object``.
+OWNER_NOTIFICATION_DIGEST = (
+    '{count} objects created for you!',
+    """
+    User {creator-name} ({creator-email}) has created the following objects
+    and set their owner to you:
+
+{objects}
+    """,
+)
+
+
+def max_attempts():
+    return getattr(settings, 'DNSAAS_NOTIFICATION_MAX_ATTEMPTS', 5)
+
+
+def retry_delay(attempts):
+    """The time to wait after ``attempts`` failed attempts"""
+    return datetime.timedelta(
+        seconds=getattr(settings, 'DNSAAS_NOTIFICATION_RETRY_DELAY', 60) *
+        2 ** (attempts - 1)
+    )
+
+
+def window_end(now):
+    """The end of the digest window of ``now``. All the notifications of
+    a window are due at the same time."""
+    window = getattr(settings, 'DNSAAS_NOTIFICATION_DIGEST_WINDOW', 60)
+    if not window:
+        return now
+    timestamp = now.timestamp()
+    return now + datetime.timedelta(seconds=window - timestamp % window)
+
+
+def notify_owners(objects, creator):
+    """Queue notifications of the owners of objects created for them by
+    somebody else (``creator``), with a bulk ``INSERT``"""
+    if not settings.ENABLE_OWNER_NOTIFICATIONS:
+        return []
+    next_attempt = window_end(timezone.now())
+    return Notification.objects.bulk_create(
+        [
+            Notification(
+                owner=object_.owner,
+                creator=creator,
+                recipient=object_.owner.email,
+                kind=type(object_)._meta.object_name,
+                object=str(object_),
+                next_attempt=next_attempt,
+            )
+            for object_ in objects
+            if object_.owner != creator and hasattr(object_.owner, 'email')
+        ],
+        batch_size=BATCH_SIZE,
+    )
+
+
+def due_notifications(now):
+    return Notification.objects.filter(
+        sent=None, next_attempt__lte=now, attempts__lt=max_attempts(),
+    )
+
+
+def user_arguments(key, user):
+    if user is None:
+        return {key + '-email': '', key + '-name': ''}
+    return {
+        key + '-email': user.email,
+        key + '-name': '{} {}'.format(user.first_name, user.last_name),
+    }
+
+
+def render(notifications, users):
+    """The subject and content of the e-mail about a group of notifications
+    of the same owner and creator (``users`` by id)"""
+    first = notifications[0]
+    arguments = dict(
+        user_arguments('owner', users.get(first.owner_id)),
+        **user_arguments('creator', users.get(first.creator_id))
+    )
+    if len(notifications) == 1:
+        template = settings.OWNER_NOTIFICATIONS[first.kind]
+        arguments['object'] = first.object
+    else:
+        template = getattr(
+            settings, 'OWNER_NOTIFICATION_DIGEST', OWNER_NOTIFICATION_DIGEST,
+        )
+        arguments['count'] = len(notifications)
+        arguments['objects'] = '\n'.join(
+            '{} {}'.format(notification.kind, notification.object)
+            for notification in notifications
+        )
+    subject, content = format_recursive(list(template), arguments)
+    return subject, content
+
+
+def group(notifications):
+    """Group notifications by owner, creator and window"""
+    groups = OrderedDict()
+    for notification in notifications:
+        groups.setdefault(
+            (
+                notification.owner_id,
+                notification.creator_id,
+                notification.next_attempt,
+            ),
+            [],
+        ).append(notification)
+    return list(groups.values())
+
+
+def send_groups(groups, users):
+    """Send a digest of every group over a single connection. Returns the
+    list of the groups sent and the list of ``(group, error)`` of the
+    others, including those that couldn't be rendered."""
+    sent = []
+    failed = []
+    try:
+        connection = get_connection()
+        connection.open()
+    except (smtplib.SMTPException, OSError) as e:
+        return sent, [(notifications, e) for notifications in groups]
+    try:
+        for notifications in groups:
+            try:
+                subject, content = render(notifications, users)
+                EmailMessage(
+                    subject,
+                    content,
+                    settings.FROM_EMAIL,
+                    [notifications[0].recipient],
+                    connection=connection,
+                ).send()
+            except Exception as e:
+                # E.g. a kind missing in OWNER_NOTIFICATIONS or a broken
+                # template. It fails only this group, not the whole batch.
+                failed.append((notifications, e))
+            else:
+                sent.append(notifications)
+    finally:
+        connection.close()
+    return sent, failed
+
+
+def update(groups, **values):
+    """Update the notifications of groups"""
+    pks = [
+        notification.pk
+        for notifications in groups for notification in notifications
+    ]
+    for pks_chunk in chunks(pks):
+        Notification.objects.filter(pk__in=pks_chunk).update(**values)
+
+
+def deliver_notifications(batch_size=100):
+    """Send a batch of up to ``batch_size`` e-mails about the notifications
+    due. Returns the numbers of the e-mails sent and failed."""
+    now = timezone.now()
+    due = due_notifications(now)
+    with transaction.atomic():
+        keys = list(
+            due.order_by('next_attempt', 'owner', 'creator').values_list(
+                'owner', 'creator', 'next_attempt',
+            ).distinct()[:batch_size]
+        )
+        if not keys:
+            return 0, 0
+        # Other workers wait until the batch is done, not to send it twice
+        notifications = list(due.filter(reduce(or_, [
+            Q(owner=owner, creator=creator, next_attempt=next_attempt)
+            for owner, creator, next_attempt in keys
+        ])).order_by('pk').select_for_update())
+        users = get_user_model().objects.in_bulk(
+            {owner for owner, _, _ in keys} |
+            {creator for _, creator, _ in keys if creator is not None}
+        )
+        sent, failed = send_groups(group(notifications), users)
+        update(sent, sent=now, attempts=F('attempts') + 1)
+        for notifications, error in failed:
+            # The notifications of a group are retried together
+            attempts = notifications[0].attempts + 1
+            update(
+                [notifications],
+                attempts=attempts,
+                next_attempt=now + retry_delay(attempts),
+                last_error='{}: {}'.format(type(error).__name__, error),
+            )
+    return len(sent), len(failed)
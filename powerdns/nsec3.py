@@ -0,0 +1,101 @@
+"""NSEC3 hashing of domain names (RFC 5155).
+
+In NSEC3 (non-narrow) mode PowerDNS expects the ``ordername`` of a record to
+be the lowercase base32hex encoding of the salted and iterated SHA-1 hash of
+the record name in canonical wire format -- the same value that
+``pdnssec hash-zone-record zone record`` prints.
+
+Parameters are parsed once into ``NSEC3Param`` (with the salt already
+decoded to bytes) and hashes are memoized per (name, parameters), as the same
+names are hashed over and over again when records are saved. Whole zones can
+be hashed in a pool of processes with ``hash_names``.
+"""
+
+import base64
+import hashlib
+import os
+from collections import namedtuple
+from functools import lru_cache, partial
+from multiprocessing import Pool
+
+
+SHA1 = 1
+
+# Number of memoized hashes
+CACHE_SIZE = 16384
+
+# Lists shorter than this are hashed in the calling process, as starting
+# a pool would take longer than hashing itself
+POOL_THRESHOLD = 5000
+
+# http://tools.ietf.org/html/rfc4648#section-7
+B32HEX = bytes.maketrans(
+    b'ABCDEFGHIJKLMNOPQRSTUVWXYZ234567',
+    b'0123456789abcdefghijklmnopqrstuv',
+)
+
+
+NSEC3Param = namedtuple(
+    'NSEC3Param', ['algorithm', 'flags', 'iterations', 'salt']
+)
+
+
+def parse_nsec3param(content):
+    """Parse the content of NSEC3PARAM metadata (e.g. ``1 0 10 ab12``).
+    Returns None if the content is malformed or uses an unsupported hash
+    algorithm."""
+    try:
+        algorithm, flags, iterations, salt = content.split()
+        param = NSEC3Param(
+            int(algorithm),
+            int(flags),
+            int(iterations),
+            b'' if salt == '-' else bytes.fromhex(salt),
+        )
+    except (ValueError, AttributeError):
+        return None
+    if param.algorithm != SHA1 or param.iterations < 0:
+        return None
+    return param
+
+
+def wire_format(name):
+    """Canonical (lowercase, uncompressed) wire format of a domain name"""
+    labels = name.lower().rstrip('.').encode('ascii').split(b'.')
+    if labels == [b'']:
+        # The root
+        return b'\x00'
+    if any(not label or len(label) > 63 for label in labels):
+        raise ValueError('Invalid domain name {!r}'.format(name))
+    return b''.join(bytes([len(label)]) + label for label in labels) + b'\x00'
+
+
+def _hash(name, param):
+    salt = param.salt
+    digest = hashlib.sha1(wire_format(name) + salt).digest()
+    for _ in range(param.iterations):
+        digest = hashlib.sha1(digest + salt).digest()
+    return base64.b32encode(digest).translate(B32HEX).decode('ascii')
+
+
+@lru_cache(maxsize=CACHE_SIZE)
+def hash_name(name, param):
+    """NSEC3 hash of a name as used in ``ordername``. Raises ValueError for
+    names that can't be hashed."""
+    return _hash(name, param)
+
+
+def hash_names(names, param, processes=None):
+    """NSEC3 hashes of many names (e.g. all the names in a zone) in the same
+    order. Long lists are split between ``processes`` worker processes (by
+    default one per CPU)."""
+    names = list(names)
+    if processes == 1 or len(names) < POOL_THRESHOLD:
+        return [hash_name(name, param) for name in names]
+    processes = processes or os.cpu_count() or 1
+    with Pool(processes) as pool:
+        return pool.map(
+            partial(_hash, param=param),
+            names,
+            chunksize=max(1, len(names) // (4 * processes)),
+        )
@@ -0,0 +1,175 @@
+"""Pagination styles for DNSaaS API"""
+
+import base64
+import binascii
+import json
+from collections import OrderedDict
+
+from django.db import connections
+from django.db.models import Q
+from django.utils.translation import ugettext_lazy as _
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import LimitOffsetPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+
+def encode_cursor(position):
+    return base64.urlsafe_b64encode(
+        json.dumps(position).encode('utf-8')
+    ).decode('ascii')
+
+
+def decode_cursor(cursor):
+    """The position encoded in a cursor, or None for the empty cursor (the
+    first page)"""
+    if not cursor:
+        return None
+    try:
+        return json.loads(
+            base64.urlsafe_b64decode(cursor.encode('ascii')).decode('utf-8')
+        )
+    except (binascii.Error, UnicodeError, ValueError):
+        raise NotFound(KeysetPagination.invalid_cursor_message)
+
+
+def after(keyset, position, nullable=(), nulls_largest=False):
+    """``Q`` object selecting the rows after ``position`` in the order of
+    ``keyset``, e.g. ``a > 1 OR (a = 1 AND b > 2)`` for ``('a', 'b')``.
+    NULLs of the ``nullable`` fields are ordered after all the values if
+    ``nulls_largest``, otherwise before them, like the database does."""
+    def greater(field, value):
+        """``Q`` object of the values greater than ``value``, or None if
+        there are none"""
+        if field in nullable and value is None:
+            return None if nulls_largest else Q(**{field + '__isnull': False})
+        values = Q(**{field + '__gt': value})
+        if field in nullable and nulls_largest:
+            values |= Q(**{field + '__isnull': True})
+        return values
+
+    def equal(field, value):
+        if field in nullable and value is None:
+            return Q(**{field + '__isnull': True})
+        return Q(**{field: value})
+
+    *fields, last = zip(keyset, position)
+    predicate = greater(*last)
+    for field, value in reversed(fields):
+        greater_values = greater(field, value)
+        predicate = equal(field, value) & predicate
+        if greater_values is not None:
+            predicate = greater_values | predicate
+    return predicate
+
+
+class KeysetPagination(LimitOffsetPagination):
+    """Limit/offset pagination, unless the ``cursor`` parameter is given
+    (empty for the first page). Then the pages are read in the order of
+    ``keyset`` starting after the last row of the previous page, which is
+    encoded in the cursor. Such pages don't get slower the further they are
+    and there is no ``count``, so walking the whole table takes constant
+    time per page. Only the ``next`` link is given.
+
+    ``keyset`` has to identify the rows uniquely, so it ends with ``id``,
+    which can't be NULL. Its other fields that can be NULL have to be listed
+    in ``nullable``.
+    """
+
+    cursor_query_param = 'cursor'
+    invalid_cursor_message = _('Invalid cursor')
+    keyset = ('id',)
+    nullable = ()
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_mode = self.cursor_query_param in request.query_params
+        if not self.cursor_mode:
+            return self.paginate_offset(queryset, request, view)
+        self.request = request
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        position = decode_cursor(request.query_params[self.cursor_query_param])
+        # The plain columns, so the order can come from an index
+        queryset = queryset.order_by(*self.keyset)
+        if position is not None:
+            if (
+                not isinstance(position, list) or
+                len(position) != len(self.keyset)
+            ):
+                raise NotFound(self.invalid_cursor_message)
+            queryset = queryset.filter(after(
+                self.keyset,
+                position,
+                self.nullable,
+                connections[queryset.db].features.nulls_order_largest,
+            ))
+        # One more row tells if there is a next page
+        page = list(queryset[:self.limit + 1])
+        if len(page) > self.limit:
+            page = page[:self.limit]
+            last = page[-1]
+            if isinstance(last, dict):
+                # A row of QuerySet.values()
+                self.next_position = [last[field] for field in self.keyset]
+            else:
+                self.next_position = [
+                    getattr(last, field) for field in self.keyset
+                ]
+        else:
+            self.next_position = None
+        self.display_page_controls = self.next_position is not None
+        return page
+
+    def paginate_offset(self, queryset, request, view):
+        """Limit/offset pagination, which doesn't count the objects again if
+        the view has done it (``list_count``)"""
+        count = getattr(view, 'list_count', None)
+        if count is None:
+            return super().paginate_queryset(queryset, request, view)
+        self.limit = self.get_limit(request)
+        if self.limit is None:
+            return None
+        self.offset = self.get_offset(request)
+        self.count = count
+        self.request = request
+        if self.count > self.limit and self.template is not None:
+            self.display_page_controls = True
+        return list(queryset[self.offset:self.offset + self.limit])
+
+    def get_paginated_response(self, data):
+        if not self.cursor_mode:
+            return super().get_paginated_response(data)
+        return Response(OrderedDict([
+            ('next', self.get_next_link()),
+            ('results', data),
+        ]))
+
+    def get_next_link(self):
+        if not self.cursor_mode:
+            return super().get_next_link()
+        if self.next_position is None:
+            return None
+        url = self.request.build_absolute_uri()
+        url = remove_query_param(url, self.offset_query_param)
+        url = replace_query_param(url, self.limit_query_param, self.limit)
+        return replace_query_param(
+            url, self.cursor_query_param, encode_cursor(self.next_position),
+        )
+
+    def get_html_context(self):
+        if not self.cursor_mode:
+            return super().get_html_context()
+        return {'previous_url': None, 'next_url': self.get_next_link()}
+
+    def to_html(self):
+        if self.cursor_mode:
+            self.template = 'rest_framework/pagination/previous_and_next.html'
+        return super().to_html()
+
+
+class RecordPagination(KeysetPagination):
+
+    # The same as Record.Meta.ordering, which doesn't identify the rows
+    keyset = ('name', 'type', 'id')
+    nullable = ('type',)
@@ -0,0 +1,118 @@
+"""Propagation of record template changes to the records of domains.
+
+A saved record template has to be applied to every domain using its domain
+template: the records made from it are updated and the missing ones are
+created. With thousands of domains this is too much work for a request, so
+it is saved as a ``TemplatePropagation`` job and done by the
+``propagate_templates`` command, in chunks of domains with set-based queries
+(see ``powerdns.bulk``) and one serial bump per zone. Templates of at most
+``DNSAAS_TEMPLATE_PROPAGATION_INLINE`` domains (100 by default) are
+propagated immediately.
+"""
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from powerdns.bulk import create_ptrs, insert_records, save_records
+from powerdns.models.powerdns import Domain, Record
+from powerdns.models.templates import TemplatePropagation
+from powerdns.serials import bump_serials
+from powerdns.utils import BATCH_SIZE
+
+
+# The fields of records set from their templates or derived from them
+PROPAGATED_FIELDS = [
+    'type', 'name', 'content', 'ttl', 'prio', 'auth', 'auto_ptr',
+    'change_date', 'ordername', 'number', 'number6', 'modified',
+]
+
+
+def template_domains(record_template):
+    return Domain.objects.filter(template=record_template.domain_template_id)
+
+
+def start_propagation(record_template):
+    """Start propagating a saved record template. Its unfinished
+    propagations are finished without doing the rest of the domains, as the
+    domains they have done are outdated too."""
+    # Not deleted, as workers could be running them
+    record_template.propagations.filter(finished=None).update(
+        finished=timezone.now(),
+    )
+    propagation = TemplatePropagation.objects.create(
+        record_template=record_template,
+        total=template_domains(record_template).count(),
+    )
+    inline = getattr(settings, 'DNSAAS_TEMPLATE_PROPAGATION_INLINE', 100)
+    if propagation.total <= inline:
+        run_propagation(propagation)
+    return propagation
+
+
+def propagate_chunk(record_template, domains):
+    """Create or update the records made from a template in the domains
+    given"""
+    existing = {
+        record.domain_id: record
+        for record in record_template.record_set.filter(domain__in=domains)
+    }
+    created = []
+    updated = []
+    now = timezone.now()
+    for domain in domains:
+        record = existing.get(domain.pk)
+        if record is None:
+            created.append(Record(**record_template.get_kwargs(domain)))
+            continue
+        for field, value in record_template.get_kwargs(domain).items():
+            setattr(record, field, value)
+        record.set_computed_fields()
+        record.modified = now
+        updated.append(record)
+    insert_records(created)
+    save_records(updated, PROPAGATED_FIELDS)
+    ptrs = (
+        create_ptrs(created, created=True) +
+        create_ptrs(updated)
+    )
+    bump_serials(
+        {domain.pk for domain in domains} | {ptr.domain_id for ptr in ptrs}
+    )
+
+
+def run_propagation(propagation, chunk_size=BATCH_SIZE, report=None):
+    """Do (or continue) a propagation, a chunk of domains per transaction.
+    ``report`` is called with the propagation after every chunk."""
+    while propagation.finished is None:
+        with transaction.atomic():
+            # Other workers wait until the chunk is done
+            try:
+                propagation = TemplatePropagation.objects.select_for_update(
+                ).select_related('record_template').get(pk=propagation.pk)
+            except TemplatePropagation.DoesNotExist:
+                # The record template has been deleted
+                break
+            if propagation.finished is not None:
+                break
+            domains = list(
+                template_domains(propagation.record_template).filter(
+                    pk__gt=propagation.position,
+                ).select_related('reverse_template').order_by('pk')[
+                    :chunk_size
+                ]
+            )
+            if domains:
+                propagate_chunk(propagation.record_template, domains)
+                propagation.position = domains[-1].pk
+                propagation.done += len(domains)
+            else:
+                propagation.finished = timezone.now()
+            propagation.save()
+        if report is not None:
+            report(propagation)
+    return propagation
+
+
+def pending_propagations():
+    return TemplatePropagation.objects.filter(finished=None).order_by('pk')
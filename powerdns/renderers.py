@@ -0,0 +1,33 @@
+"""Renderers for non-JSON API responses"""
+
+from rest_framework.renderers import BaseRenderer, JSONRenderer
+
+
+class ZoneFileRenderer(BaseRenderer):
+    """RFC 1035 zone files. The views produce the content themselves."""
+
+    media_type = 'text/dns'
+    format = 'zone'
+    charset = 'utf-8'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        return data
+
+
+class FlatJSONRenderer(JSONRenderer):
+    """JSON with every object as a list of values, selected with
+    ``?format=flat``. The views produce the lists themselves."""
+
+    format = 'flat'
+
+
+class NDJSONRenderer(JSONRenderer):
+    """Newline delimited JSON, one object per line. The views stream the
+    lines themselves, anything else (like errors) is a single line."""
+
+    media_type = 'application/x-ndjson'
+    format = 'ndjson'
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        content = super().render(data, accepted_media_type, renderer_context)
+        return content + b'\n' if content else content
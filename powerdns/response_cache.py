@@ -0,0 +1,155 @@
+"""Cache of rendered API responses of read-mostly models.
+
+Templates are read all the time by provisioning tools, but hardly ever
+changed. Responses listing them are cached in the django cache configured by
+``DNSAAS_RESPONSE_CACHE`` (``None`` disables it) for
+``DNSAAS_RESPONSE_CACHE_TIMEOUT`` seconds. The keys contain a version that is
+changed (after the transaction is committed) every time one of the objects is
+saved or deleted, so all the processes sharing the cache stop using the old
+responses at once.
+
+Only responses that are the same for all the users allowed to see them can be
+cached. Responses of the browsable API are never cached, as they contain user
+specific content.
+"""
+
+import hashlib
+import uuid
+
+from django.apps import apps
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.http import HttpResponse
+
+
+class ResponseCache(object):
+    """Responses depending on the objects of given models (``app.Model``
+    labels)"""
+
+    version_key_prefix = 'powerdns:response-cache-version:'
+    key_prefix = 'powerdns:response:'
+
+    def __init__(self, name, *models):
+        self.name = name
+        self.models = models
+        self.version_key = self.version_key_prefix + name
+
+    @property
+    def shared(self):
+        alias = getattr(settings, 'DNSAAS_RESPONSE_CACHE', 'default')
+        if alias is None:
+            return None
+        return caches[alias]
+
+    @property
+    def timeout(self):
+        return getattr(settings, 'DNSAAS_RESPONSE_CACHE_TIMEOUT', 300)
+
+    def get_version(self):
+        version = self.shared.get(self.version_key)
+        if version is None:
+            version = uuid.uuid4().hex
+            # Another process could have set it in the meantime
+            self.shared.add(self.version_key, version, None)
+            version = self.shared.get(self.version_key, version)
+        return version
+
+    def get_key(self, request, view):
+        """The key of the response to a request, or None if it can't be
+        cached"""
+        if self.shared is None or request.accepted_renderer.format == 'api':
+            return None
+        parts = [
+            type(view).__name__,
+            request.build_absolute_uri(),
+            request.accepted_media_type,
+        ]
+        digest = hashlib.md5('\n'.join(parts).encode('utf-8')).hexdigest()
+        return '{}{}:{}:{}'.format(
+            self.key_prefix, self.name, self.get_version(), digest,
+        )
+
+    def get(self, key):
+        cached = self.shared.get(key)
+        if cached is None:
+            return None
+        content, content_type = cached
+        return HttpResponse(content, content_type=content_type)
+
+    def set(self, key, response):
+        self.shared.set(
+            key, (response.content, response['Content-Type']), self.timeout,
+        )
+
+    def invalidate(self):
+        """Make the responses cached by all the processes stale"""
+        if self.shared is not None:
+            self.shared.set(self.version_key, uuid.uuid4().hex, None)
+
+    def changed(self, sender, **kwargs):
+        transaction.on_commit(self.invalidate)
+
+    def connect(self):
+        """Invalidate on changes of the models. Called when the app is
+        ready."""
+        for label in self.models:
+            model = apps.get_model(label)
+            for signal in (post_save, post_delete):
+                signal.connect(
+                    self.changed,
+                    sender=model,
+                    dispatch_uid='response_cache_{}'.format(self.name),
+                )
+
+
+class CachedResponseMixin(object):
+    """Viewset mixin serving ``list`` and ``retrieve`` from
+    ``response_cache``"""
+
+    response_cache = None
+
+    def cached(self, request, get_response):
+        key = self.response_cache.get_key(request, self)
+        if key is not None:
+            response = self.response_cache.get(key)
+            if response is not None:
+                return response
+        # Stored when rendered
+        self.response_cache_key = key
+        return get_response()
+
+    def list(self, request, *args, **kwargs):
+        return self.cached(
+            request,
+            lambda: super(CachedResponseMixin, self).list(
+                request, *args, **kwargs
+            ),
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached(
+            request,
+            lambda: super(CachedResponseMixin, self).retrieve(
+                request, *args, **kwargs
+            ),
+        )
+
+    def finalize_response(self, request, response, *args, **kwargs):
+        response = super().finalize_response(
+            request, response, *args, **kwargs
+        )
+        key = getattr(self, 'response_cache_key', None)
+        if key is not None and response.status_code == 200:
+            response.render()
+            self.response_cache.set(key, response)
+        return response
+
+
+template_responses = ResponseCache(
+    'templates', 'powerdns.DomainTemplate', 'powerdns.RecordTemplate',
+)
+supermaster_responses = ResponseCache('supermasters', 'powerdns.SuperMaster')
+
+response_caches = [template_responses, supermaster_responses]
@@ -1,6 +1,10 @@
 """Serializer classes for DNSaaS API"""
 
+from collections import OrderedDict
+
 from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError as DjangoValidationError
+from powerdns.bulk import UPDATE_FIELDS
 from powerdns.models import (
     CryptoKey,
     Domain,
@@ -10,17 +14,174 @@ from powerdns.models import (
     RecordTemplate,
     SuperMaster,
 )
+from powerdns.models.powerdns import closest_domain
+from django.core.exceptions import FieldDoesNotExist
+from django.core.urlresolvers import reverse
+from rest_framework.fields import empty
+from rest_framework.relations import (
+    HyperlinkedIdentityField,
+    ManyRelatedField,
+    RelatedField,
+)
 from rest_framework.serializers import(
+    BaseSerializer,
     HyperlinkedModelSerializer,
     HyperlinkedRelatedField,
+    ListSerializer,
     SlugRelatedField,
+    ValidationError,
 )
-from powerdns.utils import DomainForRecordValidator
+from rest_framework.settings import api_settings
+from powerdns.utils import DomainForRecordValidator, parent_names
+
+
+def related_lookups(serializer, model, prefix=''):
+    """The ``select_related`` and ``prefetch_related`` lookups needed to
+    render the fields of a serializer for a list of ``model`` objects
+    without a query per object. Relations rendered from the primary key
+    alone (like hyperlinks) don't need any."""
+    select, prefetch = [], []
+    for field in serializer.fields.values():
+        if field.write_only or field.source == '*' or '.' in field.source:
+            continue
+        try:
+            model_field = model._meta.get_field(field.source)
+        except FieldDoesNotExist:
+            continue
+        if not model_field.is_relation:
+            continue
+        lookup = prefix + field.source
+        many = model_field.many_to_many or model_field.one_to_many
+        if isinstance(field, ListSerializer):
+            prefetch.append(lookup)
+            continue
+        if isinstance(field, BaseSerializer):
+            nested = related_lookups(
+                field, model_field.related_model, lookup + '__',
+            )
+            (prefetch if many else select).append(lookup)
+            select.extend(nested[0])
+            prefetch.extend(nested[1])
+            continue
+        if isinstance(field, ManyRelatedField):
+            field = field.child_relation
+        if not isinstance(field, RelatedField):
+            continue
+        if many:
+            prefetch.append(lookup)
+        elif not field.use_pk_only_optimization():
+            select.append(lookup)
+    return select, prefetch
+
+
+# Replaced in a reversed URL to get a URL template
+URL_PLACEHOLDER = 987654321
+
+
+class ValuesSerializer(object):
+    """Serializes rows of ``QuerySet.values()`` the same way ``serializer``
+    serializes objects, but only the ``field_names`` given. No model
+    instances are created and hyperlinks are formatted from a URL template
+    reversed once, not per row. Supports the fields of model serializers:
+    model fields, hyperlinks (by primary key) and slugs of related
+    objects."""
+
+    def __init__(self, serializer, field_names):
+        self.field_names = list(field_names)
+        unknown = set(self.field_names) - set(serializer.fields)
+        if unknown:
+            raise ValidationError({
+                'fields': ['Unknown fields: {}'.format(
+                    ', '.join(sorted(unknown))
+                )],
+            })
+        request = serializer.context.get('request')
+        self.columns = []
+        self.converters = []
+        for field_name in self.field_names:
+            field = serializer.fields[field_name]
+            if isinstance(field, HyperlinkedIdentityField):
+                column = field.lookup_field
+                converter = self.url_converter(request, field)
+            elif isinstance(field, HyperlinkedRelatedField):
+                column = '{}__{}'.format(field.source, field.lookup_field)
+                if field.lookup_field == 'pk':
+                    # Doesn't join the related table
+                    column = field.source + '_id'
+                converter = self.url_converter(request, field)
+            elif isinstance(field, SlugRelatedField):
+                column = '{}__{}'.format(field.source, field.slug_field)
+                converter = None
+            elif isinstance(field, (RelatedField, ManyRelatedField)):
+                raise ValidationError({
+                    'fields': ['{} is not supported'.format(field_name)],
+                })
+            else:
+                column = field.source
+                converter = field.to_representation
+            self.columns.append(column)
+            self.converters.append(converter)
+
+    @staticmethod
+    def url_converter(request, field):
+        url = reverse(
+            field.view_name, kwargs={field.lookup_url_kwarg: URL_PLACEHOLDER},
+        )
+        if request is not None:
+            url = request.build_absolute_uri(url)
+        template = url.replace(str(URL_PLACEHOLDER), '{}')
+        return template.format
+
+    def to_list(self, row):
+        """The values of the fields of a row (a dictionary)"""
+        values = []
+        for column, converter in zip(self.columns, self.converters):
+            value = row[column]
+            if value is not None and converter is not None:
+                value = converter(value)
+            values.append(value)
+        return values
+
+    def to_representation(self, row):
+        return OrderedDict(zip(self.field_names, self.to_list(row)))
+
+
+class MemoizedFieldMixin(object):
+    """A field that validates every distinct value only once. When a list of
+    items is validated, the same field instance is used for all of them, so
+    items referring to the same object don't look it up again."""
+
+    def run_validation(self, data=empty):
+        memo = self.__dict__.setdefault('_memo', {})
+        try:
+            result = memo[data]
+        except TypeError:
+            # Unhashable input
+            return super().run_validation(data)
+        except KeyError:
+            try:
+                result = super().run_validation(data)
+            except ValidationError as e:
+                result = e
+            memo[data] = result
+        if isinstance(result, ValidationError):
+            raise ValidationError(result.detail)
+        return result
+
+
+class MemoizedSlugRelatedField(MemoizedFieldMixin, SlugRelatedField):
+    pass
+
+
+class MemoizedHyperlinkedRelatedField(
+    MemoizedFieldMixin, HyperlinkedRelatedField
+):
+    pass
 
 
 class OwnerSerializer(HyperlinkedModelSerializer):
 
-    owner = SlugRelatedField(
+    owner = MemoizedSlugRelatedField(
         slug_field='username',
         queryset=User.objects.all(),
         allow_null=True,
@@ -41,12 +202,74 @@ class RecordSerializer(OwnerSerializer):
         model = Record
         read_only_fields = ('change_date', 'ordername',)
 
-    domain = HyperlinkedRelatedField(
+    domain = MemoizedHyperlinkedRelatedField(
         queryset=Domain.objects.all(),
         view_name='domain-detail',
         validators=[DomainForRecordValidator()],
+        required=False,
+        help_text=(
+            'The closest domain of the name of the record if not given'
+        ),
     )
 
+    def validate(self, attrs):
+        if self.instance is None and 'domain' not in attrs:
+            attrs['domain'] = self.get_closest_domain(attrs.get('name', ''))
+        return super().validate(attrs)
+
+    def get_closest_domain(self, name):
+        """The domain with the longest name the record name ends with. Found
+        with a query by the names (not in ``all_domains``), as the index of
+        this process can miss domains just created by other processes and
+        the record would be stored in the parent domain."""
+        name = name.lower()
+        domain = closest_domain([name] + parent_names(name))
+        if domain is None:
+            raise ValidationError({
+                'domain': ['No domain found for {}'.format(name)],
+            })
+        # Lists of records are validated with a single serializer instance
+        memo = self.__dict__.setdefault('_closest_domains', {})
+        if domain.pk not in memo:
+            try:
+                DomainForRecordValidator()(domain)
+                memo[domain.pk] = domain
+            except DjangoValidationError as e:
+                memo[domain.pk] = ValidationError({'domain': e.messages})
+        if isinstance(memo[domain.pk], ValidationError):
+            raise ValidationError(memo[domain.pk].detail)
+        return memo[domain.pk]
+
+
+class BulkRecordSerializer(RecordSerializer):
+    """Serializer for records created in bulk. Uniqueness and conflicts are
+    checked for the whole batch by ``powerdns.bulk.validate_records``."""
+
+    class Meta(RecordSerializer.Meta):
+        validators = []
+
+
+class RecordUpdateSerializer(HyperlinkedModelSerializer):
+    """Fields set on all the records matching the filters of a list. Only
+    ``powerdns.bulk.UPDATE_FIELDS`` can be set this way."""
+
+    class Meta:
+        model = Record
+        fields = UPDATE_FIELDS
+
+    def to_internal_value(self, data):
+        unknown = set(data) - set(self.fields)
+        if unknown:
+            raise ValidationError({
+                field: ['Can not be changed for many records at once']
+                for field in unknown
+            })
+        if not data:
+            raise ValidationError({
+                api_settings.NON_FIELD_ERRORS_KEY: ['No fields given'],
+            })
+        return super().to_internal_value(data)
+
 
 class CryptoKeySerializer(HyperlinkedModelSerializer):
 
@@ -0,0 +1,66 @@
+"""Coalesced SOA serial updates.
+
+Every change in a zone must change its serial, which PowerDNS derives from
+the ``change_date`` of the SOA record. Instead of saving the SOA after every
+changed record, the ids of changed domains are collected during
+a transaction and the SOA records of all of them are updated with a single
+``UPDATE`` when the transaction commits. Outside of transactions the update
+happens immediately.
+"""
+
+import time
+
+from django.db import connections, router, transaction
+
+from powerdns.utils import chunks
+
+
+class SerialBump(object):
+    """``on_commit`` callback updating the SOA records of a set of
+    domains"""
+
+    def __init__(self, using):
+        self.using = using
+        self.domain_ids = set()
+
+    def __call__(self):
+        from powerdns.models.powerdns import Record
+        change_date = int(time.time())
+        for ids_chunk in chunks(sorted(self.domain_ids)):
+            Record.objects.using(self.using).filter(
+                type='SOA', domain_id__in=ids_chunk,
+            ).update(change_date=change_date)
+
+
+def _pending_bump(connection):
+    """The SerialBump registered in the current transaction if any. Callbacks
+    of rolled back transactions (and savepoints) are discarded by django, so
+    the list of callbacks is the only reliable place to look for it."""
+    for _, callback in reversed(connection.run_on_commit):
+        if isinstance(callback, SerialBump):
+            return callback
+    return None
+
+
+def bump_serials(domain_ids, using=None):
+    """Update the SOA records of given domains, so their serials change, once
+    the current transaction is committed"""
+    from powerdns.models.powerdns import Record
+    domain_ids = {domain_id for domain_id in domain_ids if domain_id}
+    if not domain_ids:
+        return
+    using = using or router.db_for_write(Record)
+    connection = connections[using]
+    bump = _pending_bump(connection) if connection.in_atomic_block else None
+    if bump is None:
+        bump = SerialBump(using)
+        bump.domain_ids.update(domain_ids)
+        transaction.on_commit(bump, using=using)
+    else:
+        bump.domain_ids.update(domain_ids)
+
+
+def bump_serial(domain_id, using=None):
+    """Update the SOA record of a domain once the current transaction is
+    committed"""
+    bump_serials([domain_id], using=using)
@@ -0,0 +1,224 @@
+"""Benchmarks. They are not collected with the other tests and have to be
+run explicitly, e.g.::
+
+    $ python manage.py test powerdns.tests.benchmarks -s
+
+NSEC3 hashes can also be checked against PowerDNS. Point ``PDNSSEC_ZONE`` to
+an NSEC3 zone served by a local PowerDNS and ``PDNSSEC_NSEC3PARAM`` to its
+NSEC3PARAM (``PDNSSEC`` selects the binary, ``pdnssec`` by default)::
+
+    $ PDNSSEC_ZONE=example.com PDNSSEC_NSEC3PARAM='1 0 10 ab12' \\
+        python manage.py test powerdns.tests.benchmarks -s
+"""
+
+import os
+import shutil
+import subprocess
+import time
+import tracemalloc
+from unittest import skipUnless
+
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.test import SimpleTestCase, TestCase
+
+from powerdns import nsec3
+from powerdns.bulk import insert_records
+from powerdns.models.powerdns import Record
+from powerdns.pagination import encode_cursor
+from powerdns.tests.utils import DomainFactory, user_client
+
+
+PDNSSEC = os.environ.get('PDNSSEC', 'pdnssec')
+PDNSSEC_ZONE = os.environ.get('PDNSSEC_ZONE')
+PDNSSEC_NSEC3PARAM = os.environ.get('PDNSSEC_NSEC3PARAM', '1 0 10 ab12')
+
+
+def report(name, count, seconds):
+    print('{}: {} in {:.3f}s, {:.0f}/s'.format(
+        name, count, seconds, count / seconds,
+    ))
+
+
+def zone_names(zone, count):
+    return ['host{}.{}'.format(i, zone) for i in range(count)]
+
+
+class NSEC3Benchmark(SimpleTestCase):
+    """Hashes per second of the NSEC3 hashing engine"""
+
+    count = 50000
+
+    def setUp(self):
+        self.param = nsec3.parse_nsec3param(PDNSSEC_NSEC3PARAM)
+        self.names = zone_names(PDNSSEC_ZONE or 'example.com', self.count)
+        nsec3.hash_name.cache_clear()
+
+    def test_hash_name(self):
+        start = time.perf_counter()
+        for name in self.names:
+            nsec3.hash_name(name, self.param)
+        report('hash_name', self.count, time.perf_counter() - start)
+        start = time.perf_counter()
+        # The most recently hashed names are still memoized
+        recent = self.names[-nsec3.CACHE_SIZE:]
+        for name in recent:
+            nsec3.hash_name(name, self.param)
+        report(
+            'hash_name (memoized)', len(recent), time.perf_counter() - start,
+        )
+
+    def test_hash_names(self):
+        start = time.perf_counter()
+        nsec3.hash_names(self.names, self.param)
+        report('hash_names', self.count, time.perf_counter() - start)
+
+    @skipUnless(
+        PDNSSEC_ZONE and shutil.which(PDNSSEC),
+        'PDNSSEC_ZONE not set or {} not found'.format(PDNSSEC),
+    )
+    def test_pdnssec(self):
+        names = self.names[:100]
+        start = time.perf_counter()
+        expected = [
+            subprocess.check_output(
+                [PDNSSEC, 'hash-zone-record', PDNSSEC_ZONE, name],
+                universal_newlines=True,
+            ).split()[-1]
+            for name in names
+        ]
+        report(PDNSSEC, len(names), time.perf_counter() - start)
+        self.assertEqual(nsec3.hash_names(names, self.param), expected)
+
+
+class PaginationBenchmark(TestCase):
+    """Time per page of records at the start and deep into the table, with
+    offsets and cursors"""
+
+    count = 50000
+    limit = 100
+    repeat = 10
+
+    @classmethod
+    def setUpTestData(cls):
+        domain = DomainFactory(
+            name='example.com', template=None, reverse_template=None,
+        )
+        insert_records([
+            Record(domain=domain, name=name, type='TXT', content='text')
+            for name in zone_names('example.com', cls.count)
+        ])
+
+    def setUp(self):
+        self.client = user_client(User.objects.create_superuser(
+            'user', 'user@example.com', 'password'
+        ))
+
+    def time_page(self, name, params):
+        start = time.perf_counter()
+        for _ in range(self.repeat):
+            response = self.client.get(reverse('record-list'), params)
+            self.assertEqual(len(response.data['results']), self.limit)
+        seconds = time.perf_counter() - start
+        report(name, self.repeat, seconds)
+        return seconds
+
+    def test_offset(self):
+        self.time_page('first page (offset)', {'limit': self.limit})
+        self.time_page('last page (offset)', {
+            'limit': self.limit, 'offset': self.count - self.limit,
+        })
+
+    def test_cursor(self):
+        first = self.time_page('first page (cursor)', {
+            'limit': self.limit, 'cursor': '',
+        })
+        last = Record.objects.order_by(
+            '-name', '-type', '-id',
+        ).values_list('name', 'type', 'id')[self.limit]
+        last = self.time_page('last page (cursor)', {
+            'limit': self.limit, 'cursor': encode_cursor(list(last)),
+        })
+        # Both pages are read through the (name, type) index
+        self.assertLess(last, first * 3)
+
+
+class ValuesBenchmark(TestCase):
+    """Rows per second of record lists serialized from model instances and
+    from ``values()`` (``?fields=``, ``?format=flat``)"""
+
+    count = 5000
+    limit = 1000
+    repeat = 5
+
+    @classmethod
+    def setUpTestData(cls):
+        domain = DomainFactory(
+            name='example.com', template=None, reverse_template=None,
+        )
+        insert_records([
+            Record(domain=domain, name=name, type='A', content='192.168.1.1')
+            for name in zone_names('example.com', cls.count)
+        ])
+
+    def setUp(self):
+        self.client = user_client(User.objects.create_superuser(
+            'user', 'user@example.com', 'password'
+        ))
+
+    def time_list(self, name, params):
+        params = dict(params, limit=self.limit, cursor='')
+        start = time.perf_counter()
+        for _ in range(self.repeat):
+            response = self.client.get(reverse('record-list'), params)
+            self.assertEqual(len(response.data['results']), self.limit)
+        report(name, self.repeat * self.limit, time.perf_counter() - start)
+
+    def test_lists(self):
+        fields = 'url,name,type,content,ttl,domain'
+        self.time_list('records (serializer)', {'format': 'json'})
+        self.time_list('records (flat)', {'format': 'flat'})
+        self.time_list('records ({})'.format(fields), {'fields': fields})
+        self.time_list('records ({}, flat)'.format(fields), {
+            'fields': fields, 'format': 'flat',
+        })
+
+
+class ExportBenchmark(TestCase):
+    """Rows per second and peak memory of the NDJSON export, which should
+    be the same for any number of records"""
+
+    counts = (2000, 20000)
+
+    def setUp(self):
+        self.domain = DomainFactory(
+            name='example.com', template=None, reverse_template=None,
+        )
+        self.client = user_client(User.objects.create_superuser(
+            'user', 'user@example.com', 'password'
+        ))
+
+    def test_export(self):
+        names = zone_names('example.com', max(self.counts))
+        inserted = 0
+        for count in self.counts:
+            insert_records([
+                Record(
+                    domain=self.domain, name=name, type='A',
+                    content='192.168.1.1',
+                )
+                for name in names[inserted:count]
+            ])
+            inserted = count
+            tracemalloc.start()
+            start = time.perf_counter()
+            response = self.client.get('/api/records/export.ndjson')
+            lines = sum(
+                chunk.count(b'\n') for chunk in response.streaming_content
+            )
+            seconds = time.perf_counter() - start
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            self.assertEqual(lines, count)
+            report('export', count, seconds)
+            print('peak memory: {:.1f} MiB'.format(peak / 2 ** 20))
@@ -0,0 +1,205 @@
+"""Tests for deferred side effects of record writes"""
+
+from django.db import connection, transaction
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+import powerdns
+from powerdns.models.powerdns import CryptoKey, Record
+from powerdns.tests.utils import (
+    DomainFactory,
+    DomainTemplateFactory,
+    RecordFactory,
+    RecordTemplateFactory,
+    assert_does_exist,
+    assert_not_exists,
+)
+from powerdns.utils import AutoPtrOptions
+
+
+class TestBatch(TestCase):
+    """Tests for powerdns.batch()"""
+
+    def setUp(self):
+        reverse_template = DomainTemplateFactory(name='reverse')
+        RecordTemplateFactory(
+            type='SOA',
+            name='{domain-name}',
+            content=(
+                'ns1.{domain-name} hostmaster.{domain-name} '
+                '0 43200 600 1209600 600'
+            ),
+            domain_template=reverse_template,
+        )
+        self.domain = DomainFactory(
+            name='example.com',
+            template=None,
+            reverse_template=reverse_template,
+        )
+
+    def create(self, i, **kwargs):
+        kwargs.setdefault('auto_ptr', AutoPtrOptions.ALWAYS)
+        return Record.objects.create(
+            domain=self.domain,
+            type='A',
+            name='host{}.example.com'.format(i),
+            content='192.168.{}.{}'.format(i // 250, i % 250 + 1),
+            **kwargs
+        )
+
+    def test_ptrs_deferred(self):
+        """PTRs are created when the batch ends"""
+        with powerdns.batch():
+            record = self.create(1)
+            assert_not_exists(Record, type='PTR')
+        assert_does_exist(
+            Record,
+            type='PTR',
+            name='2.0.168.192.in-addr.arpa',
+            content='host1.example.com',
+            depends_on=record,
+        )
+
+    def test_ptr_changes(self):
+        """PTRs of changed and deleted records are handled"""
+        changed = self.create(1)
+        deleted = self.create(2)
+        with powerdns.batch():
+            changed.content = '192.168.0.10'
+            changed.save()
+            deleted.delete()
+            never = self.create(3, auto_ptr=AutoPtrOptions.NEVER)
+        assert_does_exist(
+            Record, name='10.0.168.192.in-addr.arpa', depends_on=changed,
+        )
+        assert_not_exists(Record, name='2.0.168.192.in-addr.arpa')
+        assert_not_exists(Record, name='3.0.168.192.in-addr.arpa')
+        assert_not_exists(Record, depends_on=never)
+
+    def test_ordernames(self):
+        """Ordernames are generated when the batch ends"""
+        CryptoKey.objects.create(domain=self.domain, flags=257, active=True)
+        with powerdns.batch():
+            record = self.create(1, auto_ptr=AutoPtrOptions.NEVER)
+            self.assertIsNone(
+                Record.objects.get(pk=record.pk).ordername
+            )
+        self.assertEqual(Record.objects.get(pk=record.pk).ordername, 'host1')
+
+    def test_queries(self):
+        """Writes in a batch take a query per record and a constant number
+        of queries on exit"""
+        def count_queries(count, start):
+            with CaptureQueriesContext(connection) as context:
+                with powerdns.batch():
+                    for i in range(start, start + count):
+                        self.create(i)
+            return len(context.captured_queries) - count
+        # Warm up: create the reverse domain
+        count_queries(1, start=200)
+        self.assertEqual(count_queries(5, start=1), count_queries(50, 100))
+
+
+class TestBatchSerial(TransactionTestCase):
+    """Tests for serial updates in batches"""
+
+    def test_serial(self):
+        """SOA is updated once when the batch ends"""
+        domain = DomainFactory(
+            name='example.com', template=None, reverse_template=None,
+        )
+        soa = RecordFactory(
+            domain=domain,
+            type='SOA',
+            name='example.com',
+            content=(
+                'ns1.example.com hostmaster.example.com '
+                '0 43200 600 1209600 600'
+            ),
+        )
+        Record.objects.filter(pk=soa.pk).update(change_date=1)
+        with CaptureQueriesContext(connection) as context:
+            with powerdns.batch():
+                for i in range(3):
+                    RecordFactory(
+                        domain=domain,
+                        type='CNAME',
+                        name='www{}.example.com'.format(i),
+                        content='example.com',
+                    )
+                self.assertEqual(
+                    Record.objects.get(pk=soa.pk).change_date, 1,
+                )
+        self.assertGreater(Record.objects.get(pk=soa.pk).change_date, 1)
+        soa_updates = [
+            query for query in context.captured_queries
+            if query['sql'].startswith('UPDATE') and "'SOA'" in query['sql']
+        ]
+        self.assertEqual(len(soa_updates), 1)
+
+
+class TestBatchRollback(TransactionTestCase):
+    """Tests for batches without a transaction"""
+
+    def test_rolled_back(self):
+        """Work of records rolled back in the block is not done"""
+        reverse_template = DomainTemplateFactory(name='reverse')
+        domain = DomainFactory(
+            name='example.com', template=None,
+            reverse_template=reverse_template,
+        )
+        with self.assertRaises(ZeroDivisionError):
+            with powerdns.batch():
+                saved = RecordFactory(
+                    domain=domain,
+                    type='A',
+                    name='www.example.com',
+                    content='10.1.2.3',
+                    auto_ptr=AutoPtrOptions.ALWAYS,
+                )
+                with transaction.atomic():
+                    RecordFactory(
+                        domain=domain,
+                        type='A',
+                        name='mail.example.com',
+                        content='10.1.2.4',
+                        auto_ptr=AutoPtrOptions.ALWAYS,
+                    )
+                    1 / 0
+        assert_does_exist(
+            Record, name='3.2.1.10.in-addr.arpa', depends_on=saved,
+        )
+        assert_not_exists(Record, name='4.2.1.10.in-addr.arpa')
+        assert_not_exists(Record, name='mail.example.com')
+
+    def test_rolled_back_caught(self):
+        """Also if the exception is caught in the block"""
+        reverse_template = DomainTemplateFactory(name='reverse')
+        domain = DomainFactory(
+            name='example.com', template=None,
+            reverse_template=reverse_template,
+        )
+        with powerdns.batch():
+            try:
+                with transaction.atomic():
+                    RecordFactory(
+                        domain=domain,
+                        type='A',
+                        name='mail.example.com',
+                        content='10.1.2.4',
+                        auto_ptr=AutoPtrOptions.ALWAYS,
+                    )
+                    1 / 0
+            except ZeroDivisionError:
+                pass
+            saved = RecordFactory(
+                domain=domain,
+                type='A',
+                name='www.example.com',
+                content='10.1.2.3',
+                auto_ptr=AutoPtrOptions.ALWAYS,
+            )
+        assert_does_exist(
+            Record, name='3.2.1.10.in-addr.arpa', depends_on=saved,
+        )
+        assert_not_exists(Record, name='4.2.1.10.in-addr.arpa')
@@ -0,0 +1,306 @@
+"""Tests for bulk record creation, updates and deletion"""
+
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import Client, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
+from powerdns.models.authorisations import Authorisation
+from powerdns.models.powerdns import Record
+from powerdns.models.requests import DeleteRequest
+from powerdns.tests.utils import (
+    DomainFactory,
+    DomainTemplateFactory,
+    RecordFactory,
+    RecordTemplateFactory,
+    assert_does_exist,
+    assert_not_exists,
+    user_client,
+)
+from powerdns.utils import AutoPtrOptions
+
+
+class TestBulkCreate(TestCase):
+    """Tests for /api/records/bulk/"""
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(
+            'user', 'user@example.com', 'password'
+        )
+        self.client = user_client(self.user)
+        reverse_template = DomainTemplateFactory(name='reverse')
+        RecordTemplateFactory(
+            type='SOA',
+            name='{domain-name}',
+            content=(
+                'ns1.{domain-name} hostmaster.{domain-name} '
+                '0 43200 600 1209600 600'
+            ),
+            domain_template=reverse_template,
+        )
+        self.domain = DomainFactory(
+            name='example.com',
+            template=None,
+            reverse_template=reverse_template,
+        )
+        self.domain_url = reverse(
+            'domain-detail', kwargs={'pk': self.domain.pk}
+        )
+
+    def post(self, items):
+        return self.client.post(
+            reverse('record-bulk'), items, format='json',
+        )
+
+    def a_records(self, count, start=1):
+        return [
+            {
+                'domain': self.domain_url,
+                'type': 'A',
+                'name': 'host{}.example.com'.format(i),
+                'content': '192.168.{}.{}'.format(i // 250, i % 250 + 1),
+                'auto_ptr': AutoPtrOptions.ALWAYS.id,
+            }
+            for i in range(start, start + count)
+        ]
+
+    def test_create(self):
+        """Records and their PTRs are created"""
+        response = self.post(self.a_records(3))
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(len(response.data), 3)
+        self.assertEqual(response.data[0]['owner'], 'user')
+        record = Record.objects.get(name='host1.example.com')
+        self.assertEqual(record.number, 3232235522)
+        assert_does_exist(
+            Record,
+            type='PTR',
+            name='2.0.168.192.in-addr.arpa',
+            content='host1.example.com',
+            depends_on=record,
+        )
+        assert_does_exist(Record, type='SOA', name='0.168.192.in-addr.arpa')
+
+    def test_item_errors(self):
+        """Errors are reported per item and nothing is created"""
+        items = self.a_records(3)
+        items[1]['content'] = 'not-an-ip'
+        response = self.post(items)
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.data[0], {})
+        self.assertIn('content', response.data[1])
+        self.assertEqual(response.data[2], {})
+        assert_not_exists(Record, name='host1.example.com')
+
+    def test_conflicts(self):
+        """Conflicts with existing records and within the batch are
+        reported"""
+        RecordFactory(
+            domain=self.domain,
+            type='CNAME',
+            name='host1.example.com',
+            content='www.example.com',
+        )
+        items = self.a_records(2)
+        items.append(dict(items[1]))
+        response = self.post(items)
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('non_field_errors', response.data[0])
+        self.assertEqual(response.data[1], {})
+        self.assertIn('non_field_errors', response.data[2])
+
+    def test_constant_queries(self):
+        """The number of queries doesn't depend on the number of records"""
+        def count_queries(items):
+            with CaptureQueriesContext(connection) as context:
+                response = self.post(items)
+            self.assertEqual(response.status_code, 201)
+            return len(context.captured_queries)
+        # Warm up: create the reverse domain
+        self.post(self.a_records(1, start=200))
+        self.assertEqual(
+            count_queries(self.a_records(5, start=1)),
+            count_queries(self.a_records(50, start=100)),
+        )
+
+
+class TestBulkChanges(TransactionTestCase):
+    """Tests for PATCH and DELETE of /api/records/ (committed, as serials
+    are bumped on commit)"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'user', 'user@example.com', 'password'
+        )
+        self.client = user_client(self.user)
+        self.domain = DomainFactory(
+            name='example.com', template=None, reverse_template=None,
+        )
+        self.soa = RecordFactory(
+            domain=self.domain,
+            type='SOA',
+            name='example.com',
+            content=(
+                'ns1.example.com hostmaster.example.com '
+                '0 43200 600 1209600 600'
+            ),
+            owner=self.user,
+        )
+        reverse_domain = DomainFactory(
+            name='1.168.192.in-addr.arpa', template=None,
+            reverse_template=None,
+        )
+        self.reverse_soa = RecordFactory(
+            domain=reverse_domain,
+            type='SOA',
+            name='1.168.192.in-addr.arpa',
+            content=(
+                'ns1.example.com hostmaster.example.com '
+                '0 43200 600 1209600 600'
+            ),
+        )
+        for i in range(1, 4):
+            RecordFactory(
+                domain=self.domain,
+                type='A',
+                name='host{}.example.com'.format(i),
+                content='192.168.1.{}'.format(i),
+                owner=self.user,
+                auto_ptr=AutoPtrOptions.ONLY_IF_DOMAIN,
+            )
+        Record.objects.filter(type='SOA').update(change_date=1)
+        self.url = reverse('record-list') + '?domain={}&type=A'.format(
+            self.domain.pk,
+        )
+
+    def serials(self):
+        return [
+            Record.objects.get(pk=soa.pk).change_date
+            for soa in (self.soa, self.reverse_soa)
+        ]
+
+    def test_update(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.patch(
+                self.url, {'ttl': 300}, format='json',
+            )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'count': 3})
+        self.assertEqual(
+            set(Record.objects.filter(
+                domain=self.domain, type='A',
+            ).values_list('ttl', flat=True)),
+            {300},
+        )
+        self.assertEqual(Record.objects.get(pk=self.soa.pk).ttl, 3600)
+        updates = [
+            query['sql'] for query in context.captured_queries
+            if query['sql'].startswith('UPDATE')
+        ]
+        # The records and the SOA
+        self.assertEqual(len(updates), 2)
+        serial, reverse_serial = self.serials()
+        self.assertGreater(serial, 1)
+        self.assertEqual(reverse_serial, 1)
+
+    def test_dry_run(self):
+        response = self.client.patch(
+            self.url + '&dry_run=true', {'ttl': 300}, format='json',
+        )
+        self.assertEqual(response.data, {'count': 3})
+        response = self.client.delete(self.url + '&dry_run=true')
+        self.assertEqual(response.data, {'count': 3})
+        self.assertFalse(Record.objects.filter(ttl=300).exists())
+        self.assertEqual(Record.objects.count(), 8)
+        self.assertEqual(self.serials(), [1, 1])
+
+    def test_delete(self):
+        """Records are deleted together with their PTRs"""
+        response = self.client.delete(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {'count': 3})
+        self.assertEqual(
+            set(Record.objects.values_list('type', flat=True)), {'SOA'},
+        )
+        self.assertTrue(all(serial > 1 for serial in self.serials()))
+
+    def test_delete_authorisations(self):
+        """Authorisations and delete requests of the records are deleted"""
+        other = User.objects.create_user(
+            'other', 'other@example.com', 'password'
+        )
+        record = Record.objects.get(name='host1.example.com')
+        ptr = Record.objects.get(depends_on=record)
+        for target in (record, ptr, self.soa):
+            Authorisation.objects.create(
+                owner=self.user, authorised=other, target=target,
+            )
+            DeleteRequest.objects.create(owner=other, target=target)
+        response = self.client.delete(self.url)
+        self.assertEqual(response.status_code, 200)
+        for model in (Authorisation, DeleteRequest):
+            self.assertEqual(
+                [object_.target_id for object_ in model.objects.all()],
+                [self.soa.pk],
+            )
+
+    def test_not_updatable(self):
+        response = self.client.patch(
+            self.url, {'ttl': 300, 'content': '10.0.0.1'}, format='json',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('content', response.data)
+        response = self.client.patch(self.url, {}, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_filters_required(self):
+        response = self.client.delete(
+            reverse('record-list') + '?foo=bar',
+        )
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(Record.objects.count(), 8)
+
+    def test_permissions(self):
+        """All the records matched have to be editable"""
+        other = RecordFactory(
+            domain=self.domain,
+            type='A',
+            name='other.example.com',
+            content='192.168.1.10',
+            auto_ptr=AutoPtrOptions.NEVER,
+        )
+        response = self.client.patch(self.url, {'ttl': 300}, format='json')
+        self.assertEqual(response.status_code, 403)
+        self.assertFalse(Record.objects.filter(ttl=300).exists())
+        Authorisation.objects.create(
+            owner=self.user, authorised=self.user, target=other,
+        )
+        response = self.client.patch(self.url, {'ttl': 300}, format='json')
+        self.assertEqual(response.data, {'count': 4})
+
+    def test_admin_actions(self):
+        self.user.is_staff = True
+        self.user.save()
+        client = Client()
+        client.login(username='user', password='password')
+        records = Record.objects.filter(type='A', domain=self.domain)
+        response = client.post(
+            reverse('admin:powerdns_record_changelist'),
+            {
+                'action': 'disable_records',
+                '_selected_action': [record.pk for record in records],
+            },
+        )
+        self.assertEqual(response.status_code, 302)
+        self.assertTrue(all(record.disabled for record in records.all()))
+        self.assertGreater(self.serials()[0], 1)
+        # The reverse SOA isn't editable
+        client.post(
+            reverse('admin:powerdns_record_changelist'),
+            {
+                'action': 'delete_selected_records',
+                '_selected_action': [self.soa.pk, self.reverse_soa.pk],
+            },
+        )
+        self.assertEqual(Record.objects.filter(type='SOA').count(), 2)
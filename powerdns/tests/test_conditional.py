@@ -0,0 +1,130 @@
+"""Tests for ETags and conditional requests"""
+
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from powerdns.models.powerdns import Domain, Record
+from powerdns.tests.utils import DomainFactory, RecordFactory, user_client
+from powerdns.utils import AutoPtrOptions
+
+
+class TestConditionalRequests(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(
+            'user', 'user@example.com', 'password'
+        )
+        self.client = user_client(self.user)
+        self.domain = DomainFactory(
+            name='example.com', template=None, reverse_template=None,
+        )
+        self.soa = RecordFactory(
+            domain=self.domain,
+            name='example.com',
+            type='SOA',
+            content='ns1.example.com hostmaster.example.com 0 43200 600 '
+                    '1209600 600',
+        )
+        self.record = self.create_record('www')
+        self.record_url = reverse('record-detail', kwargs={
+            'pk': self.record.pk,
+        })
+        self.list_url = reverse('record-list') + '?domain={}'.format(
+            self.domain.pk,
+        )
+
+    def create_record(self, name):
+        return RecordFactory(
+            domain=self.domain,
+            name='{}.example.com'.format(name),
+            type='A',
+            content='192.168.1.1',
+            auto_ptr=AutoPtrOptions.NEVER,
+        )
+
+    def get(self, url, etag=None):
+        if etag is None:
+            return self.client.get(url)
+        return self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+    def test_detail(self):
+        """Unchanged objects aren't sent again"""
+        response = self.get(self.record_url)
+        self.assertEqual(response.status_code, 200)
+        self.assertIn('Last-Modified', response)
+        etag = response['ETag']
+        response = self.get(self.record_url, etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response['ETag'], etag)
+        self.assertFalse(response.content)
+        self.record.content = '192.168.1.2'
+        self.record.save()
+        self.assertEqual(self.get(self.record_url, etag).status_code, 200)
+
+    def test_list(self):
+        """Lists change when objects are added, changed or removed"""
+        etag = self.get(self.list_url)['ETag']
+        self.assertEqual(self.get(self.list_url, etag).status_code, 304)
+        record = self.create_record('mail')
+        response = self.get(self.list_url, etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 3)
+        etag = response['ETag']
+        record.delete()
+        response = self.get(self.list_url, etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        # Serial bumps are done with UPDATEs
+        Record.objects.filter(pk=self.soa.pk).update(change_date=1)
+        self.assertEqual(self.get(self.list_url, etag).status_code, 200)
+
+    def test_other_list(self):
+        """Lists of other domains don't change"""
+        other = DomainFactory(
+            name='example.org', template=None, reverse_template=None,
+        )
+        url = reverse('record-list') + '?domain={}'.format(other.pk)
+        etag = self.get(url)['ETag']
+        self.create_record('mail')
+        self.assertEqual(self.get(url, etag).status_code, 304)
+
+    def test_domain_serial(self):
+        """ETags of domains change with their serials"""
+        url = reverse('domain-detail', kwargs={'pk': self.domain.pk})
+        etag = self.get(url)['ETag']
+        self.assertEqual(self.get(url, etag).status_code, 304)
+        Record.objects.filter(pk=self.soa.pk).update(change_date=1)
+        self.assertEqual(self.get(url, etag).status_code, 200)
+
+    def test_domain_updated_by_powerdns(self):
+        """ETags of domains and their lists change with the notified serials
+        and checks written by PowerDNS"""
+        url = reverse('domain-detail', kwargs={'pk': self.domain.pk})
+        list_url = reverse('domain-list')
+        for field, value in [('notified_serial', 1), ('last_check', 2)]:
+            etag = self.get(url)['ETag']
+            list_etag = self.get(list_url)['ETag']
+            Domain.objects.filter(pk=self.domain.pk).update(**{field: value})
+            self.assertEqual(self.get(url, etag).status_code, 200)
+            self.assertEqual(self.get(list_url, list_etag).status_code, 200)
+
+    def test_if_match(self):
+        """Changed objects are not overwritten"""
+        etag = self.get(self.record_url)['ETag']
+        response = self.client.patch(
+            self.record_url, {'content': '192.168.1.2'}, HTTP_IF_MATCH=etag,
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertNotEqual(response['ETag'], etag)
+        response = self.client.patch(
+            self.record_url, {'content': '192.168.1.3'}, HTTP_IF_MATCH=etag,
+        )
+        self.assertEqual(response.status_code, 412)
+        response = self.client.delete(self.record_url, HTTP_IF_MATCH=etag)
+        self.assertEqual(response.status_code, 412)
+        self.assertEqual(
+            Record.objects.get(pk=self.record.pk).content, '192.168.1.2',
+        )
+        response = self.client.delete(self.record_url, HTTP_IF_MATCH='*')
+        self.assertEqual(response.status_code, 204)
@@ -0,0 +1,145 @@
+"""Tests for DNSSEC mode detection and caching"""
+
+from unittest import mock
+
+from django.core.cache import cache
+from django.db import connection, transaction
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from powerdns.dnssec import (
+    UNSIGNED,
+    DNSSECMode,
+    DNSSECModeCache,
+    dnssec_modes,
+)
+from powerdns.models.powerdns import CryptoKey, DomainMetadata, Record
+from powerdns.tests.utils import DomainFactory, RecordFactory, RecordTestCase
+from powerdns.utils import AutoPtrOptions
+
+
+class TestDNSSECModeCache(RecordTestCase):
+    """Tests for the per-domain DNSSEC mode cache"""
+
+    def setUp(self):
+        super(TestDNSSECModeCache, self).setUp()
+        self.record = RecordFactory(
+            domain=self.domain,
+            type='A',
+            name='www.example.com',
+            content='192.168.1.1',
+            auto_ptr=AutoPtrOptions.NEVER,
+        )
+
+    def test_unsigned_no_dnssec_queries(self):
+        """Saving a record in an unsigned zone doesn't query DNSSEC tables"""
+        with CaptureQueriesContext(connection) as context:
+            self.record.ttl = 600
+            self.record.save()
+        for query in context.captured_queries:
+            self.assertNotIn('cryptokeys', query['sql'])
+            self.assertNotIn('domainmetadata', query['sql'])
+        self.assertIsNone(self.record.ordername)
+
+    def test_nsec_after_adding_key(self):
+        """Adding a crypto key switches the domain to NSEC mode"""
+        CryptoKey.objects.create(domain=self.domain, flags=257, active=True)
+        self.record.save()
+        self.assertEqual(
+            Record.objects.get(pk=self.record.pk).ordername,
+            'www',
+        )
+
+    def test_nsec3_narrow(self):
+        """NSEC3 narrow mode leaves ordername empty"""
+        CryptoKey.objects.create(domain=self.domain, flags=257, active=True)
+        DomainMetadata.objects.create(
+            domain=self.domain, kind='NSEC3PARAM', content='1 0 1 ab',
+        )
+        DomainMetadata.objects.create(
+            domain=self.domain, kind='NSEC3NARROW', content='1',
+        )
+        self.record.save()
+        self.assertEqual(Record.objects.get(pk=self.record.pk).ordername, '')
+
+    def test_unsigned_after_removing_key(self):
+        """Removing the crypto key brings the domain back to unsigned mode"""
+        key = CryptoKey.objects.create(
+            domain=self.domain, flags=257, active=True,
+        )
+        self.record.save()
+        key.delete()
+        self.record.save()
+        self.assertIsNone(Record.objects.get(pk=self.record.pk).ordername)
+
+    def test_per_process_cache_not_shared(self):
+        """The default per-process cache isn't used as the shared layer"""
+        self.assertIsNone(dnssec_modes.shared)
+
+
+class TestDNSSECModeTransactions(TransactionTestCase):
+    """Tests for the DNSSEC mode cache with committed and rolled back
+    changes"""
+
+    def setUp(self):
+        cache.clear()
+        # The default cache stands in for a cache shared by the processes
+        shared = mock.patch.object(
+            DNSSECModeCache,
+            'shared',
+            new_callable=mock.PropertyMock,
+            return_value=cache,
+        )
+        shared.start()
+        self.addCleanup(shared.stop)
+        self.domain = DomainFactory(
+            name='example.com', template=None, reverse_template=None,
+        )
+
+    def create_record(self, name):
+        return RecordFactory(
+            domain=self.domain,
+            type='A',
+            name='{}.example.com'.format(name),
+            content='192.168.1.1',
+            auto_ptr=AutoPtrOptions.NEVER,
+        )
+
+    def test_rolled_back(self):
+        """Modes read in a transaction that is rolled back aren't cached"""
+        with transaction.atomic():
+            CryptoKey.objects.create(
+                domain=self.domain, flags=257, active=True,
+            )
+            record = self.create_record('www')
+            self.assertEqual(record.ordername, 'www')
+            transaction.set_rollback(True)
+        self.assertIsNone(
+            cache.get(dnssec_modes.key_prefix + str(self.domain.pk))
+        )
+        self.assertIsNone(self.create_record('mail').ordername)
+
+    def test_cached_before_commit(self):
+        """Modes cached by other processes before the commit are forgotten"""
+        with transaction.atomic():
+            CryptoKey.objects.create(
+                domain=self.domain, flags=257, active=True,
+            )
+            # Read by another process
+            cache.set(
+                dnssec_modes.key_prefix + str(self.domain.pk),
+                DNSSECMode(UNSIGNED, None),
+            )
+        self.assertEqual(self.create_record('www').ordername, 'www')
+
+    @override_settings(
+        DNSAAS_DNSSEC_LOCAL_TTL=0,
+        DNSAAS_DNSSEC_CACHE_TIMEOUT=0,
+    )
+    def test_key_added_without_signals(self):
+        """Keys added outside of django are noticed when the modes expire"""
+        self.assertIsNone(self.create_record('www').ordername)
+        CryptoKey.objects.bulk_create([
+            CryptoKey(domain=self.domain, flags=257, active=True),
+        ])
+        self.assertEqual(self.create_record('mail').ordername, 'mail')
@@ -0,0 +1,174 @@
+"""Tests for the in-process indexes of domains"""
+
+from django.db import connection, transaction
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from powerdns.domain_index import all_domains, reverse_domains
+from powerdns.models.powerdns import Domain, Record
+from powerdns.tests.utils import (
+    DomainFactory,
+    DomainTemplateFactory,
+    assert_does_exist,
+    assert_not_exists,
+)
+from powerdns.utils import AutoPtrOptions
+
+
+class TestReverseDomainIndex(TransactionTestCase):
+    """Domains are committed in these tests, as the index treats
+    uncommitted ones differently"""
+
+    def setUp(self):
+        reverse_domains.clear()
+        self.domain = DomainFactory(
+            name='example.com',
+            template=None,
+            reverse_template=DomainTemplateFactory(name='reverse'),
+        )
+
+    def create(self, i, auto_ptr=AutoPtrOptions.ONLY_IF_DOMAIN):
+        return Record.objects.create(
+            domain=self.domain,
+            type='A',
+            name='host{}.example.com'.format(i),
+            content='192.168.1.{}'.format(i),
+            auto_ptr=auto_ptr,
+        )
+
+    def test_only_if_domain_no_queries(self):
+        """Existing reverse domains are found without loading the domains,
+        their ids are only confirmed"""
+        reverse = DomainFactory(name='1.168.192.in-addr.arpa', template=None)
+        self.create(1)
+        with CaptureQueriesContext(connection) as context:
+            record = self.create(2)
+        domain_queries = [
+            query['sql'] for query in context.captured_queries
+            if '"domains"' in query['sql']
+        ]
+        self.assertEqual(len(domain_queries), 1)
+        self.assertIn('IN (', domain_queries[0])
+        assert_does_exist(Record, depends_on=record, domain=reverse)
+
+    def test_stale_id(self):
+        """Domains changed by other processes aren't written to"""
+        reverse = DomainFactory(name='1.168.192.in-addr.arpa', template=None)
+        self.create(1)
+        # No signals, as if renamed by other process
+        Domain.objects.filter(pk=reverse.pk).update(name='other.in-addr.arpa')
+        record = self.create(2, auto_ptr=AutoPtrOptions.ALWAYS)
+        ptr = Record.objects.get(depends_on=record)
+        self.assertNotEqual(ptr.domain_id, reverse.pk)
+        self.assertEqual(ptr.domain.name, '1.168.192.in-addr.arpa')
+
+    @override_settings(DNSAAS_DOMAIN_INDEX_LOCAL_TTL=0)
+    def test_created_by_other_process(self):
+        """Without a shared cache, domains created by other processes are
+        noticed by counting the domains"""
+        self.create(1)
+        Domain.objects.bulk_create([Domain(name='1.168.192.in-addr.arpa')])
+        record = self.create(2)
+        assert_does_exist(
+            Record, depends_on=record, domain__name='1.168.192.in-addr.arpa',
+        )
+
+    def test_deleted_domain(self):
+        """Deleted domains are removed from the index"""
+        reverse = DomainFactory(name='1.168.192.in-addr.arpa', template=None)
+        self.create(1)
+        reverse.delete()
+        record = self.create(2)
+        assert_not_exists(Record, depends_on=record)
+
+    def test_rolled_back_domain(self):
+        """Domains created in rolled back transactions are ignored"""
+        self.create(1)
+        with transaction.atomic():
+            DomainFactory(name='1.168.192.in-addr.arpa', template=None)
+            transaction.set_rollback(True)
+        record = self.create(2)
+        assert_not_exists(Record, depends_on=record)
+
+    def test_created_concurrently(self):
+        """A domain missing from the index, but present in the database is
+        reused"""
+        self.create(1)
+        # No signals, as if the domain was created by other process
+        Domain.objects.bulk_create([Domain(name='1.168.192.in-addr.arpa')])
+        record = self.create(2, auto_ptr=AutoPtrOptions.ALWAYS)
+        assert_does_exist(
+            Record,
+            depends_on=record,
+            domain__name='1.168.192.in-addr.arpa',
+        )
+        self.assertEqual(
+            Domain.objects.filter(name='1.168.192.in-addr.arpa').count(), 1,
+        )
+
+
+class TestClosestDomain(TransactionTestCase):
+    """Tests for finding the closest domain of a name"""
+
+    def setUp(self):
+        all_domains.clear()
+        for name in ['example.com', 'b.example.com', 'a.b.c.example.com']:
+            DomainFactory(name=name, template=None, reverse_template=None)
+
+    def closest(self, name):
+        pk = all_domains.closest(name)
+        return pk and Domain.objects.get(pk=pk).name
+
+    def test_closest(self):
+        """The domain with the longest matching name is found"""
+        self.assertEqual(self.closest('x.b.example.com'), 'b.example.com')
+        self.assertEqual(self.closest('b.example.com'), 'b.example.com')
+        self.assertEqual(self.closest('b.c.example.com'), 'example.com')
+        self.assertEqual(
+            self.closest('x.a.b.c.example.com'), 'a.b.c.example.com',
+        )
+        self.assertIsNone(self.closest('example.org'))
+        self.assertIsNone(self.closest('com'))
+
+    def test_no_queries(self):
+        """Once loaded, the index is used without queries"""
+        all_domains.closest('example.com')
+        with CaptureQueriesContext(connection) as context:
+            for i in range(100):
+                all_domains.closest('host{}.x.b.example.com'.format(i))
+        self.assertEqual(len(context.captured_queries), 0)
+
+    def test_changes(self):
+        """Created, renamed and deleted domains are reflected"""
+        all_domains.closest('example.com')
+        domain = DomainFactory(
+            name='c.example.com', template=None, reverse_template=None,
+        )
+        self.assertEqual(self.closest('b.c.example.com'), 'c.example.com')
+        domain.name = 'd.example.com'
+        domain.save()
+        self.assertEqual(self.closest('b.c.example.com'), 'example.com')
+        self.assertEqual(self.closest('b.d.example.com'), 'd.example.com')
+        domain.delete()
+        self.assertEqual(self.closest('b.d.example.com'), 'example.com')
+
+    def test_unchanged_name(self):
+        """Saves not changing the name don't make the index reload"""
+        all_domains.closest('example.com')
+        domain = Domain.objects.get(name='b.example.com')
+        domain.remarks = 'Changed'
+        domain.save()
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.closest('x.b.example.com'), 'b.example.com')
+        # Only the one getting the name of the domain found
+        self.assertEqual(len(context.captured_queries), 1)
+
+    def test_committed_change(self):
+        """The index changed in place isn't reloaded on commit"""
+        all_domains.closest('example.com')
+        DomainFactory(
+            name='c.example.com', template=None, reverse_template=None,
+        )
+        with CaptureQueriesContext(connection) as context:
+            all_domains.closest('b.c.example.com')
+        self.assertEqual(len(context.captured_queries), 0)
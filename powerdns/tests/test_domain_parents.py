@@ -0,0 +1,146 @@
+"""Tests for the hierarchy of domains"""
+
+from io import StringIO
+
+from django.contrib.auth.models import User
+from django.core.exceptions import ValidationError
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from threadlocals.threadlocals import set_current_user
+
+from powerdns.models.powerdns import Domain, SubDomainValidator
+from powerdns.tests.utils import DomainFactory, user_client
+
+
+def make_domain(name, **kwargs):
+    return DomainFactory(
+        name=name, template=None, reverse_template=None, **kwargs
+    )
+
+
+class TestDomainParents(TestCase):
+    """Tests for maintaining the parent of domains"""
+
+    def parent_of(self, name):
+        parent = Domain.objects.get(name=name).parent
+        return parent and parent.name
+
+    def test_parent_set(self):
+        """The closest existing superdomain becomes the parent"""
+        make_domain('example.com')
+        make_domain('a.b.example.com')
+        self.assertEqual(self.parent_of('a.b.example.com'), 'example.com')
+        self.assertIsNone(self.parent_of('example.com'))
+
+    def test_adopt(self):
+        """A new domain adopts the subdomains it is closer to"""
+        make_domain('example.com')
+        make_domain('a.b.example.com')
+        make_domain('c.example.com')
+        make_domain('b.example.com')
+        self.assertEqual(self.parent_of('a.b.example.com'), 'b.example.com')
+        self.assertEqual(self.parent_of('c.example.com'), 'example.com')
+        self.assertEqual(self.parent_of('b.example.com'), 'example.com')
+
+    def test_adopt_orphans(self):
+        """A new domain adopts subdomains that had no parent"""
+        make_domain('a.example.com')
+        make_domain('example.com')
+        self.assertEqual(self.parent_of('a.example.com'), 'example.com')
+
+    def test_delete(self):
+        """The children of deleted domain are passed to its parent"""
+        make_domain('example.com')
+        middle = make_domain('b.example.com')
+        make_domain('a.b.example.com')
+        middle.delete()
+        self.assertEqual(self.parent_of('a.b.example.com'), 'example.com')
+
+    def test_rename(self):
+        """Renamed domain leaves its children and gets new ones"""
+        make_domain('example.com')
+        make_domain('example.org')
+        domain = make_domain('b.example.com')
+        make_domain('a.b.example.com')
+        make_domain('a.b.example.org')
+        domain.name = 'b.example.org'
+        domain.save()
+        self.assertEqual(self.parent_of('b.example.org'), 'example.org')
+        self.assertEqual(self.parent_of('a.b.example.com'), 'example.com')
+        self.assertEqual(self.parent_of('a.b.example.org'), 'b.example.org')
+
+    def test_command(self):
+        """The command fills the parents of all domains"""
+        make_domain('example.com')
+        make_domain('b.example.com')
+        make_domain('a.b.example.com')
+        Domain.objects.update(parent=None)
+        out = StringIO()
+        call_command('update_domain_parents', stdout=out)
+        self.assertEqual(out.getvalue().strip(), '2 domains updated')
+        self.assertEqual(self.parent_of('a.b.example.com'), 'b.example.com')
+        self.assertEqual(self.parent_of('b.example.com'), 'example.com')
+
+
+class TestSubDomainValidator(TestCase):
+    """Tests for checking the permissions to create subdomains"""
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            'user', 'user@example.com', 'password'
+        )
+        self.other = User.objects.create_user(
+            'other', 'other@example.com', 'password'
+        )
+        make_domain('example.com', owner=self.other)
+        make_domain('u.example.com', owner=self.user)
+        set_current_user(self.user)
+
+    def tearDown(self):
+        set_current_user(None)
+
+    def test_single_query(self):
+        """The closest superdomain is found in a single query"""
+        validator = SubDomainValidator()
+        with CaptureQueriesContext(connection) as context:
+            validator('a.b.c.d.u.example.com')
+        domain_queries = [
+            query for query in context.captured_queries
+            if 'FROM "domains"' in query['sql']
+        ]
+        self.assertEqual(len(domain_queries), 1)
+
+    def test_closest_decides(self):
+        """The owner of the closest superdomain decides"""
+        validator = SubDomainValidator()
+        validator('a.u.example.com')
+        with self.assertRaises(ValidationError):
+            validator('a.v.example.com')
+        validator('example.org')
+
+
+class TestChildrenView(TestCase):
+    """Tests for listing the children of a domain"""
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(
+            'user', 'user@example.com', 'password'
+        )
+        self.client = user_client(self.user)
+
+    def test_children(self):
+        domain = make_domain('example.com')
+        make_domain('b.example.com')
+        make_domain('c.example.com')
+        make_domain('a.b.example.com')
+        response = self.client.get(
+            reverse('domain-children', kwargs={'pk': domain.pk}),
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(child['name'] for child in response.data['results']),
+            ['b.example.com', 'c.example.com'],
+        )
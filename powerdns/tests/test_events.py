@@ -1,15 +1,25 @@
 # -*- encoding: utf-8 -*-
 
 
+from django.db import connection, transaction
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext
+
 from powerdns.models import Record
-from powerdns.tests.utils import RecordTestCase, RecordFactory
+from powerdns.tests.utils import DomainFactory, RecordFactory
 from powerdns.utils import AutoPtrOptions
 
 
-class TestSOASerialUpdate(RecordTestCase):
+class TestSOASerialUpdate(TransactionTestCase):
+    """Serials are updated when transactions are committed, so this can't
+    run in a TestCase"""
 
     def setUp(self):
-        super(TestSOASerialUpdate, self).setUp()
+        self.domain = DomainFactory(
+            name='example.com',
+            template=None,
+            reverse_template=None,
+        )
         self.soa_record = RecordFactory(
             domain=self.domain,
             type='SOA',
@@ -19,11 +29,6 @@ class TestSOASerialUpdate(RecordTestCase):
                 '0 43200 600 1209600 600'
             ),
         )
-        # Less than 1 second will elapse until the test runs, so we update
-        # this manually while circumventing save()
-        Record.objects.filter(pk=self.soa_record.pk).update(
-            change_date=1432720132
-        )
         self.a_record = RecordFactory(
             domain=self.domain,
             type='A',
@@ -38,6 +43,11 @@ class TestSOASerialUpdate(RecordTestCase):
             content='www.example.com',
             auto_ptr=AutoPtrOptions.NEVER,
         )
+        # Less than 1 second will elapse until the test runs, so we update
+        # this manually while circumventing save()
+        Record.objects.filter(pk=self.soa_record.pk).update(
+            change_date=1432720132
+        )
 
     def test_soa_update(self):
         """Test if SOA change_date is updated when a record is removed"""
@@ -45,3 +55,37 @@ class TestSOASerialUpdate(RecordTestCase):
         self.a_record.delete()
         new_serial = Record.objects.get(pk=self.soa_record.pk).change_date
         self.assertGreater(new_serial, old_serial)
+
+    def get_serial(self):
+        return Record.objects.get(pk=self.soa_record.pk).change_date
+
+    def test_soa_update_on_save(self):
+        """SOA change_date is updated when a record is created or changed"""
+        self.a_record.ttl = 600
+        self.a_record.save()
+        self.assertGreater(self.get_serial(), 1432720132)
+
+    def test_single_update_per_transaction(self):
+        """SOA is updated with a single query when the transaction
+        commits"""
+        with CaptureQueriesContext(connection) as context:
+            with transaction.atomic():
+                self.a_record.delete()
+                self.cname_record.delete()
+                self.assertEqual(self.get_serial(), 1432720132)
+        soa_updates = [
+            query for query in context.captured_queries
+            if query['sql'].startswith('UPDATE') and "'SOA'" in query['sql']
+        ]
+        self.assertEqual(len(soa_updates), 1)
+        self.assertGreater(self.get_serial(), 1432720132)
+
+    def test_no_update_on_rollback(self):
+        """SOA isn't updated if the transaction is rolled back"""
+        with transaction.atomic():
+            self.a_record.delete()
+            transaction.set_rollback(True)
+        self.assertEqual(self.get_serial(), 1432720132)
+        with transaction.atomic():
+            self.cname_record.delete()
+        self.assertGreater(self.get_serial(), 1432720132)
@@ -0,0 +1,89 @@
+"""Tests for the NDJSON export of records"""
+
+import json
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from powerdns.models.powerdns import Record
+from powerdns.tests.utils import DomainFactory, RecordFactory, user_client
+from powerdns.utils import AutoPtrOptions
+from powerdns.views import RecordViewSet
+
+
+class TestExport(TestCase):
+
+    url = '/api/records/export.ndjson'
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(
+            'user', 'user@example.com', 'password'
+        )
+        self.client = user_client(self.user)
+        domain = DomainFactory(
+            name='example.com', template=None, reverse_template=None,
+        )
+        for i in range(5):
+            RecordFactory(
+                domain=domain,
+                name='www{}.example.com'.format(i),
+                type='A' if i % 2 else 'TXT',
+                content='192.168.1.{}'.format(i),
+                auto_ptr=AutoPtrOptions.NEVER,
+            )
+
+    def export(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        self.assertEqual(
+            response['Content-Type'], 'application/x-ndjson; charset=utf-8',
+        )
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertTrue(content.endswith('\n'))
+        return [json.loads(line) for line in content.splitlines()]
+
+    def test_export(self):
+        """Every record is a line, the same as in the lists"""
+        records = self.export()
+        self.assertEqual(
+            [record['name'] for record in records],
+            list(Record.objects.order_by('pk').values_list('name', flat=True)),
+        )
+        listed = self.client.get(
+            '/api/records/', {'name': 'www1.example.com'},
+        ).data['results'][0]
+        self.assertEqual(
+            [record for record in records if record['name'] == listed['name']],
+            [json.loads(json.dumps(listed))],
+        )
+
+    def test_filters(self):
+        records = self.export(type='A', fields='name,type')
+        self.assertEqual(records, [
+            {'name': 'www1.example.com', 'type': 'A'},
+            {'name': 'www3.example.com', 'type': 'A'},
+        ])
+
+    def test_chunks(self):
+        """Records are read in chunks while streaming"""
+        with mock.patch.object(RecordViewSet, 'export_chunk_size', 2):
+            with CaptureQueriesContext(connection) as context:
+                records = self.export(fields='content')
+        self.assertEqual(len(records), 5)
+        selects = [
+            query for query in context.captured_queries
+            if 'FROM "records"' in query['sql']
+        ]
+        # 3 chunks and an empty one
+        self.assertEqual(len(selects), 4)
+
+    def test_unknown_field(self):
+        response = self.client.get(self.url, {'fields': 'foo'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('foo', json.loads(response.content.decode('utf-8'))[
+            'fields'
+        ][0])
@@ -0,0 +1,75 @@
+"""Tests for API filters"""
+
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from powerdns.models.powerdns import Record
+from powerdns.tests.utils import DomainFactory, RecordFactory, user_client
+from powerdns.utils import AutoPtrOptions
+
+
+class TestIPFilters(TestCase):
+    """Tests for filtering records by IP addresses"""
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(
+            'user', 'user@example.com', 'password'
+        )
+        self.client = user_client(self.user)
+        domain = DomainFactory(
+            name='example.com', template=None, reverse_template=None,
+        )
+        for name, type_, content in [
+            ('a1', 'A', '10.20.0.1'),
+            ('a2', 'A', '10.20.255.255'),
+            ('a3', 'A', '10.21.0.1'),
+            ('b1', 'AAAA', '2001:db8::1'),
+            ('b2', 'AAAA', '2001:db8:0:1::1'),
+            ('b3', 'AAAA', '2001:db9::1'),
+            ('c1', 'TXT', '10.20.0.1'),
+        ]:
+            RecordFactory(
+                domain=domain,
+                name='{}.example.com'.format(name),
+                type=type_,
+                content=content,
+                auto_ptr=AutoPtrOptions.NEVER,
+            )
+
+    def get_names(self, **params):
+        response = self.client.get(reverse('record-list'), params)
+        self.assertEqual(response.status_code, 200)
+        return sorted(
+            record['name'].split('.')[0]
+            for record in response.data['results']
+        )
+
+    def test_numbers(self):
+        """Numbers are stored for A and AAAA records only"""
+        self.assertEqual(
+            Record.objects.get(name='b1.example.com').number6,
+            '20010db8000000000000000000000001',
+        )
+        self.assertIsNone(Record.objects.get(name='c1.example.com').number)
+
+    def test_cidr(self):
+        """Records in a network are found"""
+        self.assertEqual(self.get_names(cidr='10.20.0.0/16'), ['a1', 'a2'])
+        self.assertEqual(self.get_names(cidr='2001:db8::/32'), ['b1', 'b2'])
+        self.assertEqual(self.get_names(cidr='10.21.0.1'), ['a3'])
+
+    def test_range(self):
+        """Records in a range of addresses are found"""
+        self.assertEqual(
+            self.get_names(ip_from='10.20.1.0', ip_to='10.21.0.1'),
+            ['a2', 'a3'],
+        )
+        self.assertEqual(
+            self.get_names(ip_from='2001:db8:0:1::'),
+            ['b2', 'b3'],
+        )
+
+    def test_invalid(self):
+        """Invalid networks match nothing"""
+        self.assertEqual(self.get_names(cidr='10.20.0.1/16'), [])
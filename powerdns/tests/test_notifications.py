@@ -0,0 +1,226 @@
+"""Tests for the outbox of e-mail notifications"""
+
+import datetime
+import io
+import smtplib
+from unittest import mock
+
+from django.contrib.auth.models import User
+from django.core import mail
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.db import DatabaseError
+from django.test import TestCase, TransactionTestCase
+from django.test.utils import override_settings
+from django.utils import timezone
+
+from powerdns.models.notifications import Notification
+from powerdns.models.powerdns import Domain, Record
+from powerdns.notifications import deliver_notifications, notify_owners
+from powerdns.tests.utils import DomainFactory, user_client
+
+
+def failing_send(message, *args, **kwargs):
+    if 'fail' in message.to[0]:
+        raise smtplib.SMTPRecipientsRefused(message.to)
+    mail.outbox.append(message)
+    return 1
+
+
+@override_settings(
+    DNSAAS_NOTIFICATION_DIGEST_WINDOW=0,
+    DNSAAS_NOTIFICATION_RETRY_DELAY=60,
+    DNSAAS_NOTIFICATION_MAX_ATTEMPTS=3,
+)
+class TestNotifications(TestCase):
+
+    def setUp(self):
+        mail.outbox = []
+        self.owner = self.create_user('owner')
+        self.creator = self.create_user('creator')
+
+    def create_user(self, username):
+        return User.objects.create_user(
+            username, '{}@example.com'.format(username), 'password',
+            first_name=username.title(),
+        )
+
+    def records(self, count, owner=None):
+        return [
+            Record(
+                name='host{}.example.com'.format(i),
+                type='A',
+                content='192.168.1.{}'.format(i),
+                owner=owner or self.owner,
+            )
+            for i in range(count)
+        ]
+
+    def test_queued(self):
+        """Notifications are saved in the transaction, not sent"""
+        record, = self.records(1)
+        record.email_owner(self.creator)
+        record.email_owner(self.owner)
+        self.assertEqual(mail.outbox, [])
+        notification = Notification.objects.get()
+        self.assertEqual(notification.recipient, 'owner@example.com')
+        self.assertEqual(notification.kind, 'Record')
+        self.assertEqual(notification.object, str(record))
+
+    def test_single(self):
+        """A single notification uses the template of its kind"""
+        notify_owners(self.records(1), self.creator)
+        self.assertEqual(deliver_notifications(), (1, 0))
+        message, = mail.outbox
+        self.assertEqual(message.to, ['owner@example.com'])
+        self.assertEqual(
+            message.subject,
+            'Record host0.example.com IN A 192.168.1.0 created for you!',
+        )
+
+    def test_digest(self):
+        """The notifications of an owner about the objects created by the
+        same user are sent together"""
+        other_owner = self.create_user('other')
+        notify_owners(
+            self.records(3) + [Domain(name='example.com', owner=self.owner)] +
+            self.records(2, owner=other_owner),
+            self.creator,
+        )
+        self.assertEqual(deliver_notifications(), (2, 0))
+        self.assertEqual(
+            sorted(
+                (message.to[0], message.subject) for message in mail.outbox
+            ),
+            [
+                ('other@example.com', '2 objects created for you!'),
+                ('owner@example.com', '4 objects created for you!'),
+            ],
+        )
+        content = next(
+            message.body for message in mail.outbox
+            if message.to == ['owner@example.com']
+        )
+        self.assertIn('Creator', content)
+        self.assertIn('Record host2.example.com IN A 192.168.1.2', content)
+        self.assertIn('Domain example.com', content)
+        self.assertFalse(Notification.objects.filter(sent=None).exists())
+
+    @override_settings(DNSAAS_NOTIFICATION_DIGEST_WINDOW=60)
+    def test_window(self):
+        """Notifications are due at the end of their window"""
+        notify_owners(self.records(1), self.creator)
+        notify_owners(self.records(1), self.creator)
+        self.assertEqual(deliver_notifications(), (0, 0))
+        notification = Notification.objects.first()
+        self.assertLessEqual(
+            notification.next_attempt - timezone.now(),
+            datetime.timedelta(seconds=60),
+        )
+        Notification.objects.update(next_attempt=timezone.now())
+        self.assertEqual(deliver_notifications(), (1, 0))
+
+    def test_batches(self):
+        for _ in range(5):
+            notify_owners(self.records(2), self.creator)
+        self.assertEqual(deliver_notifications(batch_size=3), (3, 0))
+        self.assertEqual(deliver_notifications(batch_size=3), (2, 0))
+        self.assertEqual(deliver_notifications(batch_size=3), (0, 0))
+        self.assertEqual(len(mail.outbox), 5)
+
+    def test_retry(self):
+        """Failed notifications are retried later, up to a limit"""
+        failing = self.create_user('fail')
+        notify_owners(self.records(2, owner=failing), self.creator)
+        notify_owners(self.records(1), self.creator)
+        with mock.patch(
+            'django.core.mail.EmailMessage.send', failing_send,
+        ):
+            self.assertEqual(deliver_notifications(), (1, 1))
+            failed = Notification.objects.filter(owner=failing)
+            self.assertEqual(
+                set(failed.values_list('attempts', flat=True)), {1},
+            )
+            self.assertIn('fail@example.com', failed[0].last_error)
+            # Not yet
+            self.assertEqual(deliver_notifications(), (0, 0))
+            delays = []
+            for _ in range(3):
+                failed.update(next_attempt=timezone.now())
+                before = timezone.now()
+                deliver_notifications()
+                delays.append(failed[0].next_attempt - before)
+        self.assertEqual(failed[0].attempts, 3)
+        self.assertIsNone(failed[0].sent)
+        self.assertAlmostEqual(delays[0].total_seconds(), 120, delta=1)
+        self.assertAlmostEqual(delays[1].total_seconds(), 240, delta=1)
+        # Given up after the third attempt
+        self.assertEqual(len(mail.outbox), 1)
+
+    def test_render_error(self):
+        """Notifications that can't be rendered fail without stopping the
+        others"""
+        broken = self.create_user('broken')
+        notify_owners(self.records(1, owner=broken), self.creator)
+        notify_owners(self.records(1), self.creator)
+        Notification.objects.filter(owner=broken).update(kind='Unknown')
+        self.assertEqual(deliver_notifications(), (1, 1))
+        failed = Notification.objects.get(owner=broken)
+        self.assertEqual(failed.attempts, 1)
+        self.assertIsNone(failed.sent)
+        self.assertIn('KeyError', failed.last_error)
+        self.assertEqual(
+            [message.to for message in mail.outbox], [['owner@example.com']],
+        )
+
+    def test_command(self):
+        notify_owners(self.records(1), self.creator)
+        notify_owners(self.records(1), self.create_user('later'))
+        Notification.objects.filter(creator__username='later').update(
+            next_attempt=timezone.now() + datetime.timedelta(hours=1),
+        )
+        stdout = io.StringIO()
+        call_command(
+            'process_notifications', '--once', '--batch-size=1',
+            stdout=stdout,
+        )
+        self.assertEqual(len(mail.outbox), 1)
+        self.assertIn('1 notifications sent', stdout.getvalue())
+
+
+class TestQueuedWithObjects(TransactionTestCase):
+    """Objects and their notifications are saved together (committed, as
+    the API doesn't use transactions otherwise)"""
+
+    def setUp(self):
+        self.creator = User.objects.create_superuser(
+            'creator', 'creator@example.com', 'password'
+        )
+        User.objects.create_user('owner', 'owner@example.com', 'password')
+        self.client = user_client(self.creator)
+        self.failing = mock.patch.object(
+            Notification.objects, 'bulk_create',
+            side_effect=DatabaseError('Outbox unavailable'),
+        )
+
+    def test_create(self):
+        with self.failing, self.assertRaises(DatabaseError):
+            self.client.post(
+                reverse('domain-list'),
+                {'name': 'example.com', 'owner': 'owner'},
+            )
+        self.assertFalse(Domain.objects.exists())
+
+    def test_bulk(self):
+        domain = DomainFactory(
+            name='example.com', template=None, reverse_template=None,
+        )
+        with self.failing, self.assertRaises(DatabaseError):
+            self.client.post(reverse('record-bulk'), [{
+                'domain': reverse('domain-detail', kwargs={'pk': domain.pk}),
+                'type': 'CNAME',
+                'name': 'www.example.com',
+                'content': 'example.com',
+                'owner': 'owner',
+            }], format='json')
+        self.assertFalse(Record.objects.exists())
@@ -0,0 +1,77 @@
+"""Tests for NSEC3 hashing"""
+
+from unittest import mock
+
+from django.test import TestCase
+
+from powerdns.models.powerdns import CryptoKey, DomainMetadata, Record
+from powerdns.nsec3 import hash_name, hash_names, parse_nsec3param
+from powerdns.tests.utils import RecordFactory, RecordTestCase
+from powerdns.utils import AutoPtrOptions
+
+
+# RFC 5155, Appendix A
+RFC_PARAM = '1 1 12 aabbccdd'
+RFC_HASHES = {
+    'example': '0p9mhaveqvm6t7vbl5lop2u3t2rp3tom',
+    'a.example': '35mthgpgcu1qg68fab165klnsnk3dpvl',
+    'ai.example': 'gjeqe526plbf1g8mklp59enfd789njgi',
+    'ns1.example': '2t7b4g4vsa5smi47k61mv5bv1a22bojr',
+    'ns2.example': 'q04jkcevqvmu85r014c7dkba38o0ji5r',
+    '*.w.example': 'r53bq7cc2uvmubfu5ocmm6pers9tk9en',
+    'x.w.example': 'b4um86eghhds6nea196smvmlo4ors995',
+    'y.w.example': 'ji6neoaepv8b5o6k4ev33abha8ht9fgc',
+    'x.y.w.example': '2vptu5timamqttgl4luu9kg21e0aor3s',
+}
+
+
+class TestHashing(TestCase):
+    """Tests for the hashing functions"""
+
+    def test_rfc_vectors(self):
+        """Hashes match the examples from RFC 5155"""
+        param = parse_nsec3param(RFC_PARAM)
+        for name, expected in RFC_HASHES.items():
+            self.assertEqual(hash_name(name, param), expected)
+            self.assertEqual(hash_name(name.upper() + '.', param), expected)
+
+    def test_batch(self):
+        """Batch hashing in worker processes gives the same results"""
+        param = parse_nsec3param(RFC_PARAM)
+        names = sorted(RFC_HASHES)
+        with mock.patch('powerdns.nsec3.POOL_THRESHOLD', 0):
+            hashes = hash_names(names, param, processes=2)
+        self.assertEqual(hashes, [RFC_HASHES[name] for name in names])
+
+    def test_parse(self):
+        """Empty salt is supported, unknown algorithms are not"""
+        self.assertEqual(parse_nsec3param('1 0 0 -').salt, b'')
+        self.assertIsNone(parse_nsec3param('2 0 1 ab'))
+        self.assertIsNone(parse_nsec3param('1 0 1 xyz'))
+
+    def test_invalid_name(self):
+        """Names with empty labels can't be hashed"""
+        with self.assertRaises(ValueError):
+            hash_name('a..example', parse_nsec3param(RFC_PARAM))
+
+
+class TestOrdername(RecordTestCase):
+    """Tests for ordername in NSEC3 mode"""
+
+    def test_nsec3_ordername(self):
+        """Records in NSEC3 zones get hashed ordernames"""
+        CryptoKey.objects.create(domain=self.domain, flags=257, active=True)
+        DomainMetadata.objects.create(
+            domain=self.domain, kind='NSEC3PARAM', content='1 0 12 aabbccdd',
+        )
+        record = RecordFactory(
+            domain=self.domain,
+            type='A',
+            name='www.example.com',
+            content='192.168.1.1',
+            auto_ptr=AutoPtrOptions.NEVER,
+        )
+        self.assertEqual(
+            Record.objects.get(pk=record.pk).ordername,
+            hash_name('www.example.com', parse_nsec3param('1 0 12 aabbccdd')),
+        )
@@ -5,11 +5,14 @@ import base64
 from django.contrib.auth.models import User
 from django.core import mail
 from django.test import TestCase
+from django.test.utils import override_settings
 
 from powerdns.models.powerdns import Domain, Record
+from powerdns.notifications import deliver_notifications
 from powerdns.tests.utils import DomainFactory, user_client
 
 
+@override_settings(DNSAAS_NOTIFICATION_DIGEST_WINDOW=0)
 class TestOwnershipBase(TestCase):
     """Base test class creating some users."""
 
@@ -31,6 +34,9 @@ class TestOwnershipBase(TestCase):
         """Assert the owner in returned data is username and he
         was/was not mailed"""
         self.assertEqual(request.data['owner'], username)
+        # Queued notifications are sent by the worker
+        self.assertEqual(mail.outbox, [])
+        deliver_notifications()
         if len(mail.outbox) > 1:
             raise RuntimeError('Tests broken. Clean the outbox on teardown')
         if mailed and len(mail.outbox) == 0:
@@ -0,0 +1,142 @@
+"""Tests for the pagination of records"""
+
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from powerdns.models.powerdns import Record
+from powerdns.pagination import after
+from powerdns.tests.utils import DomainFactory, RecordFactory, user_client
+from powerdns.utils import AutoPtrOptions
+
+
+class TestKeysetPagination(TestCase):
+    """Tests for walking records with cursors"""
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(
+            'user', 'user@example.com', 'password'
+        )
+        self.client = user_client(self.user)
+        domain = DomainFactory(
+            name='example.com', template=None, reverse_template=None,
+        )
+        # Several records with the same name and type, so the pages
+        # have to be split between them
+        for name, type_, content in [
+            ('a', 'A', '192.168.1.1'),
+            ('a', 'A', '192.168.1.2'),
+            ('a', 'A', '192.168.1.3'),
+            ('a', 'TXT', 'a'),
+            ('b', 'A', '192.168.1.4'),
+            ('c', 'A', '192.168.1.5'),
+            ('c', 'A', '192.168.1.6'),
+        ]:
+            RecordFactory(
+                domain=domain,
+                name='{}.example.com'.format(name),
+                type=type_,
+                content=content,
+                auto_ptr=AutoPtrOptions.NEVER,
+            )
+
+    def test_walk(self):
+        """All the records are listed once, in order"""
+        url = reverse('record-list') + '?cursor=&limit=2'
+        contents = []
+        pages = 0
+        while url:
+            with CaptureQueriesContext(connection) as context:
+                response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            self.assertNotIn('count', response.data)
+            for query in context.captured_queries:
+                self.assertNotIn('COUNT', query['sql'])
+                self.assertNotIn('OFFSET', query['sql'])
+            contents.extend(
+                record['content'] for record in response.data['results']
+            )
+            url = response.data['next']
+            pages += 1
+        self.assertEqual(pages, 4)
+        self.assertEqual(contents, [
+            record.content
+            for record in Record.objects.order_by('name', 'type', 'id')
+        ])
+
+    def ordered_contents(self):
+        return list(
+            Record.objects.order_by(
+                'name', 'type', 'id',
+            ).values_list('content', flat=True)
+        )
+
+    def test_null_type(self):
+        """Records without a type are listed too, where the database orders
+        them among the others of their name"""
+        Record.objects.filter(content='192.168.1.4').update(type=None)
+        url = reverse('record-list') + '?cursor=&limit=1'
+        contents = []
+        while url:
+            response = self.client.get(url)
+            self.assertEqual(response.status_code, 200)
+            contents.extend(
+                record['content'] for record in response.data['results']
+            )
+            url = response.data['next']
+        self.assertEqual(contents, self.ordered_contents())
+        # Also in the middle of a name
+        Record.objects.filter(content='192.168.1.2').update(type=None)
+        url = reverse('record-list') + '?cursor=&limit=2'
+        contents = []
+        while url:
+            response = self.client.get(url)
+            contents.extend(
+                record['content'] for record in response.data['results']
+            )
+            url = response.data['next']
+        self.assertEqual(contents, self.ordered_contents())
+
+    def test_after_nulls_largest(self):
+        """Positions with and without NULLs for databases ordering NULLs
+        last"""
+        Record.objects.filter(content='192.168.1.2').update(type=None)
+        records = sorted(
+            Record.objects.all(),
+            key=lambda record: (
+                record.name, record.type is None, record.type or '', record.id,
+            ),
+        )
+        for i, record in enumerate(records):
+            self.assertEqual(
+                set(Record.objects.filter(after(
+                    ('name', 'type', 'id'),
+                    (record.name, record.type, record.id),
+                    nullable=('type',),
+                    nulls_largest=True,
+                ))),
+                set(records[i + 1:]),
+            )
+
+    def test_filtered(self):
+        """Cursors work together with filters"""
+        response = self.client.get(
+            reverse('record-list'), {'cursor': '', 'limit': 2, 'type': 'A'},
+        )
+        self.assertEqual(len(response.data['results']), 2)
+        response = self.client.get(response.data['next'])
+        self.assertEqual(
+            [record['content'] for record in response.data['results']],
+            ['192.168.1.3', '192.168.1.4'],
+        )
+
+    def test_invalid_cursor(self):
+        response = self.client.get(reverse('record-list'), {'cursor': 'x!'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_offset_default(self):
+        """Without a cursor limit/offset pagination is used"""
+        response = self.client.get(reverse('record-list'), {'limit': 2})
+        self.assertEqual(response.data['count'], 7)
@@ -4,9 +4,14 @@ import functools as ft
 
 from django.contrib.auth.models import User
 from django.core.urlresolvers import reverse
-from django.test import TestCase
+from django.db import connection
+from django.test import Client, TestCase
+from django.test.utils import CaptureQueriesContext
+from threadlocals.threadlocals import set_current_user
 
+from powerdns.domain_index import all_domains
 from powerdns.models.authorisations import Authorisation
+from powerdns.models.powerdns import Domain, Record
 from powerdns.utils import AutoPtrOptions
 
 from powerdns.tests.utils import (
@@ -222,3 +227,233 @@ class TestPermissions(TestCase):
             },
         )
         self.assertEqual(request.status_code, 400)
+
+    def test_user_can_create_records_without_domain(self):
+        """The closest domain is used for records created without one"""
+        request = self.u_client.post(
+            reverse('record-list'),
+            {
+                'name': 'site.u.example.com',
+                'content': '192.168.1.4',
+                'type': 'A',
+                'auto_ptr': AutoPtrOptions.NEVER.id,
+            },
+        )
+        self.assertEqual(request.status_code, 201)
+        self.assertEqual(
+            request.data['domain'],
+            'http://testserver' + get_domain_url(self.u_domain),
+        )
+
+    def test_records_without_domain_in_new_domains(self):
+        """Domains created by other processes are used right away"""
+        all_domains.closest('site.u.example.com')
+        # No signals, as if created by other process
+        Domain.objects.bulk_create([
+            Domain(name='new.u.example.com', owner=self.user),
+        ])
+        request = self.u_client.post(
+            reverse('record-list'),
+            {
+                'name': 'site.new.u.example.com',
+                'content': '192.168.1.4',
+                'type': 'A',
+                'auto_ptr': AutoPtrOptions.NEVER.id,
+            },
+        )
+        self.assertEqual(request.status_code, 201)
+        self.assertEqual(
+            Record.objects.get(name='site.new.u.example.com').domain.name,
+            'new.u.example.com',
+        )
+
+    def test_user_cant_create_records_without_domain_in_other_domains(self):
+        """Permissions are checked for automatically assigned domains"""
+        request = self.u_client.post(
+            reverse('record-list'),
+            {
+                'name': 'site.su.example.com',
+                'content': '192.168.1.4',
+                'type': 'A',
+                'auto_ptr': AutoPtrOptions.NEVER.id,
+            },
+        )
+        self.assertEqual(request.status_code, 400)
+        self.assertIn('domain', request.data)
+
+    def test_records_without_matching_domain(self):
+        """Records outside of managed domains need an explicit domain"""
+        request = self.su_client.post(
+            reverse('record-list'),
+            {
+                'name': 'site.example.org',
+                'content': '192.168.1.4',
+                'type': 'A',
+                'auto_ptr': AutoPtrOptions.NEVER.id,
+            },
+        )
+        self.assertEqual(request.status_code, 400)
+        self.assertIn('domain', request.data)
+
+
+class TestPermissionCache(TestCase):
+    """Tests for loading the authorisations once per request"""
+
+    def setUp(self):
+        self.superuser = User.objects.create_superuser(
+            'superuser', 'superuser@example.com', 'password'
+        )
+        self.user = User.objects.create_user(
+            'user', 'user@example.com', 'password', is_staff=True,
+        )
+        self.domain = DomainFactory(
+            name='example.com',
+            owner=self.superuser,
+            template=None,
+            reverse_template=None,
+        )
+        self.client = Client()
+        self.client.login(username='user', password='password')
+
+    def create_records(self, start, stop):
+        for i in range(start, stop):
+            record = RecordFactory(
+                domain=self.domain,
+                name='host{}.example.com'.format(i),
+                type='A',
+                content='192.168.1.{}'.format(i),
+                owner=self.superuser,
+                auto_ptr=AutoPtrOptions.NEVER,
+            )
+            if i % 2:
+                Authorisation.objects.create(
+                    owner=self.superuser,
+                    target=record,
+                    authorised=self.user,
+                )
+
+    def get_changelist(self):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                reverse('admin:powerdns_record_changelist'),
+            )
+        self.assertEqual(response.status_code, 200)
+        return response, [
+            query['sql'] for query in context.captured_queries
+            if 'powerdns_authorisation' in query['sql']
+        ]
+
+    def test_constant_queries(self):
+        """The number of permission queries doesn't depend on the number of
+        rows"""
+        self.create_records(0, 4)
+        _, few = self.get_changelist()
+        self.create_records(4, 100)
+        response, many = self.get_changelist()
+        self.assertEqual(len(many), len(few))
+        self.assertEqual(len(many), 1)
+        self.assertContains(response, '>Change</a>', count=50)
+
+    def test_new_authorisation(self):
+        """Authorisations created during the request are taken into
+        account"""
+        self.create_records(0, 1)
+        record = Record.objects.get()
+        self.client.get(reverse('admin:powerdns_record_changelist'))
+        set_current_user(self.user)
+        try:
+            self.assertFalse(
+                self.user.has_perm('powerdns.change_record', record)
+            )
+            Authorisation.objects.create(
+                owner=self.superuser, target=record, authorised=self.user,
+            )
+            self.assertTrue(
+                self.user.has_perm('powerdns.change_record', record)
+            )
+        finally:
+            set_current_user(None)
+
+
+class TestCanEditFilter(TestCase):
+    """Tests for listing only the objects the user can edit"""
+
+    setUp = TestPermissions.setUp
+
+    def get_names(self, client, model, **params):
+        response = client.get(reverse(model + '-list'), params)
+        self.assertEqual(response.status_code, 200)
+        names = sorted(item['name'] for item in response.data['results'])
+        self.assertEqual(response.data['count'], len(names))
+        return names
+
+    def test_owned_and_authorised_records(self):
+        """Users get their own records and the ones they are authorised
+        to"""
+        RecordFactory(
+            domain=self.su_domain,
+            name='mail.su.example.com',
+            type='A',
+            content='192.168.1.3',
+            owner=self.superuser,
+            auto_ptr=AutoPtrOptions.NEVER,
+        )
+        Authorisation.objects.create(
+            owner=self.superuser,
+            target=self.su_record,
+            authorised=self.user,
+        )
+        # Authorisations to domains don't apply to records
+        Authorisation.objects.create(
+            owner=self.superuser,
+            target=self.su_domain,
+            authorised=self.user,
+        )
+        self.assertEqual(
+            self.get_names(self.u_client, 'record', can_edit='true'),
+            ['www.su.example.com', 'www.u.example.com'],
+        )
+        self.assertEqual(
+            len(self.get_names(self.u_client, 'record')), 3,
+        )
+
+    def test_superuser(self):
+        """Superusers can edit everything"""
+        self.assertEqual(
+            self.get_names(self.su_client, 'record', can_edit='1'),
+            ['www.su.example.com', 'www.u.example.com'],
+        )
+
+    def test_domains(self):
+        """Records can be added to editable and unrestricted domains"""
+        self.assertEqual(
+            self.get_names(self.u_client, 'domain', can_edit='true'),
+            ['u.example.com'],
+        )
+        self.assertEqual(
+            self.get_names(self.u_client, 'domain', can_add_records='true'),
+            ['u.example.com', 'unrestricted.example.com'],
+        )
+
+    def test_single_query(self):
+        """The permissions are checked in the listing query"""
+        for i in range(20):
+            RecordFactory(
+                domain=self.u_domain,
+                name='host{}.u.example.com'.format(i),
+                type='A',
+                content='192.168.2.{}'.format(i),
+                owner=self.user,
+                auto_ptr=AutoPtrOptions.NEVER,
+            )
+        with CaptureQueriesContext(connection) as context:
+            names = self.get_names(self.u_client, 'record', can_edit='true')
+        self.assertEqual(len(names), 21)
+        self.assertEqual(
+            len([
+                query for query in context.captured_queries
+                if 'powerdns_authorisation' in query['sql']
+            ]),
+            # The count and the page
+            2,
+        )
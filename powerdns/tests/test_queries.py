@@ -0,0 +1,105 @@
+"""Query budgets of the API list endpoints"""
+
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.db import connection
+from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+
+from powerdns.models.powerdns import CryptoKey, DomainMetadata, SuperMaster
+from powerdns.tests.utils import (
+    DomainFactory,
+    DomainTemplateFactory,
+    RecordFactory,
+    RecordTemplateFactory,
+    user_client,
+)
+from powerdns.utils import AutoPtrOptions
+
+
+# The count and the page
+LIST_QUERIES = 2
+
+
+class TestListQueries(TestCase):
+    """The number of queries of list endpoints doesn't depend on the number
+    of objects listed"""
+
+    def setUp(self):
+        self.superuser = User.objects.create_superuser(
+            'superuser', 'superuser@example.com', 'password'
+        )
+        self.client = user_client(self.superuser)
+        self.created = 0
+
+    def create(self, count):
+        """Create ``count`` objects of every kind, each with other related
+        objects"""
+        for i in range(self.created, self.created + count):
+            owner = User.objects.create_user(
+                'user{}'.format(i), 'user{}@example.com'.format(i), 'password'
+            )
+            domain_template = DomainTemplateFactory(
+                name='template{}'.format(i),
+            )
+            RecordTemplateFactory(
+                domain_template=domain_template,
+                type='A',
+                name='www.{domain-name}',
+                content='192.168.1.{}'.format(i),
+            )
+            domain = DomainFactory(
+                name='example{}.com'.format(i),
+                owner=owner,
+                template=None,
+                reverse_template=domain_template,
+            )
+            RecordFactory(
+                domain=domain,
+                name='www.example{}.com'.format(i),
+                type='A',
+                content='192.168.1.{}'.format(i),
+                owner=owner,
+                auto_ptr=AutoPtrOptions.NEVER,
+            )
+            DomainMetadata.objects.create(
+                domain=domain, kind='ALLOW-AXFR-FROM', content='AUTO-NS',
+            )
+            CryptoKey.objects.create(
+                domain=domain, flags=257, active=True, content='key',
+            )
+            SuperMaster.objects.create(
+                ip='192.168.2.{}'.format(i),
+                nameserver='ns{}.example.com'.format(i),
+                account='account{}'.format(i),
+            )
+        self.created += count
+
+    def count_queries(self, view_name, count):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(reverse(view_name), {'limit': 100})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(len(response.data['results']), count)
+        return len(context.captured_queries)
+
+    def test_list_queries(self):
+        view_names = [
+            'cryptokey-list',
+            'domain-list',
+            'domainmetadata-list',
+            'domaintemplate-list',
+            'record-list',
+            'recordtemplate-list',
+            'supermaster-list',
+        ]
+        self.create(2)
+        few = {
+            view_name: self.count_queries(view_name, 2)
+            for view_name in view_names
+        }
+        self.create(18)
+        for view_name in view_names:
+            self.assertEqual(
+                self.count_queries(view_name, 20), few[view_name], view_name,
+            )
+            self.assertLessEqual(few[view_name], LIST_QUERIES, view_name)
@@ -0,0 +1,94 @@
+"""Tests for the cache of template responses"""
+
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.urlresolvers import reverse
+from django.db import connection, transaction
+from django.test import TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+
+from powerdns.models.powerdns import SuperMaster
+from powerdns.tests.utils import (
+    DomainTemplateFactory,
+    RecordTemplateFactory,
+    user_client,
+)
+
+
+@override_settings(DNSAAS_RESPONSE_CACHE='default')
+class TestResponseCache(TransactionTestCase):
+    """Changes are committed in these tests, as the cache is invalidated
+    on commit"""
+
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_superuser(
+            'user', 'user@example.com', 'password'
+        )
+        self.client = user_client(self.user)
+        self.template = DomainTemplateFactory(name='template')
+        RecordTemplateFactory(
+            domain_template=self.template,
+            type='A',
+            name='www.{domain-name}',
+            content='192.168.1.1',
+        )
+
+    def get(self, view_name, **params):
+        with CaptureQueriesContext(connection) as context:
+            response = self.client.get(
+                reverse(view_name), params, HTTP_ACCEPT='application/json',
+            )
+        self.assertEqual(response.status_code, 200)
+        return response, len(context.captured_queries)
+
+    def test_cached(self):
+        """Responses are served from the cache without queries"""
+        response, queries = self.get('recordtemplate-list')
+        self.assertGreater(queries, 0)
+        cached, queries = self.get('recordtemplate-list')
+        self.assertEqual(queries, 0)
+        self.assertEqual(cached.content, response.content)
+        self.assertEqual(cached['Content-Type'], response['Content-Type'])
+        # Other parameters are other responses
+        response, queries = self.get('recordtemplate-list', name='x')
+        self.assertGreater(queries, 0)
+        self.assertEqual(response.data['count'], 0)
+
+    def test_invalidated(self):
+        """Changes of either templates invalidate both lists"""
+        self.get('domaintemplate-list')
+        self.get('recordtemplate-list')
+        DomainTemplateFactory(name='other')
+        response, _ = self.get('domaintemplate-list')
+        self.assertEqual(response.data['count'], 2)
+        self.template.recordtemplate_set.all().delete()
+        response, _ = self.get('recordtemplate-list')
+        self.assertEqual(response.data['count'], 0)
+
+    def test_rolled_back(self):
+        """Responses are invalidated only after commit"""
+        self.get('supermaster-list')
+        with transaction.atomic():
+            SuperMaster.objects.create(
+                ip='192.168.1.1', nameserver='ns1.example.com', account='a',
+            )
+            transaction.set_rollback(True)
+        _, queries = self.get('supermaster-list')
+        self.assertEqual(queries, 0)
+        SuperMaster.objects.create(
+            ip='192.168.1.1', nameserver='ns1.example.com', account='a',
+        )
+        response, _ = self.get('supermaster-list')
+        self.assertEqual(response.data['count'], 1)
+
+    def test_browsable_api(self):
+        """Pages of the browsable API are not cached"""
+        for _ in range(2):
+            response = self.client.get(
+                reverse('recordtemplate-list'), HTTP_ACCEPT='text/html',
+            )
+            self.assertEqual(response.status_code, 200)
+            self.assertIn(b'user', response.content)
+        _, queries = self.get('recordtemplate-list')
+        self.assertGreater(queries, 0)
@@ -5,9 +5,16 @@ from __future__ import division
 from __future__ import print_function
 from __future__ import unicode_literals
 
+import io
+
+from django.core.management import call_command
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext, override_settings
 
 from powerdns.models.powerdns import Domain, Record
+from powerdns.models.templates import TemplatePropagation, apply_template
+from powerdns.propagation import run_propagation
 from powerdns.tests.utils import (
     DomainTemplateFactory,
     RecordTemplateFactory,
@@ -174,3 +181,187 @@ class TestTemplates(TestCase):
         )
         self.assertEqual(domain.record_set.count(), 4)
         assert_does_exist(Record, domain=domain, content='ns2.example.com')
+
+    def test_unchanged_template(self):
+        """Saving a domain without changing its template doesn't touch its
+        records"""
+        domain = Domain(name='example.com', template=self.domain_template1)
+        domain.save()
+        domain = Domain.objects.get(pk=domain.pk)
+        domain.remarks = 'Changed'
+        with CaptureQueriesContext(connection) as context:
+            domain.save()
+        for query in context.captured_queries:
+            self.assertNotIn('powerdns_record', query['sql'])
+        # Also when saved again after a change of the template
+        domain.template = self.domain_template2
+        domain.save()
+        domain.notified_serial = 1
+        with CaptureQueriesContext(connection) as context:
+            domain.save()
+        for query in context.captured_queries:
+            self.assertNotIn('powerdns_record', query['sql'])
+
+    def test_apply_template(self):
+        """Records of the template can be restored explicitly"""
+        domain = Domain(name='example.com', template=self.domain_template1)
+        domain.save()
+        domain.record_set.filter(type='NS').delete()
+        domain.save()
+        self.assertEqual(domain.record_set.count(), 2)
+        apply_template(domain)
+        self.assertEqual(domain.record_set.count(), 3)
+        assert_does_exist(Record, domain=domain, content='ns1.example.com')
+
+
+@override_settings(DNSAAS_TEMPLATE_PROPAGATION_INLINE=0)
+class TestTemplatePropagation(TestCase):
+    """Tests for propagating templates of many domains in the background"""
+
+    def setUp(self):
+        self.domain_template = DomainTemplateFactory(name='template')
+        DomainTemplateFactory(name='reverse')
+        self.ns_template = RecordTemplateFactory(
+            type='NS',
+            name='{domain-name}',
+            content='ns1.{domain-name}',
+            domain_template=self.domain_template,
+        )
+        self.domains = [
+            Domain.objects.create(
+                name='example{}.com'.format(i),
+                template=self.domain_template,
+            )
+            for i in range(5)
+        ]
+
+    def contents(self, type_):
+        return sorted(
+            Record.objects.filter(
+                domain__in=self.domains, type=type_,
+            ).values_list(
+                'content', flat=True,
+            )
+        )
+
+    def test_modify(self):
+        """Records are changed by the worker"""
+        self.ns_template.content = 'nsrv1.{domain-name}'
+        self.ns_template.ttl = 600
+        self.ns_template.save()
+        self.assertEqual(self.contents('NS'), [
+            'ns1.example{}.com'.format(i) for i in range(5)
+        ])
+        propagation = TemplatePropagation.objects.get(finished=None)
+        self.assertEqual(propagation.progress(), '0/5')
+        stdout = io.StringIO()
+        call_command(
+            'propagate_templates', '--once', '--chunk-size=2',
+            stdout=stdout,
+        )
+        self.assertEqual(self.contents('NS'), [
+            'nsrv1.example{}.com'.format(i) for i in range(5)
+        ])
+        self.assertEqual(set(
+            Record.objects.filter(domain__in=self.domains, type='NS')
+            .values_list('ttl', flat=True)
+        ), {600})
+        self.assertIn('2/5 domains', stdout.getvalue())
+        self.assertIn('5/5 domains, finished', stdout.getvalue())
+
+    def test_add(self):
+        """Records are created by the worker, with their PTRs"""
+        RecordTemplateFactory(
+            type='A',
+            name='www.{domain-name}',
+            content='192.168.1.1',
+            domain_template=self.domain_template,
+            auto_ptr=AutoPtrOptions.ALWAYS,
+        )
+        self.assertEqual(self.contents('A'), [])
+        run_propagation(TemplatePropagation.objects.get(finished=None))
+        self.assertEqual(self.contents('A'), ['192.168.1.1'] * 5)
+        self.assertEqual(
+            Record.objects.filter(
+                type='PTR', content__startswith='www.example',
+            ).count(),
+            5,
+        )
+
+    def test_resume(self):
+        """Interrupted propagations continue where they have stopped"""
+        self.ns_template.content = 'nsrv1.{domain-name}'
+        self.ns_template.save()
+        propagation = TemplatePropagation.objects.get(finished=None)
+
+        def interrupt(propagation):
+            raise KeyboardInterrupt()
+
+        with self.assertRaises(KeyboardInterrupt):
+            run_propagation(propagation, chunk_size=3, report=interrupt)
+        propagation.refresh_from_db()
+        self.assertEqual(propagation.progress(), '3/5')
+        self.assertEqual(propagation.position, self.domains[2].pk)
+        self.assertEqual(
+            self.contents('NS').count('nsrv1.example4.com'), 0,
+        )
+        run_propagation(propagation, chunk_size=3)
+        self.assertEqual(self.contents('NS'), [
+            'nsrv1.example{}.com'.format(i) for i in range(5)
+        ])
+
+    def test_restart(self):
+        """A template changed again is propagated from the start"""
+        self.ns_template.save()
+        self.ns_template.save()
+        self.assertEqual(
+            TemplatePropagation.objects.filter(finished=None).count(), 1,
+        )
+
+    def test_changed_while_running(self):
+        """A running propagation stops when the template is changed again
+        and the new one is done from the start"""
+        self.ns_template.save()
+        propagation = TemplatePropagation.objects.get(finished=None)
+
+        def change(propagation):
+            self.ns_template.content = 'nsrv1.{domain-name}'
+            self.ns_template.save()
+
+        propagation = run_propagation(propagation, chunk_size=2, report=change)
+        self.assertEqual(propagation.progress(), '2/5')
+        self.assertIsNotNone(propagation.finished)
+        call_command('propagate_templates', '--once', stdout=io.StringIO())
+        self.assertEqual(self.contents('NS'), [
+            'nsrv1.example{}.com'.format(i) for i in range(5)
+        ])
+
+    def test_template_deleted_while_running(self):
+        self.ns_template.save()
+        propagation = TemplatePropagation.objects.get(finished=None)
+
+        def delete(propagation):
+            self.ns_template.delete()
+
+        run_propagation(propagation, chunk_size=2, report=delete)
+        self.assertFalse(TemplatePropagation.objects.exists())
+
+    def test_constant_queries(self):
+        """The number of queries per chunk doesn't depend on its size"""
+        self.ns_template.content = 'nsrv1.{domain-name}'
+
+        def count_queries(chunk_size):
+            self.ns_template.save()
+            propagation = TemplatePropagation.objects.get(finished=None)
+            with CaptureQueriesContext(connection) as context:
+                run_propagation(propagation, chunk_size=chunk_size)
+            return len(context.captured_queries)
+
+        self.assertEqual(count_queries(5), count_queries(5))
+        one_chunk = count_queries(5)
+        for i in range(5, 10):
+            Domain.objects.create(
+                name='example{}.com'.format(i),
+                template=self.domain_template,
+            )
+        self.assertEqual(count_queries(10), one_chunk)
@@ -1,6 +1,11 @@
 """Tests for keeping uniqueness constraints"""
 
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from powerdns.models import Record, RecordRequest
 from powerdns.tests.utils import RecordFactory, RecordTestCase
+from powerdns.utils import find_conflicts
 
 
 class TestUniquenessConstraints(RecordTestCase):
@@ -64,3 +69,47 @@ class TestUniquenessConstraints(RecordTestCase):
             name='blog.example.com',
             content='site.example.com'
         )
+
+    def test_no_rows_loaded(self):
+        """Conflicts are checked with a single query that doesn't load whole
+        records"""
+        with CaptureQueriesContext(connection) as context:
+            Record(
+                domain=self.domain,
+                type='A',
+                name='wiki.example.com',
+                content='192.168.1.2',
+            ).validate_for_conflicts()
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertNotIn('"content"', context.captured_queries[0]['sql'])
+
+    def test_batch(self):
+        """Conflicts of many records are found with a single query"""
+        records = [
+            Record(type='A', name='blog.example.com', content='192.168.1.2'),
+            Record(type='A', name='wiki.example.com', content='192.168.1.3'),
+            Record(type='CNAME', name='wiki.example.com', content='a.com'),
+            RecordRequest(
+                target_type='CNAME',
+                target_name='www.example.com',
+                target_content='b.com',
+            ),
+            Record(type='A', name='www.example.com', content='192.168.1.1'),
+        ]
+        with CaptureQueriesContext(connection) as context:
+            errors = find_conflicts(records, check_unique=True)
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertEqual(errors[0], [
+            'Cannot create a record. Following conflicting CNAME'
+            'record exists: {}'.format(self.cname_record.pk)
+        ])
+        self.assertEqual(errors[1], [])
+        self.assertEqual(errors[2], ['Conflicts with items 1 of this batch'])
+        self.assertEqual(errors[3], [
+            'Cannot create CNAME record. Following conflicting '
+            'records exist: {}'.format(self.a_record.pk)
+        ])
+        self.assertEqual(errors[4], [
+            'Conflicts with items 3 of this batch',
+            'Record with this Name, Type and Content already exists.',
+        ])
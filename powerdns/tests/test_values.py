@@ -0,0 +1,78 @@
+"""Tests for lists with selected fields and flat lists"""
+
+from django.contrib.auth.models import User
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+
+from powerdns.tests.utils import DomainFactory, RecordFactory, user_client
+from powerdns.utils import AutoPtrOptions
+
+
+class TestValues(TestCase):
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(
+            'user', 'user@example.com', 'password'
+        )
+        self.client = user_client(self.user)
+        domain = DomainFactory(
+            name='example.com', template=None, reverse_template=None,
+        )
+        for i in range(5):
+            RecordFactory(
+                domain=domain,
+                name='www{}.example.com'.format(i),
+                type='A',
+                content='192.168.1.{}'.format(i),
+                owner=self.user,
+                auto_ptr=AutoPtrOptions.NEVER,
+            )
+        self.url = reverse('record-list')
+
+    def test_fields(self):
+        """Only the fields selected are given, the same as without
+        selecting"""
+        fields = ['url', 'name', 'domain', 'owner', 'ttl', 'content']
+        full = self.client.get(self.url).data['results']
+        response = self.client.get(self.url, {'fields': ','.join(fields)})
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 5)
+        for record, expected in zip(response.data['results'], full):
+            self.assertEqual(list(record), fields)
+            for field in fields:
+                self.assertEqual(record[field], expected[field])
+
+    def test_flat(self):
+        """Flat lists have the field names once and rows of values"""
+        response = self.client.get(
+            self.url, {'format': 'flat', 'fields': 'name,content'},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['fields'], ['name', 'content'])
+        self.assertEqual(response.data['results'][0], [
+            'www0.example.com', '192.168.1.0',
+        ])
+        # All the fields by default
+        response = self.client.get(self.url, {'format': 'flat'})
+        full = self.client.get(self.url).data['results']
+        self.assertEqual(response.data['fields'], list(full[0]))
+        self.assertEqual(response.data['results'][0], list(full[0].values()))
+
+    def test_cursor(self):
+        """Cursors work with the fields selected"""
+        url = self.url + '?fields=content&cursor=&limit=2'
+        contents = []
+        while url:
+            response = self.client.get(url)
+            contents.extend(
+                record['content'] for record in response.data['results']
+            )
+            url = response.data['next']
+        self.assertEqual(
+            contents, ['192.168.1.{}'.format(i) for i in range(5)],
+        )
+
+    def test_unknown_field(self):
+        response = self.client.get(self.url, {'fields': 'name,foo'})
+        self.assertEqual(response.status_code, 400)
+        self.assertIn('foo', response.data['fields'][0])
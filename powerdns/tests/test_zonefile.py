@@ -0,0 +1,245 @@
+"""Tests for zone file import"""
+
+import tempfile
+
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.urlresolvers import reverse
+from django.test import TestCase
+from django.utils.six import StringIO
+
+from powerdns.models.powerdns import Domain, Record
+from powerdns.tests.utils import (
+    DomainFactory,
+    RecordFactory,
+    assert_does_exist,
+    assert_not_exists,
+    user_client,
+)
+from powerdns.utils import AutoPtrOptions
+from powerdns.zonefile import (
+    ZoneFileError,
+    import_zone,
+    parse_zone,
+    render_zone,
+)
+
+
+ZONE = """$ORIGIN example.com.
+$TTL 1h
+@   IN  SOA ns1 hostmaster (
+        2016010101 ; serial
+        3h         ; refresh
+        1h         ; retry
+        1w         ; expire
+        600 )      ; minimum
+    IN  NS  ns1
+    IN  NS  ns2.example.net.
+    IN  MX  10 mail
+ns1 300 IN A 192.168.1.1
+www     IN  CNAME ns1
+txt     IN  TXT "v=spf1 -all ; not a comment"
+$ORIGIN sub.example.com.
+host    A   192.168.1.2
+"""
+
+
+class TestParser(TestCase):
+    """Tests for the zone file parser"""
+
+    def test_parse(self):
+        """Directives, relative names and multi-line entries are handled"""
+        records = [
+            (record.name, record.ttl, record.type, record.content, record.prio)
+            for record in parse_zone(ZONE.splitlines(), 'example.com')
+        ]
+        self.assertEqual(records, [
+            (
+                'example.com', 3600, 'SOA',
+                'ns1.example.com hostmaster.example.com '
+                '2016010101 10800 3600 604800 600',
+                None,
+            ),
+            ('example.com', 3600, 'NS', 'ns1.example.com', None),
+            ('example.com', 3600, 'NS', 'ns2.example.net', None),
+            ('example.com', 3600, 'MX', 'mail.example.com', 10),
+            ('ns1.example.com', 300, 'A', '192.168.1.1', None),
+            ('www.example.com', 300, 'CNAME', 'ns1.example.com', None),
+            (
+                'txt.example.com', 300, 'TXT',
+                '"v=spf1 -all ; not a comment"', None,
+            ),
+            ('host.sub.example.com', 300, 'A', '192.168.1.2', None),
+        ])
+
+    def test_syntax_error(self):
+        """Syntax errors are reported with line numbers"""
+        with self.assertRaises(ZoneFileError) as context:
+            list(parse_zone(['@ IN SOA ns1 hostmaster (', '1 2 3'], 'a.com'))
+        self.assertEqual(context.exception.lineno, 1)
+
+    def test_invalid_soa_timer(self):
+        with self.assertRaises(ZoneFileError) as context:
+            list(parse_zone(
+                ['@ IN SOA ns1 hostmaster 1 3h 1x 1w 600'], 'a.com',
+            ))
+        self.assertEqual(context.exception.lineno, 1)
+
+
+class TestImport(TestCase):
+    """Tests for importing zone files"""
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(
+            'user', 'user@example.com', 'password'
+        )
+
+    def test_import_new_domain(self):
+        """Domain and records are created"""
+        result = import_zone(
+            ZONE.splitlines(),
+            Domain(name='example.com'),
+            owner=self.user,
+            batch_size=3,
+        )
+        self.assertEqual(result.errors, [])
+        self.assertEqual(result.added, 8)
+        domain = Domain.objects.get(name='example.com')
+        self.assertEqual(domain.record_set.count(), 8)
+        assert_does_exist(
+            Record, domain=domain, name='ns1.example.com', ttl=300,
+            owner=self.user,
+        )
+
+    def test_dry_run(self):
+        """Dry run reports the differences and saves nothing"""
+        domain = DomainFactory(name='example.com')
+        RecordFactory(
+            domain=domain, type='A', name='ns1.example.com',
+            content='192.168.1.1', ttl=300, auto_ptr=AutoPtrOptions.NEVER,
+        )
+        RecordFactory(
+            domain=domain, type='A', name='old.example.com',
+            content='192.168.1.3', auto_ptr=AutoPtrOptions.NEVER,
+        )
+        diff = []
+        result = import_zone(
+            ZONE.splitlines(),
+            domain,
+            dry_run=True,
+            report=lambda change, record: diff.append(
+                (change, record.name)
+            ),
+        )
+        self.assertEqual(result.added, 7)
+        self.assertEqual(result.unchanged, 1)
+        self.assertEqual(result.only_in_database, 1)
+        self.assertIn(('+', 'www.example.com'), diff)
+        self.assertIn(('-', 'old.example.com'), diff)
+        assert_not_exists(Record, name='www.example.com')
+
+    def test_errors_rollback(self):
+        """Nothing is saved if some records are invalid"""
+        zone = ZONE + 'bad IN A 300.1.1.1\n'
+        result = import_zone(zone.splitlines(), Domain(name='example.com'))
+        self.assertEqual(len(result.errors), 1)
+        self.assertEqual(result.errors[0][0], 17)
+        assert_not_exists(Domain, name='example.com')
+
+    def test_command(self):
+        """Zones can be imported with loadzone command"""
+        domain = DomainFactory(name='example.com')
+        stdout = StringIO()
+        with tempfile.NamedTemporaryFile('w', suffix='.zone') as f:
+            f.write(ZONE)
+            f.flush()
+            call_command(
+                'loadzone', f.name, origin='example.com', stdout=stdout,
+            )
+        self.assertIn('8 added', stdout.getvalue())
+        self.assertEqual(domain.record_set.count(), 8)
+
+    def test_api(self):
+        """Zones can be imported through the API"""
+        client = user_client(self.user)
+        response = client.post(
+            reverse('domain-import-zone'),
+            {'origin': 'example.com', 'zone': ZONE, 'dry_run': True},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['added'], 8)
+        self.assertEqual(len(response.data['diff']), 8)
+        assert_not_exists(Domain, name='example.com')
+        response = client.post(
+            reverse('domain-import-zone'),
+            {'origin': 'example.com', 'zone': ZONE},
+            format='json',
+        )
+        self.assertEqual(response.status_code, 200)
+        assert_does_exist(Record, name='host.sub.example.com')
+
+
+class TestExport(TestCase):
+    """Tests for exporting zone files"""
+
+    def setUp(self):
+        self.user = User.objects.create_superuser(
+            'user', 'user@example.com', 'password'
+        )
+        self.domain = DomainFactory(name='example.com')
+        import_zone(ZONE.splitlines(), self.domain)
+
+    def test_roundtrip(self):
+        """Exported zone parses to the same records"""
+        exported = list(parse_zone(
+            ''.join(render_zone(self.domain)).splitlines(), 'example.com',
+        ))
+        parsed = list(parse_zone(ZONE.splitlines(), 'example.com'))
+        self.assertEqual(exported[0][1:], parsed[0][1:])
+        self.assertEqual(
+            set(record[1:] for record in exported),
+            set(record[1:] for record in parsed),
+        )
+
+    def test_command(self):
+        """Zones can be exported with dumpzone command"""
+        stdout = StringIO()
+        call_command('dumpzone', 'example.com', stdout=stdout)
+        self.assertIn(
+            'www.example.com.\t300\tIN\tCNAME\tns1.example.com.\n',
+            stdout.getvalue(),
+        )
+
+    def test_api(self):
+        """Zone file is streamed with an ETag"""
+        client = user_client(self.user)
+        url = reverse('domain-zone', kwargs={'pk': self.domain.pk})
+        response = client.get(url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        content = b''.join(response.streaming_content).decode('utf-8')
+        self.assertTrue(content.startswith('$ORIGIN example.com.\n'))
+        response = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 304)
+        Record.objects.filter(type='SOA').update(change_date=1)
+        response = client.get(url, HTTP_IF_NONE_MATCH=response['ETag'])
+        self.assertEqual(response.status_code, 200)
+
+    def test_api_without_soa(self):
+        """Zones without an SOA get ETags changing with their records"""
+        client = user_client(self.user)
+        Record.objects.filter(type='SOA').delete()
+        url = reverse('domain-zone', kwargs={'pk': self.domain.pk})
+        etag = client.get(url)['ETag']
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        record = Record.objects.get(name='www.example.com')
+        record.content = 'ns2.example.com'
+        record.save()
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        etag = response['ETag']
+        record.delete()
+        response = client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
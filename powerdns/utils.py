@@ -1,16 +1,21 @@
 """Utilities for powerdns models"""
 
+from collections import defaultdict
+
 from pkg_resources import working_set, Requirement
 
 import rules
 from django.conf import settings
 from django.contrib.contenttypes.fields import GenericRelation
-from django.core.mail import send_mail
+from django.contrib.contenttypes.models import ContentType
+from django.core.cache import caches
+from django.core.cache.backends.dummy import DummyCache
+from django.core.cache.backends.locmem import LocMemCache
 from django.core.exceptions import ValidationError
 from django.core.validators import validate_ipv4_address, RegexValidator
 from django.db import models
 from django.utils.translation import ugettext_lazy as _
-from threadlocals.threadlocals import get_current_user
+from threadlocals.threadlocals import get_current_request, get_current_user
 from dj.choices import Choices
 from IPy import IP
 
@@ -26,6 +31,18 @@ def validate_ipv6_address(value):
         )
 
 
+def ipv6_number(value):
+    """The 128-bit number of an IPv6 address as a fixed-width hex string or
+    None if the value isn't an IPv6 address"""
+    try:
+        ip = IP(value)
+    except (ValueError, TypeError):
+        return None
+    if ip.version() != 6 or ip.len() != 1:
+        return None
+    return '{:032x}'.format(ip.int())
+
+
 VERSION = working_set.find(Requirement.parse('django-powerdns-dnssec')).version
 
 
@@ -98,18 +115,64 @@ def no_object(user, object_):
     return object_ is None
 
 
+def get_authorisations(user):
+    """The set of ``(content_type_id, target_id)`` of the objects the user
+    is authorised to. Loaded once per request, as permissions are checked
+    for every row of API responses and admin lists."""
+    if getattr(user, 'pk', None) is None:
+        return frozenset()
+    request = get_current_request()
+    if request is None:
+        cache = {}
+    else:
+        cache = request.__dict__.setdefault('_powerdns_authorisations', {})
+    if user.pk not in cache:
+        from powerdns.models.authorisations import Authorisation
+        cache[user.pk] = frozenset(
+            Authorisation.objects.filter(
+                authorised=user,
+            ).values_list('content_type_id', 'target_id')
+        )
+    return cache[user.pk]
+
+
+def forget_authorisations():
+    """Reload the authorisations of the current request on next use"""
+    request = get_current_request()
+    if request is not None:
+        request.__dict__.pop('_powerdns_authorisations', None)
+
+
 @rules.predicate
 def is_owner(user, object_):
-    return object_ and object_.owner == user
+    # Comparing ids doesn't fetch the owner
+    return bool(object_) and object_.owner_id is not None and (
+        object_.owner_id == getattr(user, 'pk', None)
+    )
 
 
 @rules.predicate
 def is_authorised(user, object_):
-    return object_ and user in (
-        authorisation.authorised
-        for authorisation in object_.authorisations.all()
-    )
-    return not object_ or object_.owner == user
+    if not object_:
+        return False
+    content_type = ContentType.objects.get_for_model(object_)
+    return (content_type.pk, object_.pk) in get_authorisations(user)
+
+
+def editable_by(user, model):
+    """A ``Q`` object selecting the objects of ``model`` the user can edit.
+    The same as the ``can_edit`` rule (without the object-less case), but
+    checked by the database for all the objects at once."""
+    if getattr(user, 'pk', None) is None:
+        return models.Q(pk__in=[])
+    if user.is_superuser:
+        return models.Q()
+    from powerdns.models.authorisations import Authorisation
+    authorised = Authorisation.objects.filter(
+        authorised=user,
+        content_type=ContentType.objects.get_for_model(model),
+    ).values('target_id')
+    return models.Q(owner=user) | models.Q(pk__in=authorised)
 
 
 class TimeTrackable(models.Model):
@@ -123,8 +186,9 @@ class TimeTrackable(models.Model):
 
     def __init__(self, *args, **kwargs):
         super().__init__(*args, **kwargs)
+        # attname, so that no related objects are fetched
         self._initial_values = {
-            field.name: getattr(self, field.name, None)
+            field.attname: getattr(self, field.attname, None)
             for field in self._meta.fields
         }
 
@@ -146,35 +210,10 @@ class Owned(models.Model):
         abstract = True
 
     def email_owner(self, creator):
-        """If the owner is different from the creator - notify the owner."""
-        if (
-            creator != self.owner and
-            settings.ENABLE_OWNER_NOTIFICATIONS and
-            hasattr(self.owner, 'email')
-        ):
-            subject_template, content_template = settings.OWNER_NOTIFICATIONS[
-                type(self)._meta.object_name
-            ]
-            kwargs = {}
-            for key, user in [
-                ('owner', self.owner),
-                ('creator', creator),
-            ]:
-                kwargs[key + '-email'] = user.email
-                kwargs[key + '-name'] = '{} {}'.format(
-                    user.first_name,
-                    user.last_name
-                )
-            kwargs['object'] = str(self)
-
-            subject = subject_template.format(**kwargs)
-            content = content_template.format(**kwargs)
-            send_mail(
-                subject,
-                content,
-                settings.FROM_EMAIL,
-                [self.owner.email],
-            )
+        """If the owner is different from the creator - notify the owner.
+        The e-mail is queued in the current transaction."""
+        from powerdns.notifications import notify_owners
+        notify_owners([self], creator)
 
 
 class PermissionValidator():
@@ -212,6 +251,64 @@ def to_reverse(ip):
     return (domain, number)
 
 
+def shared_cache(setting):
+    """The django cache with the alias given by ``setting`` (``'default'`` if
+    not set), or None if it is disabled (``None``) or not shared by the
+    processes. Per-process caches (like the default ``LocMemCache``) can't
+    tell other processes about changes."""
+    alias = getattr(settings, setting, 'default')
+    if alias is None:
+        return None
+    cache = caches[alias]
+    if isinstance(cache, (LocMemCache, DummyCache)):
+        return None
+    return cache
+
+
+def parent_names(name):
+    """Names of all the domains a domain could be a subdomain of, closest
+    first"""
+    labels = name.split('.')
+    return ['.'.join(labels[i:]) for i in range(1, len(labels))]
+
+
+# Number of rows inserted, updated or looked up in a single query by the
+# set-based operations
+BATCH_SIZE = 500
+
+
+def chunks(sequence, size=BATCH_SIZE):
+    """Split a sequence into lists of at most ``size`` elements"""
+    sequence = list(sequence)
+    for i in range(0, len(sequence), size):
+        yield sequence[i:i + size]
+
+
+def iterate_chunked(queryset, chunk_size=1000):
+    """Iterate over a queryset in the order of primary keys, fetching
+    ``chunk_size`` rows per query. Unlike ``QuerySet.iterator`` this keeps
+    the memory use constant also with drivers that load whole results at
+    once. For ``values_list`` querysets the primary key has to be the first
+    field."""
+    queryset = queryset.order_by('pk')
+    last_pk = None
+    while True:
+        chunk = queryset
+        if last_pk is not None:
+            chunk = chunk.filter(pk__gt=last_pk)
+        chunk = list(chunk[:chunk_size])
+        if not chunk:
+            return
+        yield from chunk
+        last = chunk[-1]
+        if isinstance(last, tuple):
+            last_pk = last[0]
+        elif isinstance(last, dict):
+            last_pk = last['pk'] if 'pk' in last else last['id']
+        else:
+            last_pk = last.pk
+
+
 class AutoPtrOptions(Choices):
     _ = Choices.Choice
     NEVER = _("Never")
@@ -267,6 +364,91 @@ def format_recursive(template, arguments):
         return template
 
 
+CNAME_CONFLICT_MESSAGE = (
+    'Cannot create CNAME record. Following conflicting records exist: {}'
+)
+RECORD_CONFLICT_MESSAGE = (
+    'Cannot create a record. Following conflicting CNAME'
+    'record exists: {}'
+)
+BATCH_CONFLICT_MESSAGE = 'Conflicts with items {} of this batch'
+UNIQUE_MESSAGE = 'Record with this Name, Type and Content already exists.'
+
+
+def conflict_message(type_):
+    return CNAME_CONFLICT_MESSAGE if type_ == 'CNAME' else (
+        RECORD_CONFLICT_MESSAGE
+    )
+
+
+def conflicting_records(name, type_, exclude_pk=None):
+    """Records that would conflict with a record of given name and type: all
+    the records with the name for a CNAME and CNAMEs for other types"""
+    from powerdns.models.powerdns import Record
+    conflicting = Record.objects.filter(name=name)
+    if type_ != 'CNAME':
+        conflicting = conflicting.filter(type='CNAME')
+    if exclude_pk is not None:
+        conflicting = conflicting.exclude(pk=exclude_pk)
+    return conflicting
+
+
+def find_conflicts(records, check_unique=False, positions=None):
+    """Check a list of record-like objects for conflicts with existing
+    records and with each other, querying once per ``BATCH_SIZE`` names.
+    Returns a list of error messages for every record. With
+    ``check_unique`` duplicates of (name, type, content) are reported too.
+    Conflicts within the batch are reported with ``positions`` of the
+    records (their indexes by default)."""
+    if positions is None:
+        positions = range(len(records))
+    from powerdns.models.powerdns import Record
+    existing = defaultdict(list)
+    names = {record.get_field('name') for record in records}
+    for names_chunk in chunks(sorted(names)):
+        for pk, name, type_, content in Record.objects.filter(
+            name__in=names_chunk,
+        ).values_list('pk', 'name', 'type', 'content'):
+            existing[name].append((pk, type_, content))
+    errors = []
+    in_batch = defaultdict(list)
+    for i, record in zip(positions, records):
+        name = record.get_field('name')
+        type_ = record.get_field('type')
+        content = record.get_field('content')
+        record_pk = record.get_record_pk()
+        record_errors = []
+        others = [
+            (pk, other_type, other_content)
+            for (pk, other_type, other_content) in existing[name]
+            if pk != record_pk
+        ]
+        conflicting = [
+            pk for (pk, other_type, _) in others
+            if type_ == 'CNAME' or other_type == 'CNAME'
+        ]
+        batch_conflicting = [
+            j for (j, other_type, _) in in_batch[name]
+            if type_ == 'CNAME' or other_type == 'CNAME'
+        ]
+        if conflicting:
+            record_errors.append(conflict_message(type_).format(
+                ', '.join(str(pk) for pk in conflicting)
+            ))
+        if batch_conflicting:
+            record_errors.append(BATCH_CONFLICT_MESSAGE.format(
+                ', '.join(str(j) for j in batch_conflicting)
+            ))
+        if check_unique and any(
+            (other_type, other_content) == (type_, content)
+            for (_, other_type, other_content) in others + in_batch[name]
+        ):
+            record_errors.append(UNIQUE_MESSAGE)
+        in_batch[name].append((i, type_, content))
+        errors.append(record_errors)
+    return errors
+
+
 class RecordLike(models.Model):
     """Object validated like a record"""
 
@@ -302,30 +484,14 @@ class RecordLike(models.Model):
 
     def validate_for_conflicts(self):
         """Ensure this record doesn't conflict with other records."""
-        from powerdns.models.requests import Record
-
-        def check_unique(comment, **kwargs):
-            conflicting = Record.objects.filter(**kwargs)
-            record_pk = self.get_record_pk()
-            if record_pk is not None:
-                conflicting = conflicting.exclude(pk=record_pk)
-            if conflicting:
-                raise ValidationError(comment.format(
-                    ', '.join(str(record.id) for record in conflicting)
-                ))
-        if self.get_field('type') == 'CNAME':
-            check_unique(
-                'Cannot create CNAME record. Following conflicting '
-                'records exist: {}',
-                name=self.get_field('name'),
-            )
-        else:
-            check_unique(
-                'Cannot create a record. Following conflicting CNAME'
-                'record exists: {}',
-                type='CNAME',
-                name=self.get_field('name'),
-            )
+        type_ = self.get_field('type')
+        conflicting = conflicting_records(
+            self.get_field('name'), type_, self.get_record_pk(),
+        )
+        if conflicting.exists():
+            raise ValidationError(conflict_message(type_).format(', '.join(
+                str(pk) for pk in conflicting.values_list('pk', flat=True)
+            )))
 
     def force_case(self):
         """Force the name and content case to upper and lower respectively"""
@@ -1,7 +1,15 @@
 """Views and viewsets for DNSaaS API"""
 
+import datetime
+from collections import OrderedDict
+
+from django.core.exceptions import NON_FIELD_ERRORS, ValidationError
 from django.core.urlresolvers import reverse
+from django.db import transaction
+from django.db.models import Count, Max, Sum
+from django.http import StreamingHttpResponse
 from django.shortcuts import redirect
+from django.utils.http import http_date, parse_etags, quote_etag
 from django.views.generic.base import TemplateView
 
 from powerdns.models import (
@@ -16,81 +24,550 @@ from powerdns.models import (
     RecordRequest,
     SuperMaster,
 )
+from rest_framework import status
+from rest_framework.decorators import detail_route, list_route
+from rest_framework.exceptions import APIException, PermissionDenied
 from rest_framework.filters import DjangoFilterBackend
+from rest_framework.response import Response
+from rest_framework.settings import api_settings
+from rest_framework.utils.encoders import JSONEncoder
 from rest_framework.viewsets import ModelViewSet
 
+from powerdns.bulk import (
+    create_records,
+    delete_records,
+    update_records,
+    validate_records,
+)
+from powerdns.filters import (
+    CanEditFilterBackend,
+    DomainCanEditFilterBackend,
+    RecordFilter,
+    is_true,
+)
+from powerdns.notifications import notify_owners
+from powerdns.pagination import KeysetPagination, RecordPagination
+from powerdns.renderers import (
+    FlatJSONRenderer,
+    NDJSONRenderer,
+    ZoneFileRenderer,
+)
+from powerdns.response_cache import (
+    CachedResponseMixin,
+    supermaster_responses,
+    template_responses,
+)
 from powerdns.serializers import (
+    BulkRecordSerializer,
     CryptoKeySerializer,
     DomainMetadataSerializer,
     DomainSerializer,
     DomainTemplateSerializer,
     RecordSerializer,
     RecordTemplateSerializer,
+    RecordUpdateSerializer,
     SuperMasterSerializer,
+    ValuesSerializer,
+    related_lookups,
+)
+from powerdns.utils import (
+    AutoPtrOptions,
+    BATCH_SIZE,
+    VERSION,
+    editable_by,
+    iterate_chunked,
 )
-from powerdns.utils import VERSION
+from powerdns.zonefile import (
+    import_zone,
+    render_zone,
+    soa_serial,
+    zone_etag,
+)
+
+
+def etag_matches(request, etag, header='HTTP_IF_NONE_MATCH'):
+    """Check if the ETag matches the If-None-Match (or other) header of the
+    request"""
+    if_none_match = request.META.get(header)
+    if not if_none_match:
+        return False
+    return if_none_match.strip() == '*' or etag in parse_etags(if_none_match)
+
+
+class PreconditionFailed(APIException):
+    status_code = status.HTTP_412_PRECONDITION_FAILED
+    default_detail = 'The object has been changed.'
+
+
+class FiltersRequired(APIException):
+    status_code = status.HTTP_400_BAD_REQUEST
+    default_detail = 'Filters are required to change many objects at once.'
+
+
+def etag_part(value):
+    if isinstance(value, datetime.datetime):
+        return '{:%Y%m%d%H%M%S%f}'.format(value)
+    return str(value)
+
+
+class ConditionalMixin(object):
+    """ETag and Last-Modified headers for objects and lists of them, so
+    clients polling for changes can send ``If-None-Match`` and get ``304 Not
+    Modified`` (without anything serialized) if nothing has changed. Writes
+    with ``If-Match`` fail with ``412 Precondition Failed`` if the object has
+    been changed since it has been read.
+
+    The ETag of an object is made of ``get_etag_parts``, the one of a list
+    of the aggregates in ``list_etag_aggregates`` of all the objects listed
+    (not only the page). Cursor-paginated lists have no ETag, as they avoid
+    aggregating the whole table.
+    """
+
+    pagination_class = KeysetPagination
+
+    list_etag_aggregates = {
+        'count': Count('pk'),
+        'modified': Max('modified'),
+    }
+
+    def get_etag_parts(self, obj):
+        return [obj.pk, obj.modified]
+
+    def make_etag(self, parts):
+        return '-'.join(
+            [self.get_queryset().model._meta.model_name] +
+            [etag_part(part) for part in parts] +
+            # Other formats have other representations
+            [self.request.accepted_renderer.format]
+        )
+
+    def conditional_response(self, etag, last_modified, get_response):
+        headers = {'ETag': quote_etag(etag)}
+        if last_modified is not None:
+            headers['Last-Modified'] = http_date(last_modified.timestamp())
+        if etag_matches(self.request, etag):
+            response = Response(
+                status=status.HTTP_304_NOT_MODIFIED, headers=headers,
+            )
+        else:
+            response = get_response()
+            for header, value in headers.items():
+                response[header] = value
+        return response
+
+    def get_object(self):
+        # Read once for checking the preconditions and for the operation
+        if not hasattr(self, '_object'):
+            self._object = super().get_object()
+        return self._object
+
+    def check_precondition(self):
+        if 'HTTP_IF_MATCH' not in self.request.META:
+            return
+        etag = self.make_etag(self.get_etag_parts(self.get_object()))
+        if not etag_matches(self.request, etag, 'HTTP_IF_MATCH'):
+            raise PreconditionFailed()
+
+    def retrieve(self, request, *args, **kwargs):
+        obj = self.get_object()
+        return self.conditional_response(
+            self.make_etag(self.get_etag_parts(obj)),
+            obj.modified,
+            lambda: super(ConditionalMixin, self).retrieve(
+                request, *args, **kwargs
+            ),
+        )
+
+    def list(self, request, *args, **kwargs):
+        cursor_param = getattr(self.paginator, 'cursor_query_param', None)
+        if cursor_param in request.query_params:
+            return super().list(request, *args, **kwargs)
+        state = self.filter_queryset(self.get_queryset()).aggregate(
+            **self.list_etag_aggregates
+        )
+        # Used by the pagination instead of counting again
+        self.list_count = state['count']
+        return self.conditional_response(
+            self.make_etag(['list'] + [state[key] for key in sorted(state)]),
+            state['modified'],
+            lambda: super(ConditionalMixin, self).list(
+                request, *args, **kwargs
+            ),
+        )
+
+    def update(self, request, *args, **kwargs):
+        self.check_precondition()
+        response = super().update(request, *args, **kwargs)
+        if response.status_code == status.HTTP_200_OK:
+            response['ETag'] = quote_etag(
+                self.make_etag(self.get_etag_parts(self.get_object()))
+            )
+        return response
+
+    def destroy(self, request, *args, **kwargs):
+        self.check_precondition()
+        return super().destroy(request, *args, **kwargs)
 
 
 class FiltersMixin(object):
 
     filter_backends = (DjangoFilterBackend,)
 
+    def get_queryset(self):
+        # The related objects rendered by the serializer are fetched with
+        # the list, not with a query per object
+        queryset = super().get_queryset()
+        select, prefetch = related_lookups(
+            self.get_serializer(), queryset.model,
+        )
+        if select:
+            queryset = queryset.select_related(*select)
+        if prefetch:
+            queryset = queryset.prefetch_related(*prefetch)
+        return queryset
+
+
+class ValuesMixin(object):
+    """Lists with ``?fields=`` (comma separated) contain only these fields
+    and ``?format=flat`` ones have every object as a list of values (of all
+    the fields, or of the ones selected), with the field names in
+    ``fields``. Both are serialized from ``QuerySet.values()``, without
+    creating model instances, which is much faster for long lists."""
+
+    renderer_classes = list(api_settings.DEFAULT_RENDERER_CLASSES) + [
+        FlatJSONRenderer,
+    ]
+
+    def get_values_serializer(self):
+        """Serializer of the fields in ``?fields=``, or of all the fields"""
+        serializer = self.get_serializer()
+        field_names = self.request.query_params.get('fields')
+        if field_names:
+            field_names = [name.strip() for name in field_names.split(',')]
+        else:
+            field_names = list(serializer.fields)
+        return ValuesSerializer(serializer, field_names)
+
+    def list(self, request, *args, **kwargs):
+        flat = request.accepted_renderer.format == 'flat'
+        if not (flat or 'fields' in request.query_params):
+            return super().list(request, *args, **kwargs)
+        values_serializer = self.get_values_serializer()
+        field_names = values_serializer.field_names
+        # The pagination needs the keyset of cursors
+        columns = set(values_serializer.columns).union(
+            getattr(self.paginator, 'keyset', ())
+        )
+        queryset = self.filter_queryset(self.get_queryset()).values(*columns)
+        page = self.paginate_queryset(queryset)
+        rows = queryset if page is None else page
+        if not flat:
+            data = [values_serializer.to_representation(row) for row in rows]
+            if page is None:
+                return Response(data)
+            return self.get_paginated_response(data)
+        data = [values_serializer.to_list(row) for row in rows]
+        if page is None:
+            body = OrderedDict([('results', data)])
+        else:
+            body = self.get_paginated_response(data).data
+        return Response(OrderedDict(
+            [('fields', field_names)] + list(body.items())
+        ))
+
 
 class OwnerViewSet(FiltersMixin, ModelViewSet):
     """Base view for objects with owner"""
 
+    filter_backends = FiltersMixin.filter_backends + (CanEditFilterBackend,)
+
     def perform_create(self, serializer, *args, **kwargs):
         if serializer.validated_data.get('owner') is None:
             serializer.save(owner=self.request.user)
-        else:
+            return
+        # The notification is queued only if the object is saved
+        with transaction.atomic():
             object_ = serializer.save()
             object_.email_owner(self.request.user)
 
 
-class DomainViewSet(OwnerViewSet):
+class DomainViewSet(ConditionalMixin, OwnerViewSet):
 
     queryset = Domain.objects.all()
     serializer_class = DomainSerializer
     filter_fields = ('name', 'type')
-
-
-class RecordViewSet(OwnerViewSet):
+    filter_backends = FiltersMixin.filter_backends + (
+        DomainCanEditFilterBackend,
+    )
+    # PowerDNS updates the notified serials and the checks in the database,
+    # which doesn't touch ``modified``. Sums change with any of them.
+    list_etag_aggregates = dict(
+        ConditionalMixin.list_etag_aggregates,
+        notified_serial=Sum('notified_serial'),
+        last_check=Sum('last_check'),
+    )
+
+    def get_etag_parts(self, obj):
+        return super().get_etag_parts(obj) + [
+            soa_serial(obj), obj.notified_serial, obj.last_check,
+        ]
+
+    @detail_route(methods=['get'])
+    def children(self, request, pk=None):
+        """Domains directly below this one in the hierarchy of domains, e.g.
+        to audit the delegations of a zone"""
+        queryset = self.filter_queryset(
+            Domain.objects.filter(parent=self.get_object())
+        )
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            serializer = self.get_serializer(page, many=True)
+            return self.get_paginated_response(serializer.data)
+        return Response(self.get_serializer(queryset, many=True).data)
+
+    @detail_route(methods=['get'], renderer_classes=[ZoneFileRenderer])
+    def zone(self, request, pk=None):
+        """The records of the domain as an RFC 1035 zone file. The response
+        has an ETag that changes with the serial of the zone."""
+        domain = self.get_object()
+        etag = zone_etag(domain)
+        if etag_matches(request, etag):
+            return Response(
+                status=status.HTTP_304_NOT_MODIFIED,
+                headers={'ETag': quote_etag(etag)},
+            )
+        response = StreamingHttpResponse(
+            render_zone(domain),
+            content_type='text/dns; charset=utf-8',
+        )
+        response['ETag'] = quote_etag(etag)
+        return response
+
+    @list_route(methods=['post'], url_path='import-zone')
+    def import_zone(self, request):
+        """Import an RFC 1035 zone file (``zone``, either uploaded or as
+        text) into domain ``origin``, creating it if necessary. With
+        ``dry_run`` set the differences are returned and nothing is saved."""
+        origin = request.data.get('origin', '').rstrip('.').lower()
+        zone = request.data.get('zone')
+        if not origin or zone is None:
+            return Response(
+                {'detail': 'Both origin and zone are required'},
+                status.HTTP_400_BAD_REQUEST,
+            )
+        if isinstance(zone, str):
+            zone = zone.splitlines()
+        dry_run = request.data.get('dry_run') in ('1', 'true', True)
+        try:
+            auto_ptr = AutoPtrOptions.from_id(
+                int(request.data.get('auto_ptr', AutoPtrOptions.NEVER.id))
+            )
+        except ValueError:
+            return Response(
+                {'auto_ptr': ['Invalid auto_ptr option']},
+                status.HTTP_400_BAD_REQUEST,
+            )
+        try:
+            domain = Domain.objects.get(name=origin)
+        except Domain.DoesNotExist:
+            domain = Domain(name=origin, owner=request.user)
+            try:
+                domain.full_clean()
+            except ValidationError as e:
+                return Response(e.message_dict, status.HTTP_400_BAD_REQUEST)
+        else:
+            if not request.user.has_perm('powerdns.change_domain', domain):
+                raise PermissionDenied()
+        diff = []
+        result = import_zone(
+            zone,
+            domain,
+            owner=request.user,
+            dry_run=dry_run,
+            auto_ptr=auto_ptr,
+            report=(
+                (lambda change, record: diff.append(
+                    '{} {}'.format(change, record)
+                )) if dry_run else None
+            ),
+        )
+        data = result.as_dict()
+        if dry_run:
+            data['diff'] = diff
+        if result.errors:
+            return Response(data, status.HTTP_400_BAD_REQUEST)
+        return Response(data)
+
+
+class RecordViewSet(ConditionalMixin, ValuesMixin, OwnerViewSet):
 
     queryset = Record.objects.all()
     serializer_class = RecordSerializer
-    filter_fields = ('name', 'type', 'content', 'domain')
-    search_fields = filter_fields
+    filter_class = RecordFilter
+    pagination_class = RecordPagination
+    search_fields = ('name', 'type', 'content', 'domain')
+    export_chunk_size = BATCH_SIZE
+    # SOA serials are bumped with UPDATEs, which don't touch ``modified``.
+    # A sum changes with any of them.
+    list_etag_aggregates = dict(
+        ConditionalMixin.list_etag_aggregates,
+        change_date=Sum('change_date'),
+    )
+
+    def get_etag_parts(self, obj):
+        return super().get_etag_parts(obj) + [obj.change_date]
+
+    def check_permissions(self, request):
+        if self.action != 'bulk_destroy':
+            return super().check_permissions(request)
+        # Deleting is only allowed for given objects. The records deleted
+        # in bulk are checked by ``get_bulk_queryset``.
+        if not (
+            request.user.is_authenticated() and
+            request.user.has_perm('powerdns.change_record')
+        ):
+            self.permission_denied(request)
+
+    def get_bulk_queryset(self):
+        """The records matching the filters of ``PATCH`` or ``DELETE`` of
+        the list. Some filters are required and the user has to be able to
+        edit all the records."""
+        filters = self.filter_class.base_filters
+        if not any(
+            value for name, value in self.request.query_params.items()
+            if name in filters
+        ):
+            raise FiltersRequired()
+        queryset = self.filter_queryset(self.get_queryset())
+        forbidden = queryset.exclude(
+            editable_by(self.request.user, Record)
+        ).count()
+        if forbidden:
+            raise PermissionDenied(
+                'You can not edit {} of the records.'.format(forbidden)
+            )
+        return queryset
+
+    def bulk_response(self, queryset, operation):
+        """``{"count": n}`` of the records changed by ``operation``, or of
+        the ones that would be with ``?dry_run=true``"""
+        if is_true(self.request.query_params.get('dry_run')):
+            count = queryset.count()
+        else:
+            count = operation(queryset)
+        return Response({'count': count})
+
+    def bulk_update(self, request, *args, **kwargs):
+        """Set the fields given on all the records matching the filters
+        with a single ``UPDATE``"""
+        serializer = RecordUpdateSerializer(data=request.data, partial=True)
+        serializer.is_valid(raise_exception=True)
+        return self.bulk_response(
+            self.get_bulk_queryset(),
+            lambda queryset: update_records(
+                queryset, **serializer.validated_data
+            ),
+        )
+
+    def bulk_destroy(self, request, *args, **kwargs):
+        """Delete all the records matching the filters (with their PTRs)"""
+        return self.bulk_response(self.get_bulk_queryset(), delete_records)
+
+    @list_route(methods=['get'], renderer_classes=[NDJSONRenderer])
+    def export(self, request, format=None):
+        """All the records matching the filters as newline delimited JSON
+        (``/api/records/export.ndjson``), one record per line. The records
+        are read in chunks of ``export_chunk_size`` while the response is
+        streamed, so the memory used doesn't depend on their number.
+        Accepts ``?fields=`` like the lists."""
+        values_serializer = self.get_values_serializer()
+        # The chunks are read in the order of ids
+        columns = set(values_serializer.columns) | {'id'}
+        rows = iterate_chunked(
+            self.filter_queryset(self.get_queryset()).values(*columns),
+            self.export_chunk_size,
+        )
+        encoder = JSONEncoder(ensure_ascii=False, separators=(',', ':'))
+        return StreamingHttpResponse(
+            (
+                encoder.encode(values_serializer.to_representation(row)) +
+                '\n'
+                for row in rows
+            ),
+            content_type='application/x-ndjson; charset=utf-8',
+        )
+
+    @list_route(methods=['post'])
+    def bulk(self, request):
+        """Create many records at once. Accepts a list of records. Either all
+        of them are created, or a list of errors for every item is
+        returned."""
+        serializer = BulkRecordSerializer(
+            data=request.data,
+            many=True,
+            context=self.get_serializer_context(),
+        )
+        if not serializer.is_valid():
+            return Response(serializer.errors, status.HTTP_400_BAD_REQUEST)
+        records = [Record(**item) for item in serializer.validated_data]
+        errors = validate_records(records)
+        if any(errors):
+            for item_errors in errors:
+                if NON_FIELD_ERRORS in item_errors:
+                    item_errors[api_settings.NON_FIELD_ERRORS_KEY] = (
+                        item_errors.pop(NON_FIELD_ERRORS)
+                    )
+            return Response(errors, status.HTTP_400_BAD_REQUEST)
+        to_notify = [record for record in records if record.owner is not None]
+        for record in records:
+            if record.owner is None:
+                record.owner = request.user
+        with transaction.atomic():
+            create_records(records)
+            notify_owners(to_notify, request.user)
+        return Response(
+            self.get_serializer(records, many=True).data,
+            status.HTTP_201_CREATED,
+        )
 
 
 class CryptoKeyViewSet(FiltersMixin, ModelViewSet):
 
-    queryset = CryptoKey.objects.all()
+    # The domain is the name of the object rendered in its URL
+    queryset = CryptoKey.objects.select_related('domain')
     serializer_class = CryptoKeySerializer
     filter_fields = ('domain',)
 
 
 class DomainMetadataViewSet(FiltersMixin, ModelViewSet):
 
-    queryset = DomainMetadata.objects.all()
+    # The domain is the name of the object rendered in its URL
+    queryset = DomainMetadata.objects.select_related('domain')
     serializer_class = DomainMetadataSerializer
     filter_fields = ('domain',)
 
 
-class SuperMasterViewSet(FiltersMixin, ModelViewSet):
+class SuperMasterViewSet(CachedResponseMixin, FiltersMixin, ModelViewSet):
+
+    response_cache = supermaster_responses
 
     queryset = SuperMaster.objects.all()
     serializer_class = SuperMasterSerializer
     filter_fields = ('ip', 'nameserver')
 
 
-class DomainTemplateViewSet(FiltersMixin, ModelViewSet):
+class DomainTemplateViewSet(CachedResponseMixin, FiltersMixin, ModelViewSet):
+
+    response_cache = template_responses
 
     queryset = DomainTemplate.objects.all()
     serializer_class = DomainTemplateSerializer
     filter_fields = ('name',)
 
 
-class RecordTemplateViewSet(FiltersMixin, ModelViewSet):
+class RecordTemplateViewSet(CachedResponseMixin, FiltersMixin, ModelViewSet):
+
+    response_cache = template_responses
 
     queryset = RecordTemplate.objects.all()
     serializer_class = RecordTemplateSerializer
@@ -0,0 +1,421 @@
+"""Reading and writing RFC 1035 master (zone) files.
+
+The parser works on an iterable of lines and yields records one by one and
+the zones are rendered line by line, so zones of any size can be processed in
+constant memory.
+"""
+
+import re
+from collections import namedtuple
+from itertools import chain
+
+from django.db import transaction
+from django.db.models import Count, Max
+
+from powerdns.bulk import create_ptrs, insert_records, validate_records
+from powerdns.models.powerdns import RECORD_TYPES, Record
+from powerdns.serials import bump_serials
+from powerdns.utils import (
+    BATCH_SIZE,
+    AutoPtrOptions,
+    chunks,
+    iterate_chunked,
+)
+
+
+# Stop processing after this many errors
+MAX_ERRORS = 100
+
+CLASSES = ('IN', 'CH', 'HS', 'CS')
+
+TTL_UNITS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400, 'w': 604800}
+
+TTL_RE = re.compile(r'^([0-9]+[smhdw]?)+$', re.IGNORECASE)
+
+
+ZoneRecord = namedtuple(
+    'ZoneRecord', ['lineno', 'name', 'ttl', 'type', 'content', 'prio']
+)
+
+
+class ZoneFileError(ValueError):
+    """Syntax error in a zone file"""
+
+    def __init__(self, lineno, message):
+        self.lineno = lineno
+        self.message = message
+        super().__init__('Line {}: {}'.format(lineno, message))
+
+
+def parse_ttl(token):
+    """Parse a TTL, possibly with units (e.g. ``1h30m``). Returns None if
+    the token is not a TTL."""
+    if not TTL_RE.match(token):
+        return None
+    if token.isdigit():
+        return int(token)
+    return sum(
+        int(value) * TTL_UNITS[unit.lower()]
+        for (value, unit) in re.findall(r'([0-9]+)([smhdw])', token, re.I)
+    )
+
+
+def tokenize(lines):
+    """Split lines into logical entries. Yields (lineno, tokens,
+    inherits_owner) tuples. Comments are dropped, entries in parentheses are
+    joined and quoted strings are kept as single tokens (with quotes)."""
+    tokens = []
+    depth = 0
+    start = None
+    inherits_owner = False
+    for lineno, line in enumerate(lines, 1):
+        if isinstance(line, bytes):
+            line = line.decode('utf-8')
+        if depth == 0:
+            start = lineno
+            inherits_owner = line[:1] in (' ', '\t')
+        token = ''
+        quoted = False
+        escaped = False
+        for char in line.rstrip('\r\n'):
+            if quoted:
+                token += char
+                if escaped:
+                    escaped = False
+                elif char == '\\':
+                    escaped = True
+                elif char == '"':
+                    quoted = False
+            elif char == '"':
+                token += char
+                quoted = True
+            elif char == ';':
+                break
+            elif char in ' \t()':
+                if token:
+                    tokens.append(token)
+                    token = ''
+                if char == '(':
+                    depth += 1
+                elif char == ')':
+                    depth -= 1
+                    if depth < 0:
+                        raise ZoneFileError(lineno, 'Unbalanced parentheses')
+            else:
+                token += char
+        if quoted:
+            raise ZoneFileError(lineno, 'Unterminated quoted string')
+        if token:
+            tokens.append(token)
+        if depth == 0 and tokens:
+            yield start, tokens, inherits_owner
+            tokens = []
+    if depth:
+        raise ZoneFileError(start, 'Unbalanced parentheses')
+
+
+def absolute_name(name, origin):
+    """Make a domain name absolute, in PowerDNS format (without trailing
+    dot)"""
+    if name == '@':
+        return origin
+    if name.endswith('.'):
+        return name[:-1].lower()
+    if not origin:
+        return name.lower()
+    return '{}.{}'.format(name, origin).lower()
+
+
+def convert_rdata(type_, rdata, origin):
+    """Convert RDATA tokens into PowerDNS (prio, content)"""
+    if type_ in ('CNAME', 'NS', 'PTR'):
+        return None, absolute_name(rdata[0], origin)
+    if type_ == 'MX':
+        return int(rdata[0]), absolute_name(rdata[1], origin)
+    if type_ == 'SRV':
+        priority, weight, port, target = rdata
+        return int(priority), ' '.join(
+            [weight, port, absolute_name(target, origin)]
+        )
+    if type_ == 'SOA':
+        mname, rname, *times = rdata
+        if len(times) != 5:
+            raise ValueError('SOA needs 7 fields')
+        times = [parse_ttl(time) for time in times]
+        if None in times:
+            raise ValueError('Invalid SOA serial or timer')
+        return None, ' '.join(
+            [absolute_name(mname, origin), absolute_name(rname, origin)] +
+            [str(time) for time in times]
+        )
+    return None, ' '.join(rdata)
+
+
+def parse_zone(lines, origin, default_ttl=3600):
+    """Parse zone file lines yielding ZoneRecord tuples"""
+    origin = origin.rstrip('.').lower()
+    ttl = default_ttl
+    owner = None
+    for lineno, tokens, inherits_owner in tokenize(lines):
+        if tokens[0].startswith('$'):
+            directive = tokens[0].upper()
+            if directive == '$ORIGIN' and len(tokens) == 2:
+                origin = absolute_name(tokens[1], origin)
+            elif directive == '$TTL' and len(tokens) == 2:
+                ttl = parse_ttl(tokens[1])
+                if ttl is None:
+                    raise ZoneFileError(lineno, 'Invalid TTL')
+            else:
+                raise ZoneFileError(
+                    lineno, 'Unsupported directive {}'.format(tokens[0])
+                )
+            continue
+        if not inherits_owner:
+            owner = absolute_name(tokens.pop(0), origin)
+        if owner is None:
+            raise ZoneFileError(lineno, 'No owner name')
+        record_ttl = None
+        while tokens:
+            if tokens[0].upper() in CLASSES:
+                tokens.pop(0)
+            elif record_ttl is None and parse_ttl(tokens[0]) is not None:
+                record_ttl = parse_ttl(tokens.pop(0))
+            else:
+                break
+        if record_ttl is not None:
+            # RFC 1035: the TTL defaults to the last explicitly stated one
+            ttl = record_ttl
+        if not tokens:
+            raise ZoneFileError(lineno, 'No record type')
+        type_ = tokens.pop(0).upper()
+        if type_ not in RECORD_TYPES:
+            raise ZoneFileError(
+                lineno, 'Unsupported record type {}'.format(type_)
+            )
+        try:
+            prio, content = convert_rdata(type_, tokens, origin)
+        except (ValueError, TypeError, IndexError):
+            raise ZoneFileError(
+                lineno, 'Invalid data for {} record'.format(type_)
+            )
+        yield ZoneRecord(lineno, owner, ttl, type_, content, prio)
+
+
+class ImportResult(object):
+    """Summary of a zone import"""
+
+    def __init__(self):
+        self.added = 0
+        self.changed = 0
+        self.unchanged = 0
+        self.only_in_database = 0
+        self.errors = []
+
+    def add_error(self, lineno, message):
+        self.errors.append((lineno, message))
+
+    def as_dict(self):
+        return {
+            'added': self.added,
+            'changed': self.changed,
+            'unchanged': self.unchanged,
+            'only_in_database': self.only_in_database,
+            'errors': [
+                {'line': lineno, 'message': message}
+                for (lineno, message) in self.errors
+            ],
+        }
+
+
+def _import_batch(batch, domain, owner, auto_ptr, result, report, matched):
+    """Import a list of ZoneRecords into the domain"""
+    existing = {}
+    names = {zone_record.name for zone_record in batch}
+    for names_chunk in chunks(sorted(names)):
+        for record in Record.objects.filter(
+            domain=domain, name__in=names_chunk,
+        ):
+            # A zone has a single SOA, so it is matched regardless of content
+            key = (record.name, record.type) + (
+                () if record.type == 'SOA' else (record.content,)
+            )
+            existing[key] = record
+    new = []
+    for zone_record in batch:
+        key = (zone_record.name, zone_record.type) + (
+            () if zone_record.type == 'SOA' else (zone_record.content,)
+        )
+        record = existing.get(key)
+        if record is None:
+            new.append((zone_record, Record(
+                domain=domain,
+                name=zone_record.name,
+                type=zone_record.type,
+                content=zone_record.content,
+                ttl=zone_record.ttl,
+                prio=zone_record.prio,
+                owner=owner,
+                auto_ptr=auto_ptr,
+            )))
+            continue
+        if matched is not None:
+            matched.add(record.pk)
+        if (record.content, record.ttl, record.prio) == (
+            zone_record.content, zone_record.ttl, zone_record.prio
+        ):
+            result.unchanged += 1
+            continue
+        result.changed += 1
+        record.content = zone_record.content
+        record.ttl = zone_record.ttl
+        record.prio = zone_record.prio
+        record.save()
+        if report:
+            report('~', record)
+    errors = validate_records([record for (_, record) in new])
+    for (zone_record, record), record_errors in zip(new, errors):
+        for messages in record_errors.values():
+            for message in messages:
+                result.add_error(zone_record.lineno, message)
+    if result.errors:
+        return
+    records = [record for (_, record) in new]
+    insert_records(records)
+    create_ptrs(records, created=True)
+    result.added += len(records)
+    if report:
+        for record in records:
+            report('+', record)
+
+
+def import_zone(
+    lines, domain, owner=None, dry_run=False, auto_ptr=AutoPtrOptions.NEVER,
+    report=None, batch_size=BATCH_SIZE,
+):
+    """Import records from a zone file into a domain (saved if new).
+
+    Records are inserted in batches of ``batch_size``. Records already
+    present in the domain are left untouched (or updated if their TTL or
+    priority differ). The import is atomic: if any errors are found, nothing
+    is saved. In ``dry_run`` mode nothing is saved either.
+
+    ``report`` is an optional callable receiving a change (``'+'``, ``'~'``
+    or ``'-'``) and a record for every difference between the file and the
+    database. Reporting records that are only in the database requires
+    remembering the ids of the matched records.
+    """
+    result = ImportResult()
+    matched = set() if report else None
+    with transaction.atomic():
+        if domain.pk is None:
+            domain.owner = domain.owner or owner
+            domain.save()
+        existing_count = domain.record_set.count()
+        batch = []
+        try:
+            for zone_record in parse_zone(lines, domain.name):
+                if not (
+                    zone_record.name == domain.name or
+                    zone_record.name.endswith('.' + domain.name)
+                ):
+                    result.add_error(
+                        zone_record.lineno,
+                        '{} is outside of zone {}'.format(
+                            zone_record.name, domain.name
+                        )
+                    )
+                else:
+                    batch.append(zone_record)
+                if len(batch) >= batch_size:
+                    _import_batch(
+                        batch, domain, owner, auto_ptr, result, report,
+                        matched,
+                    )
+                    batch = []
+                if len(result.errors) >= MAX_ERRORS:
+                    break
+            else:
+                _import_batch(
+                    batch, domain, owner, auto_ptr, result, report, matched,
+                )
+        except ZoneFileError as e:
+            result.add_error(e.lineno, e.message)
+        result.only_in_database = (
+            existing_count - result.changed - result.unchanged
+        )
+        if report and result.only_in_database:
+            for record in domain.record_set.all().iterator():
+                if record.pk not in matched:
+                    report('-', record)
+        if result.errors or dry_run:
+            transaction.set_rollback(True)
+        else:
+            bump_serials([domain.pk])
+    return result
+
+
+ZONE_FIELDS = ('pk', 'name', 'ttl', 'type', 'content', 'prio', 'disabled')
+
+
+def format_content(type_, content, prio):
+    """Convert PowerDNS content (and prio) to zone file RDATA"""
+    if type_ in ('CNAME', 'NS', 'PTR'):
+        return content + '.'
+    if type_ == 'MX':
+        return '{} {}.'.format(prio, content)
+    if type_ == 'SRV':
+        weight, port, target = content.split()
+        return '{} {} {} {}.'.format(prio, weight, port, target)
+    if type_ == 'SOA':
+        mname, rname, *times = content.split()
+        return ' '.join(['{}.'.format(mname), '{}.'.format(rname)] + times)
+    return content
+
+
+def soa_serial(domain):
+    """The serial (SOA change_date) of a domain. It changes every time the
+    zone does."""
+    return domain.record_set.filter(type='SOA').values_list(
+        'change_date', flat=True
+    ).first()
+
+
+def zone_etag(domain):
+    """ETag of the zone file of a domain. Zones without an SOA have no
+    serial, so theirs is made of the number of records and the last time
+    one has been modified."""
+    serial = soa_serial(domain)
+    if serial is not None:
+        return 'zone-{}-{}'.format(domain.pk, serial)
+    state = domain.record_set.aggregate(
+        count=Count('pk'), modified=Max('modified'),
+    )
+    return 'zone-{}-nosoa-{}-{}'.format(
+        domain.pk,
+        state['count'],
+        '{:%Y%m%d%H%M%S%f}'.format(state['modified'])
+        if state['modified'] else '',
+    )
+
+
+def render_zone(domain):
+    """Yield the lines of the zone file of a domain (SOA first). Disabled
+    records are commented out."""
+    yield '$ORIGIN {}.\n'.format(domain.name)
+    records = domain.record_set.values_list(*ZONE_FIELDS)
+    for _, name, ttl, type_, content, prio, disabled in chain(
+        records.filter(type='SOA'),
+        iterate_chunked(records.exclude(type='SOA'), BATCH_SIZE),
+    ):
+        try:
+            rdata = format_content(type_, content, prio)
+        except (ValueError, AttributeError):
+            # Malformed content is output as is
+            rdata = content
+        yield '{}{}.\t{}\tIN\t{}\t{}\n'.format(
+            '; ' if disabled else '',
+            name,
+            '' if ttl is None else ttl,
+            type_,
+            rdata,
+        )